@@ -1,6 +1,8 @@
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .utils.message_queue import init_message_queue
+from .utils.whatsapp_utils import process_whatsapp_message
 
 
 def create_app():
@@ -13,4 +15,7 @@ def create_app():
     # Import and register blueprints, if any
     app.register_blueprint(webhook_blueprint)
 
+    # Start the background worker pool when webhooks are processed from a queue
+    init_message_queue(app, process_whatsapp_message)
+
     return app
@@ -14,6 +14,27 @@ def load_configurations(app):
     app.config["VERSION"] = os.getenv("VERSION")
     app.config["PHONE_NUMBER_ID"] = os.getenv("PHONE_NUMBER_ID")
     app.config["VERIFY_TOKEN"] = os.getenv("VERIFY_TOKEN")
+    # Overridable so the benchmarks can point the app at a local stand-in server
+    app.config["GRAPH_API_BASE_URL"] = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com")
+
+    # Webhook processing: "sync" handles messages inside the request, "queue" acks
+    # immediately and hands the message to a background worker pool
+    app.config["WEBHOOK_MODE"] = os.getenv("WEBHOOK_MODE", "sync")
+    app.config["QUEUE_BACKEND"] = os.getenv("QUEUE_BACKEND", "memory")
+    app.config["QUEUE_MAX_SIZE"] = int(os.getenv("QUEUE_MAX_SIZE", "100"))
+    app.config["QUEUE_WORKERS"] = int(os.getenv("QUEUE_WORKERS", "4"))
+    app.config["QUEUE_DB_PATH"] = os.getenv("QUEUE_DB_PATH", "message_queue.sqlite3")
+
+    # Messages from one user that arrive while their previous reply is running are always
+    # answered together by one run. A debounce window (opt-in, it holds a worker for that long
+    # on every message) also waits for follow-ups before the first run, up to the max.
+    app.config["MESSAGE_DEBOUNCE_SECONDS"] = float(os.getenv("MESSAGE_DEBOUNCE_SECONDS", "0"))
+    app.config["MESSAGE_DEBOUNCE_MAX_SECONDS"] = float(os.getenv("MESSAGE_DEBOUNCE_MAX_SECONDS", "4.0"))
+
+    # Inbound message de-duplication. Set DEDUP_DB_PATH to share seen ids between processes
+    app.config["DEDUP_TTL_SECONDS"] = int(os.getenv("DEDUP_TTL_SECONDS", "3600"))
+    app.config["DEDUP_MAX_ENTRIES"] = int(os.getenv("DEDUP_MAX_ENTRIES", "10000"))
+    app.config["DEDUP_DB_PATH"] = os.getenv("DEDUP_DB_PATH")
 
 
 def configure_logging():
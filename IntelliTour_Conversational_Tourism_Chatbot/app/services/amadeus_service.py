@@ -1,48 +1,211 @@
 from amadeus import Client, ResponseError
+import datetime as dt
+import logging
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+import numpy as np
 from dotenv import load_dotenv
+from app.services.iata_gazetteer import get_gazetteer, get_iata_cache
+from app.utils import metrics
+from app.utils.rate_limiter import RateLimiter
+from app.utils.tool_cache import cached_tool, normalize_text_args
 
 load_dotenv()
 
 AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
 AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
 
+# Point the client at another host (e.g. a local stand-in for benchmarks) with AMADEUS_HOST.
+# The SDK reads these from the environment as strings, so they are parsed here.
+AMADEUS_HOST = os.getenv("AMADEUS_HOST")
+amadeus_options = {}
+if AMADEUS_HOST:
+    amadeus_options = {
+        "host": AMADEUS_HOST,
+        "port": int(os.getenv("AMADEUS_PORT", "443")),
+        "ssl": os.getenv("AMADEUS_SSL", "true").lower() == "true",
+    }
+
 amadeus = Client(
     client_id = AMADEUS_API_KEY,
-    client_secret = AMADEUS_API_SECRET
+    client_secret = AMADEUS_API_SECRET,
+    **amadeus_options
 )
 
-def resolve_city_to_iata(city_code_or_name):
+# A city's hotel list rarely changes; it is kept in the shared tool cache for this long
+HOTEL_LIST_TTL = int(os.getenv("HOTEL_LIST_TTL", str(7 * 24 * 3600)))
+# Hotel ids sent in the single batched hotel-offers request
+HOTEL_OFFER_BATCH_SIZE = int(os.getenv("HOTEL_OFFER_BATCH_SIZE", "10"))
+# Fan-out requests (per-hotel offers, fare calendar dates) in flight at once for this process.
+# Amadeus allows about 10 requests/s on the test environment (40/s in production).
+AMADEUS_MAX_CONCURRENCY = int(os.getenv("AMADEUS_MAX_CONCURRENCY", "4"))
+AMADEUS_MAX_RPS = float(os.getenv("AMADEUS_MAX_RPS", "10"))
+AMADEUS_RATE_LIMIT_RETRIES = int(os.getenv("AMADEUS_RATE_LIMIT_RETRIES", "2"))
+AMADEUS_RATE_LIMIT_BACKOFF = float(os.getenv("AMADEUS_RATE_LIMIT_BACKOFF", "0.5"))
+# The full offer set of a flight search is kept this long for paging and re-sorting
+FLIGHT_SEARCH_TTL = int(os.getenv("FLIGHT_SEARCH_TTL", "600"))
+FLIGHT_PAGE_SIZE = int(os.getenv("FLIGHT_PAGE_SIZE", "5"))
+FLIGHT_SORT_KEYS = ("price", "duration", "stops", "departure")
+FARE_CALENDAR_MAX_DAYS = int(os.getenv("FARE_CALENDAR_MAX_DAYS", "14"))
+_amadeus_executor = ThreadPoolExecutor(max_workers=AMADEUS_MAX_CONCURRENCY, thread_name_prefix="amadeus")
+_rate_limiter = RateLimiter("amadeus", AMADEUS_MAX_RPS)
+
+def call_amadeus(request, **params):
+    """
+    Make an Amadeus request at no more than AMADEUS_MAX_RPS per process, backing off
+    and retrying when it still answers 429 Too Many Requests.
+    """
+    for attempt in range(AMADEUS_RATE_LIMIT_RETRIES + 1):
+        _rate_limiter.acquire()
+        try:
+            return request(**params)
+        except ResponseError as error:
+            status = getattr(error.response, "status_code", None)
+            if status != 429 or attempt == AMADEUS_RATE_LIMIT_RETRIES:
+                raise
+            metrics.incr("amadeus.rate_limited")
+            time.sleep(AMADEUS_RATE_LIMIT_BACKOFF * 2 ** attempt)
+
+def resolve_city_to_iata(city_code_or_name, city_only=False):
     """
-    Resolves a city name to its corresponding IATA code using the Amadeus API.
+    Resolves a city or airport name to its corresponding IATA code.
+    Names listed in the bundled gazetteer are answered without a network call; any other
+    name goes to the Amadeus API, and those answers are kept in a persistent cache.
+    A close local match is only used when the API knows no such city, and only if the
+    name looks like a typo of it.
     If the input is already an IATA code (length == 3), it returns it unchanged.
+    With city_only, airports resolve to their city code (for hotel searches).
     """
     try:
+        gazetteer = get_gazetteer()
+        entry, match_type = gazetteer.lookup(city_code_or_name)
+        # An exact name wins over the 3-letter shortcut ("Goa" is not GOA, Genoa)
+        if entry and match_type == "exact":
+            metrics.incr("iata.local_hit")
+            return entry["city_code"] if city_only else entry["code"]
+
         if len(city_code_or_name) == 3 and city_code_or_name.isalpha():
             return city_code_or_name.upper()
-        
+
+        iata_cache = get_iata_cache()
+        cached = iata_cache.get(city_code_or_name)
+        if cached:
+            metrics.incr("iata.cache_hit")
+            return cached
+
+        metrics.incr("iata.api_lookup")
         response = amadeus.reference_data.locations.get(
             keyword = city_code_or_name,
             subType = 'CITY'
         )
 
         if response.data and "iataCode" in response.data[0]:
+            iata_cache.set(city_code_or_name, response.data[0]["iataCode"])
             return response.data[0]["iataCode"]
-        
-        else:
-            print(f"Could not find IATA code for city '{city_code_or_name}'.")
-            return None
+
+        entry = gazetteer.closest(city_code_or_name)
+        if entry:
+            metrics.incr("iata.typo_hit")
+            return entry["city_code"] if city_only else entry["code"]
+
+        print(f"Could not find IATA code for city '{city_code_or_name}'.")
+        return None
         
     except ResponseError as error:
             print(f"Error resolving city name '{city_code_or_name}': {error}")
             return None
 
     
+def iso_duration_minutes(duration):
+    """Minutes in an ISO 8601 duration such as 'PT2H30M' or 'P1DT1H'."""
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?", duration or "")
+    if not match:
+        return None
+    days, hours, minutes = (int(part or 0) for part in match.groups())
+    return days * 1440 + hours * 60 + minutes
+
+def compact_flight_offer(offer):
+    """
+    The parts of an Amadeus flight offer the assistant uses, with price and duration as
+    numbers for sorting. Segments are [from, to, departs, arrives, carrier, number].
+    """
+    itineraries = []
+    for itinerary in offer['itineraries']:
+        itineraries.append([
+            [segment['departure']['iataCode'], segment['arrival']['iataCode'],
+             segment['departure']['at'], segment['arrival']['at'],
+             segment['carrierCode'], segment['number']]
+            for segment in itinerary['segments']
+        ])
+    durations = [iso_duration_minutes(itinerary.get('duration')) for itinerary in offer['itineraries']]
+    return {
+        "id": offer.get('id'),
+        "price": float(offer['price']['total']),
+        "currency": offer['price']['currency'],
+        "duration_minutes": sum(d for d in durations if d is not None) or None,
+        "stops": max(len(segments) - 1 for segments in itineraries),
+        "itineraries": itineraries,
+    }
+
+def format_flight_offer(offer):
+    """A compact offer in the shape returned to the assistant."""
+    return {
+        "price": f"{offer['price']:.2f}",
+        "currency": offer['currency'],
+        "duration_minutes": offer['duration_minutes'],
+        "stops": offer['stops'],
+        "itinerary": [
+            {
+                "departure": departure,
+                "arrival": arrival,
+                "departure_time": departure_time,
+                "arrival_time": arrival_time,
+                "carrier": carrier,
+                "flight_number": number,
+            }
+            for departure, arrival, departure_time, arrival_time, carrier, number in offer['itineraries'][0]
+        ],
+        "return_itinerary": [
+            {"departure": departure, "arrival": arrival, "departure_time": departure_time,
+             "carrier": carrier, "flight_number": number}
+            for departure, arrival, departure_time, _, carrier, number in offer['itineraries'][1]
+        ] if len(offer['itineraries']) > 1 else None,
+    }
+
+def make_flight_search_id(origin_code, destination_code, departure_date, return_date, adults):
+    return ":".join([origin_code, destination_code, departure_date, return_date or "", str(adults)])
+
+def parse_flight_search_id(search_id):
+    origin_code, destination_code, departure_date, return_date, adults = search_id.split(":")
+    return origin_code, destination_code, departure_date, return_date or None, int(adults)
+
+# Fares move quickly, so a search's offers are only reused for a few minutes
+@cached_tool("get_flight_offers", ttl=FLIGHT_SEARCH_TTL)
+def search_flight_offers(origin_code, destination_code, departure_date, return_date, adults):
+    """
+    Every offer Amadeus returns for a search, in compact form and in Amadeus order.
+    Cached per search, so follow-up pages and re-sorts need no new Amadeus search.
+    """
+    params = {
+        'originLocationCode': origin_code,
+        'destinationLocationCode': destination_code,
+        'departureDate': departure_date,
+        'adults': adults
+    }
+    if return_date:
+        params['returnDate'] = return_date
+
+    response = call_amadeus(amadeus.shopping.flight_offers_search.get, **params)
+    print(f"Amadeus flight offers response received with {len(response.data)} offers.")
+    return [compact_flight_offer(offer) for offer in response.data]
+
 def get_flight_offers(origin,destination,departure_date,return_date,adults):
     """
     Retrieve flight offers between two locations.
     Accepts either city names or IATA airport/city codes.
-    
+    Returns the first page of offers and a search_id for get_more_flight_offers.
     """
     try:
         #Resolve both origin and destination
@@ -51,45 +214,244 @@ def get_flight_offers(origin,destination,departure_date,return_date,adults):
 
         if not origin_code or not destination_code:
             return {"error": "Could not resolve one or both city names to IATA codes."}
-        
-        params = {
-            'originLocationCode': origin_code,
-            'destinationLocationCode': destination_code,
-            'departureDate': departure_date,
-            'adults': adults
+
+        offers = search_flight_offers(origin_code, destination_code, departure_date, return_date, adults or 1)
+        if not offers:
+            return {"error": f"No flight offers found from {origin_code} to {destination_code} on {departure_date}."}
+
+        return {
+            "search_id": make_flight_search_id(origin_code, destination_code, departure_date, return_date, adults or 1),
+            "total_offers": len(offers),
+            "offers": [format_flight_offer(offer) for offer in offers[:FLIGHT_PAGE_SIZE]],
         }
-        
-        if return_date:
-            params['returnDate'] = return_date
-
-        response = amadeus.shopping.flight_offers_search.get(**params)
-        print(f"Amadeus flight offers response received with {len(response.data)} offers.")
-
-        #  process response.data to return a simplified summary
-        offers_summary = []
-        for offer in response.data[:5]:  # limit to top 5 offers to avoid overload
-            summary = {
-                "price": offer['price']['total'],
-                "currency": offer['price']['currency'],
-                "itinerary": []
-            }
-            for segment in offer['itineraries'][0]['segments']:
-                summary["itinerary"].append({
-                    "departure": segment['departure']['iataCode'],
-                    "arrival": segment['arrival']['iataCode'],
-                    "departure_time": segment['departure']['at'],
-                    "arrival_time": segment['arrival']['at'],
-                    "carrier": segment['carrierCode'],
-                    "flight_number": segment['number']
-                })
-            offers_summary.append(summary)
 
-        return offers_summary
+    except ResponseError as error:
+        print(f"Amadeus API error: {error}")
+        return {"error": str(error)}
+
+def get_more_flight_offers(search_id, page=1, sort_by="price", max_stops=None, page_size=FLIGHT_PAGE_SIZE):
+    """
+    A page of the offers from an earlier get_flight_offers search, optionally re-sorted by
+    price, duration, stops or departure time and filtered by number of stops.
+    Served from the cached offer set; the search is only repeated once it has expired.
+    """
+    try:
+        params = parse_flight_search_id(search_id)
+    except (AttributeError, ValueError):
+        return {"error": f"Unknown search_id '{search_id}'. Search with get_flight_offers first."}
+    if sort_by not in FLIGHT_SORT_KEYS:
+        return {"error": f"sort_by must be one of {', '.join(FLIGHT_SORT_KEYS)}."}
 
+    try:
+        offers = search_flight_offers(*params)
     except ResponseError as error:
         print(f"Amadeus API error: {error}")
         return {"error": str(error)}
-    
+
+    if max_stops is not None:
+        offers = [offer for offer in offers if offer['stops'] <= max_stops]
+    sort_keys = {
+        "price": lambda offer: offer['price'],
+        "duration": lambda offer: (offer['duration_minutes'] is None, offer['duration_minutes'] or 0, offer['price']),
+        "stops": lambda offer: (offer['stops'], offer['price']),
+        "departure": lambda offer: offer['itineraries'][0][0][2],
+    }
+    offers = sorted(offers, key=sort_keys[sort_by])
+
+    page_size = max(1, min(page_size, 20))
+    total_pages = max(1, -(-len(offers) // page_size))
+    page = max(1, min(page, total_pages))
+    start = (page - 1) * page_size
+    return {
+        "search_id": search_id,
+        "sort_by": sort_by,
+        "page": page,
+        "total_pages": total_pages,
+        "total_offers": len(offers),
+        "offers": [format_flight_offer(offer) for offer in offers[start:start + page_size]],
+    }
+
+def get_fare_calendar(origin, destination, start_date, days=7, trip_length_days=None, adults=1, deadline=None):
+    """
+    Cheapest and fastest flights for each departure date in a range, from one tool call.
+    The per-date searches run concurrently on the Amadeus pool and go through the flight
+    search cache, so dates searched before (here or with get_flight_offers) are free.
+    Dates not searched by the deadline are left out of the ranking and the searches
+    still queued for them are cancelled.
+    """
+    origin_code = resolve_city_to_iata(origin)
+    destination_code = resolve_city_to_iata(destination)
+    if not origin_code or not destination_code:
+        return {"error": "Could not resolve one or both city names to IATA codes."}
+    try:
+        first_date = dt.date.fromisoformat(start_date)
+    except (TypeError, ValueError):
+        return {"error": "start_date must be in YYYY-MM-DD format."}
+    try:
+        trip_length_days = int(trip_length_days) if trip_length_days else None
+    except (TypeError, ValueError):
+        return {"error": "trip_length_days must be a whole number of days."}
+
+    days = max(1, min(int(days or 7), FARE_CALENDAR_MAX_DAYS))
+    adults = adults or 1
+    searches = []
+    for offset in range(days):
+        departure = first_date + dt.timedelta(days=offset)
+        return_date = (departure + dt.timedelta(days=trip_length_days)).isoformat() if trip_length_days else None
+        searches.append((origin_code, destination_code, departure.isoformat(), return_date, adults))
+
+    def search(params):
+        try:
+            return search_flight_offers(*params)
+        except ResponseError as error:
+            metrics.incr("fare_calendar.search_failed")
+            logging.warning(f"Fare calendar search for {params[2]} failed: {error}")
+            return {"error": str(error)}
+
+    futures = {_amadeus_executor.submit(search, params): index for index, params in enumerate(searches)}
+    results = [{"error": "Not searched in time"}] * days
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining() if deadline is not None else None):
+            results[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        pending = [future for future in futures if not future.done()]
+        cancelled = sum(future.cancel() for future in pending)
+        metrics.incr("fare_calendar.partial")
+        logging.warning(f"Fare calendar deadline reached with {len(pending)} of {days} dates pending ({cancelled} cancelled)")
+
+    # One row per offer across all dates, ranked with array operations
+    date_index, prices, durations, offers = [], [], [], []
+    for index, result in enumerate(results):
+        if isinstance(result, list):
+            for offer in result:
+                date_index.append(index)
+                prices.append(offer['price'])
+                durations.append(offer['duration_minutes'] if offer['duration_minutes'] is not None else np.nan)
+                offers.append(offer)
+    if not offers:
+        return {"error": f"No flight offers found from {origin_code} to {destination_code} between "
+                         f"{searches[0][2]} and {searches[-1][2]}."}
+
+    date_index = np.asarray(date_index)
+    prices = np.asarray(prices, dtype=float)
+    durations = np.asarray(durations, dtype=float)
+    known_durations = np.where(np.isnan(durations), np.inf, durations)
+
+    cheapest_per_date = np.full(days, np.inf)
+    np.minimum.at(cheapest_per_date, date_index, prices)
+    fastest_per_date = np.full(days, np.inf)
+    np.minimum.at(fastest_per_date, date_index, known_durations)
+    offers_per_date = np.bincount(date_index, minlength=days)
+    # Cheapest offer per date: lowest price, ties broken by duration
+    order = np.lexsort((known_durations, prices, date_index))
+    first_of_date = order[np.r_[True, date_index[order][1:] != date_index[order][:-1]]]
+
+    # Best value: price and duration relative to the best of each, weighted equally.
+    # The floor keeps a 0.00 fare or a 0-minute duration from dividing by zero.
+    fastest = known_durations.min()
+    value = prices / np.maximum(prices.min(), 1e-9) + (
+        known_durations / np.maximum(fastest, 1e-9) if np.isfinite(fastest) else 0
+    )
+
+    def pick(row):
+        offer = format_flight_offer(offers[row])
+        offer["departure_date"] = searches[date_index[row]][2]
+        offer["search_id"] = make_flight_search_id(*searches[date_index[row]])
+        return offer
+
+    calendar = []
+    for index, params in enumerate(searches):
+        entry = {"date": params[2], "search_id": make_flight_search_id(*params)}
+        if offers_per_date[index]:
+            row = first_of_date[np.searchsorted(date_index[first_of_date], index)]
+            entry.update({
+                "cheapest_price": f"{cheapest_per_date[index]:.2f}",
+                "stops": offers[row]['stops'],
+                "duration_minutes": offers[row]['duration_minutes'],
+                "fastest_minutes": int(fastest_per_date[index]) if np.isfinite(fastest_per_date[index]) else None,
+                "offers": int(offers_per_date[index]),
+            })
+        else:
+            entry["error"] = results[index]["error"] if isinstance(results[index], dict) else "No offers"
+        calendar.append(entry)
+
+    return {
+        "origin": origin_code,
+        "destination": destination_code,
+        "currency": offers[0]['currency'],
+        "trip_length_days": trip_length_days,
+        "calendar": calendar,
+        # Ties go to the faster (or the cheaper) offer
+        "cheapest": pick(int(np.lexsort((known_durations, prices))[0])),
+        "fastest": pick(int(np.lexsort((prices, known_durations))[0])),
+        "best_value": pick(int(np.argmin(value))),
+    }
+
+@cached_tool("hotel_list", ttl=HOTEL_LIST_TTL)
+def get_city_hotel_list(city_code):
+    """
+    The hotels Amadeus lists for an IATA city code, in reference-data order.
+    Cached on disk per city code, so hotel searches skip the by-city call.
+    """
+    response = call_amadeus(amadeus.reference_data.locations.hotels.by_city.get, cityCode=city_code)
+    return [
+        {
+            "hotel_id": hotel.get('hotelId'),
+            "name": hotel.get('name', 'N/A'),
+            "address": hotel.get('address', {}).get('lines', ['N/A'])[0] if hotel.get('address', {}).get('lines') else 'N/A',
+            "contact": hotel.get('contact', {}).get('phone', 'N/A'),
+        }
+        for hotel in response.data or []
+    ]
+
+def summarize_hotel_offer(offer_data, check_in_date, check_out_date):
+    """The first offer of a hotel-offers result as a flat summary, or None if it has no offers."""
+    hotel_info = offer_data.get('hotel', {})
+    offers = offer_data.get('offers', [])
+    if not offers:
+        return None
+    price_info = offers[0].get('price', {})
+    return {
+        "name": hotel_info.get('name', 'N/A'),
+        "hotel_id": hotel_info.get('hotelId', 'N/A'),
+        "rating": hotel_info.get('rating', 'N/A'),
+        "address": hotel_info.get('address', {}).get('lines', ['N/A'])[0] if hotel_info.get('address', {}).get('lines') else 'N/A',
+        "price": price_info.get('total', 'N/A'),
+        "currency": price_info.get('currency', 'N/A'),
+        "check_in_date": check_in_date,
+        "check_out_date": check_out_date,
+        "contact": hotel_info.get('contact', {}).get('phone', 'N/A'),
+    }
+
+def search_hotel_offers(hotel_ids, check_in_date, check_out_date, adults):
+    """
+    Offers for the given hotels. Tries one request for all of them first; if Amadeus rejects
+    the batch, asks for each hotel separately on the bounded Amadeus pool, in parallel.
+    """
+    params = {"checkInDate": check_in_date, "checkOutDate": check_out_date, "adults": adults}
+    try:
+        metrics.incr("amadeus.hotel_offers.batched")
+        response = call_amadeus(
+            amadeus.shopping.hotel_offers_search.get,
+            hotelIds=",".join(hotel_ids[:HOTEL_OFFER_BATCH_SIZE]),
+            **params,
+        )
+        return response.data or []
+    except ResponseError as batch_error:
+        print(f"Batched hotel offer search failed, trying individual hotels: {batch_error}")
+
+    def search_one(hotel_id):
+        try:
+            return call_amadeus(amadeus.shopping.hotel_offers_search.get, hotelIds=hotel_id, **params).data or []
+        except ResponseError:
+            # Skip hotels that don't have offers for the given dates
+            return []
+
+    metrics.incr("amadeus.hotel_offers.per_hotel")
+    results = _amadeus_executor.map(search_one, hotel_ids[:5])  # Limit to 5 hotels to avoid too many API calls
+    return [offer_data for offers in results for offer_data in offers]
+
+@cached_tool("get_hotels", ttl=30 * 60, normalize=normalize_text_args)
 def get_hotels(city_code_or_name, adults=1, check_in_date=None, check_out_date=None):
     """
     Retrieve a list of hotels in a given city.
@@ -98,112 +460,36 @@ def get_hotels(city_code_or_name, adults=1, check_in_date=None, check_out_date=N
     """
     try:
         # Resolve the city name to its corresponding IATA Code
-        city_code = resolve_city_to_iata(city_code_or_name)
+        city_code = resolve_city_to_iata(city_code_or_name, city_only=True)
         if not city_code:
             return {"error": f"Could not find the IATA code for the city '{city_code_or_name}'."}
 
-        # First, get hotel IDs in the city using the reference data API
+        # First, get hotel IDs in the city from the (cached) reference data
         try:
-            hotels_response = amadeus.reference_data.locations.hotels.by_city.get(
-                cityCode=city_code.upper()
-            )
-            
-            if not hotels_response.data or len(hotels_response.data) == 0:
-                return {"error": f"No hotels found in the reference data for city '{city_code_or_name}' ({city_code})."}
-            
-            # Get hotel IDs (limit to first 10 for performance)
-            hotel_ids = [hotel['hotelId'] for hotel in hotels_response.data[:10]]
-            
+            hotels = get_city_hotel_list(city_code.upper())
         except ResponseError as ref_error:
             print(f"Error getting hotel reference data: {ref_error}")
             return {"error": f"Could not retrieve hotel reference data: {str(ref_error)}"}
 
-        # Now search for hotel offers using the hotel IDs
+        if not hotels:
+            return {"error": f"No hotels found in the reference data for city '{city_code_or_name}' ({city_code})."}
+
         hotels_summary = []
-        
+
         # If check-in/check-out dates are provided, use hotel offers search
         if check_in_date and check_out_date:
-            try:
-                # Try using hotel offers search API with city code
-                # This is more efficient than searching individual hotels
-                try:
-                    # Method 1: Try hotel_offers_search with cityCode
-                    offers_response = amadeus.shopping.hotel_offers_search.get(
-                        cityCode=city_code,
-                        checkInDate=check_in_date,
-                        checkOutDate=check_out_date,
-                        adults=adults
-                    )
-                    
-                    if offers_response.data:
-                        for offer_data in offers_response.data[:5]:  # Limit to 5 results
-                            hotel_info = offer_data.get('hotel', {})
-                            offers = offer_data.get('offers', [])
-                            
-                            if offers:
-                                first_offer = offers[0]
-                                price_info = first_offer.get('price', {})
-                                
-                                hotels_summary.append({
-                                    "name": hotel_info.get('name', 'N/A'),
-                                    "hotel_id": hotel_info.get('hotelId', 'N/A'),
-                                    "rating": hotel_info.get('rating', 'N/A'),
-                                    "address": hotel_info.get('address', {}).get('lines', ['N/A'])[0] if hotel_info.get('address', {}).get('lines') else 'N/A',
-                                    "price": price_info.get('total', 'N/A'),
-                                    "currency": price_info.get('currency', 'N/A'),
-                                    "check_in_date": check_in_date,
-                                    "check_out_date": check_out_date,
-                                    "contact": hotel_info.get('contact', {}).get('phone', 'N/A'),
-                                })
-                
-                except (ResponseError, AttributeError) as search_error:
-                    # If cityCode method doesn't work, try individual hotel IDs
-                    print(f"City code search failed, trying individual hotels: {search_error}")
-                    for hotel_id in hotel_ids[:5]:  # Limit to 5 hotels to avoid too many API calls
-                        try:
-                            # Method 2: Try with individual hotel IDs
-                            offers_response = amadeus.shopping.hotel_offers_search.get(
-                                hotelIds=hotel_id,
-                                checkInDate=check_in_date,
-                                checkOutDate=check_out_date,
-                                adults=adults
-                            )
-                            
-                            if offers_response.data:
-                                for offer_data in offers_response.data:
-                                    hotel_info = offer_data.get('hotel', {})
-                                    offers = offer_data.get('offers', [])
-                                    
-                                    if offers:
-                                        first_offer = offers[0]
-                                        price_info = first_offer.get('price', {})
-                                        
-                                        hotels_summary.append({
-                                            "name": hotel_info.get('name', 'N/A'),
-                                            "hotel_id": hotel_info.get('hotelId', 'N/A'),
-                                            "rating": hotel_info.get('rating', 'N/A'),
-                                            "address": hotel_info.get('address', {}).get('lines', ['N/A'])[0] if hotel_info.get('address', {}).get('lines') else 'N/A',
-                                            "price": price_info.get('total', 'N/A'),
-                                            "currency": price_info.get('currency', 'N/A'),
-                                            "check_in_date": check_in_date,
-                                            "check_out_date": check_out_date,
-                                            "contact": hotel_info.get('contact', {}).get('phone', 'N/A'),
-                                        })
-                        except ResponseError as offer_error:
-                            # Skip hotels that don't have offers for the given dates
-                            continue
-                        
-            except ResponseError as error:
-                print(f"Error searching hotel offers: {error}")
-                # Fall through to return basic hotel info without pricing
+            # Get hotel IDs (limit to first 10 for performance)
+            hotel_ids = [hotel["hotel_id"] for hotel in hotels[:10]]
+            for offer_data in search_hotel_offers(hotel_ids, check_in_date, check_out_date, adults):
+                summary = summarize_hotel_offer(offer_data, check_in_date, check_out_date)
+                if summary:
+                    hotels_summary.append(summary)
+            hotels_summary = hotels_summary[:5]  # Limit to 5 results
         else:
             # If no dates provided, return basic hotel information
-            for hotel in hotels_response.data[:5]:
+            for hotel in hotels[:5]:
                 hotels_summary.append({
-                    "name": hotel.get('name', 'N/A'),
-                    "hotel_id": hotel.get('hotelId', 'N/A'),
-                    "address": hotel.get('address', {}).get('lines', ['N/A'])[0] if hotel.get('address', {}).get('lines') else 'N/A',
-                    "contact": hotel.get('contact', {}).get('phone', 'N/A'),
+                    **hotel,
                     "note": "Check-in and check-out dates required for pricing information"
                 })
 
@@ -221,4 +507,3 @@ def get_hotels(city_code_or_name, adults=1, check_in_date=None, check_out_date=N
         import traceback
         print(traceback.format_exc())
         return {"error": f"Unexpected error: {str(e)}"}
-
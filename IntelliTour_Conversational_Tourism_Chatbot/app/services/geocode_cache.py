@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from app.services.iata_gazetteer import normalize_place
+from app.utils import metrics
+from app.utils.sqlite_utils import get_connection
+
+load_dotenv()
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+# Google allows keeping coordinates for up to 30 days; older places are looked up again
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "10000"))
+
+_STOPWORDS = frozenset("a an and at by for in near of on the to".split())
+_PLACE_FIELDS = ("name", "address", "place_id", "lat", "lng")
+
+
+def normalize_query(query):
+    """
+    Alias key for a location query: normalize_place without stopwords, words sorted,
+    so "Fort Jesus, Mombasa" and "mombasa the fort jesus" share a key.
+    """
+    words = normalize_place(query).split()
+    kept = [word for word in words if word not in _STOPWORDS] or words
+    return " ".join(sorted(set(kept)))
+
+
+class GeocodeCache:
+    """
+    Persistent geocode results: places by place_id, plus aliases (normalized queries
+    and place names) pointing at them. The SQLite file is shared by every worker and
+    survives restarts; a per-process LRU in front of it answers repeat lookups in memory.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS geocode_places (
+            place_id TEXT PRIMARY KEY,
+            name TEXT,
+            address TEXT,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            resolved_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS geocode_aliases (
+            alias TEXT PRIMARY KEY,
+            place_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_geocode_aliases_place_id ON geocode_aliases (place_id);
+    """
+
+    def __init__(self, path, memory_size):
+        self.path = path
+        self.memory_size = memory_size
+        self._aliases = OrderedDict()  # alias -> place_id
+        self._places = OrderedDict()  # place_id -> (resolved_at, place)
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.path, self.SCHEMA)
+
+    def _remember(self, table, key, value):
+        with self._lock:
+            table[key] = value
+            table.move_to_end(key)
+            while len(table) > self.memory_size:
+                table.popitem(last=False)
+
+    def _memory_place(self, place_id):
+        with self._lock:
+            entry = self._places.get(place_id)
+            if entry is None:
+                return None
+            if entry[0] + GEOCODE_CACHE_TTL <= time.time():
+                del self._places[place_id]
+                return None
+            self._places.move_to_end(place_id)
+            return dict(entry[1])
+
+    def lookup(self, query):
+        """Returns (place, tier) for a query seen before, tier "memory" or "store", or (None, None)."""
+        alias = normalize_query(query)
+        if not alias:
+            return None, None
+        with self._lock:
+            place_id = self._aliases.get(alias)
+        if place_id is not None:
+            place = self._memory_place(place_id)
+            if place is not None:
+                return place, "memory"
+
+        row = self._conn().execute(
+            "SELECT p.* FROM geocode_aliases a JOIN geocode_places p ON p.place_id = a.place_id "
+            "WHERE a.alias = ? AND p.resolved_at > ?",
+            (alias, time.time() - GEOCODE_CACHE_TTL),
+        ).fetchone()
+        if row is None:
+            return None, None
+        place = self._remember_row(row)
+        self._remember(self._aliases, alias, place["place_id"])
+        return place, "store"
+
+    def get_place(self, place_id):
+        """The cached place for a place_id, or None."""
+        place = self._memory_place(place_id)
+        if place is not None:
+            return place
+        row = self._conn().execute(
+            "SELECT * FROM geocode_places WHERE place_id = ? AND resolved_at > ?",
+            (place_id, time.time() - GEOCODE_CACHE_TTL),
+        ).fetchone()
+        return self._remember_row(row) if row is not None else None
+
+    def _remember_row(self, row):
+        place = {field: row[field] for field in _PLACE_FIELDS}
+        self._remember(self._places, place["place_id"], (row["resolved_at"], place))
+        return dict(place)
+
+    def store(self, place, aliases=()):
+        """
+        Saves a place ({name, address, place_id, lat, lng}) and points each alias at it.
+        Its name becomes an alias too, but only while no other place has it, so a branch
+        or a namesake elsewhere never takes over what a query resolved to.
+        """
+        place = {field: place.get(field) for field in _PLACE_FIELDS}
+        keys = {normalize_query(alias) for alias in aliases if alias}
+        keys.discard("")
+        name_key = normalize_query(place["name"]) if place["name"] else ""
+        now = time.time()
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode_places (name, address, place_id, lat, lng, resolved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*(place[field] for field in _PLACE_FIELDS), now),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO geocode_aliases (alias, place_id) VALUES (?, ?)",
+                [(key, place["place_id"]) for key in keys],
+            )
+            if name_key and name_key not in keys:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO geocode_aliases (alias, place_id) VALUES (?, ?)",
+                    (name_key, place["place_id"]),
+                )
+                if cursor.rowcount:
+                    keys.add(name_key)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._remember(self._places, place["place_id"], (now, place))
+        for key in keys:
+            self._remember(self._aliases, key, place["place_id"])
+
+    def stats(self):
+        conn = self._conn()
+        with self._lock:
+            stats = {"memory_aliases": len(self._aliases), "memory_places": len(self._places)}
+        stats["places"] = conn.execute("SELECT COUNT(*) FROM geocode_places").fetchone()[0]
+        stats["aliases"] = conn.execute("SELECT COUNT(*) FROM geocode_aliases").fetchone()[0]
+        return stats
+
+
+_geocode_cache = None
+_init_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    global _geocode_cache
+    with _init_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH, GEOCODE_MEMORY_SIZE)
+        return _geocode_cache
+
+
+def get_geocode_cache_stats():
+    """search_location hit rate and the size of the geocode store."""
+    counters = metrics.snapshot()["counters"]
+    stats = {outcome: counters.get(f"geocode.{outcome}", 0) for outcome in ("memory_hit", "store_hit", "negative_hit", "coalesced", "miss")}
+    lookups = sum(stats.values())
+    stats["hit_rate"] = round((lookups - stats["miss"]) / lookups, 3) if lookups else None
+    stats["ttl"] = GEOCODE_CACHE_TTL
+    stats.update(get_geocode_cache().stats())
+    return stats
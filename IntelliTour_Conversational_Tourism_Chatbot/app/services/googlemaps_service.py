@@ -1,14 +1,60 @@
+import json
+import logging
 import os
+import time
 import googlemaps
+import numpy as np
 import urllib.parse
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from app.services.geocode_cache import get_geocode_cache, normalize_query
+from app.utils import geo, metrics
+from app.utils.http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, describe_error, get_session
+from app.utils.singleflight import SingleFlight
+from app.utils.tool_cache import TOOL_CACHE_NEGATIVE_TTL, cached_tool, get_tool_cache, normalize_text_args
 
 load_dotenv() 
 
 GOOGLEMAPS_API_KEY = os.getenv("GOOGLEMAPS_API_KEY")
+GOOGLEMAPS_BASE_URL = os.getenv("GOOGLEMAPS_BASE_URL", "https://maps.googleapis.com")
+# Client-side rate limit applied by the googlemaps library
+GOOGLEMAPS_QUERIES_PER_SECOND = int(os.getenv("GOOGLEMAPS_QUERIES_PER_SECOND", "60"))
+# Nearby results are cached per geohash cell and filter, see search_nearby_places
+NEARBY_CACHE_TTL = int(os.getenv("NEARBY_CACHE_TTL", str(6 * 3600)))
+# Share of a query's cells that must be cached to answer it without any upstream request
+NEARBY_MIN_COVERAGE = float(os.getenv("NEARBY_MIN_COVERAGE", "0.75"))
+NEARBY_MAX_RESULTS = int(os.getenv("NEARBY_MAX_RESULTS", "20"))
+# Largest radius Places Nearby accepts, and the most results one response holds
+NEARBY_MAX_RADIUS = 50000
+NEARBY_PAGE_SIZE = 20
+# Resolved photo URLs point at Google's CDN and stay valid for a long time
+PLACE_PHOTO_TTL = int(os.getenv("PLACE_PHOTO_TTL", str(7 * 24 * 3600)))
+PLACE_PHOTO_BATCH_LIMIT = int(os.getenv("PLACE_PHOTO_BATCH_LIMIT", "10"))
+PLACE_PHOTO_MAX_CONCURRENCY = int(os.getenv("PLACE_PHOTO_MAX_CONCURRENCY", "4"))
+# Place Photo API requests carry the API key; only the image URLs they redirect to are cached
+PLACE_PHOTO_API_URL = f"{GOOGLEMAPS_BASE_URL}/maps/api/place/photo"
+# Weights of the "score" ranking: rating out of 5, closeness within the radius, and open now
+NEARBY_WEIGHT_RATING = float(os.getenv("NEARBY_WEIGHT_RATING", "0.4"))
+NEARBY_WEIGHT_DISTANCE = float(os.getenv("NEARBY_WEIGHT_DISTANCE", "0.5"))
+NEARBY_WEIGHT_OPEN = float(os.getenv("NEARBY_WEIGHT_OPEN", "0.1"))
+NEARBY_SORT_KEYS = ("score", "distance", "rating")
 
-gmaps = googlemaps.Client(key=GOOGLEMAPS_API_KEY)
+# googlemaps retries 5xx and over-quota responses itself, so its session does not retry again
+gmaps = googlemaps.Client(
+    key=GOOGLEMAPS_API_KEY,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT,
+    queries_per_second=GOOGLEMAPS_QUERIES_PER_SECOND,
+    base_url=GOOGLEMAPS_BASE_URL,
+    requests_session=get_session("googlemaps", retries=0),
+)
+
+# Concurrent identical nearby queries share one Places Nearby request
+_nearby_flights = SingleFlight()
+# Concurrent lookups of the same unknown location share one Find Place request
+_geocode_flights = SingleFlight()
+_photo_executor = ThreadPoolExecutor(max_workers=PLACE_PHOTO_MAX_CONCURRENCY, thread_name_prefix="place-photo")
 
 #Location search capability
 
@@ -16,73 +62,290 @@ def search_location(query: str):
     """
     Search for a specific location based on a text query.
     Returns the top match including name, coordinates and place_id.
+
+    Results are kept in the geocode cache under the normalized query and the place
+    name, so a landmark asked for again, however it is phrased, is answered without
+    a Find Place request. Queries without results are remembered for TOOL_CACHE_NEGATIVE_TTL.
     """
-    results = gmaps.find_place(
-        input=query,
-        input_type="textquery",
-        fields=["name", "geometry", "place_id", "formatted_address"]
-    )
+    cache = get_geocode_cache()
+    place, tier = cache.lookup(query)
+    if place is not None:
+        metrics.incr(f"geocode.{tier}_hit")
+        return place
+    miss_key = f"geocode_miss:{normalize_query(query)}"
+    entry = get_tool_cache().get(miss_key)
+    if entry is not None and entry[0] > time.time():
+        metrics.incr("geocode.negative_hit")
+        return {"error": "No results found"}
+
+    def load():
+        # Another caller may have stored this query between the lookup above and joining the flight
+        place, tier = cache.lookup(query)
+        if place is not None:
+            return place, f"{tier}_hit"
+
+        results = gmaps.find_place(
+            input=query,
+            input_type="textquery",
+            fields=["name", "geometry", "place_id", "formatted_address"]
+        )
+
+        if not results or results.get("status") != "OK":
+            get_tool_cache().set(miss_key, "geocode_miss", json.dumps(None), TOOL_CACHE_NEGATIVE_TTL)
+            return None, "miss"
+
+        candidate = results["candidates"][0]
+        place = {
+            "name": candidate.get("name"),
+            "address": candidate.get("formatted_address"),
+            "place_id": candidate.get("place_id"),
+            "lat": candidate["geometry"]["location"]["lat"],
+            "lng": candidate["geometry"]["location"]["lng"],
+        }
+        cache.store(place, aliases=[query])
+        return place, "miss"
 
-    if not results or results.get("status") != "OK":
+    (place, outcome), shared = _geocode_flights.do(normalize_query(query), load)
+    metrics.incr("geocode.coalesced" if shared else f"geocode.{outcome}")
+    if place is None:
         return {"error": "No results found"}
+    return dict(place)
 
-    candidate = results["candidates"][0]
+def nearby_filter_key(keyword=None, place_type=None):
+    keyword = " ".join(keyword.split()).casefold() if keyword else ""
+    return f"{keyword}|{place_type or ''}"
 
-    return {
-        "name": candidate.get("name"),
-        "address": candidate.get("formatted_address"),
-        "place_id": candidate.get("place_id"),
-        "lat": candidate["geometry"]["location"]["lat"],
-        "lng": candidate["geometry"]["location"]["lng"],
-    }
 
-def search_nearby_places(lat: float, lng: float, radius: int = 3000, keyword=None, place_type=None):
+def fetch_nearby_places(lat, lng, radius, keyword=None, place_type=None):
     """
-    Search nearby places using coordinates and optional filters.
+    Places from one Places Nearby request around (lat, lng), and whether they are all
+    the places there: a full page or a next_page_token means more were left out.
     """
     results = gmaps.places_nearby(
         location=(lat, lng),
         radius=radius,
         keyword=keyword,
         type=place_type
-    )
-
-    if not results or results.get("status") != "OK":
-        return {"error": "No nearby results found"}
+    ) or {}
+    metrics.incr("nearby_cache.upstream")
 
     places = []
-
-    for item in results["results"]:
+    for item in results.get("results", []):
+        location = item.get("geometry", {}).get("location")
+        if not location:
+            continue
         places.append({
             "name": item.get("name"),
             "address": item.get("vicinity"),
             "rating": item.get("rating"),
-            "place_id": item.get("place_id")
+            "place_id": item.get("place_id"),
+            "lat": location["lat"],
+            "lng": location["lng"],
+            "open_now": item.get("opening_hours", {}).get("open_now"),
+            "photo_reference": (item.get("photos") or [{}])[0].get("photo_reference"),
         })
+    complete = len(results.get("results", [])) < NEARBY_PAGE_SIZE and not results.get("next_page_token")
+    return places, complete
+
 
+def _nearby_cell_key(cell, filter_key):
+    return f"nearby_cell:v2:{cell}:{filter_key}"
+
+
+def _cached_nearby_cell(cell, filter_key):
+    """
+    The cached fill of a cell: the circle it was fetched with ({lat, lng, radius}),
+    whether the whole cell lies inside that circle, and its places. None if not cached.
+    """
+    entry = get_tool_cache().get(_nearby_cell_key(cell, filter_key))
+    if entry is None or entry[0] <= time.time():
+        return None
+    return json.loads(entry[2])
+
+
+def _cell_answers(fill, lat, lng, radius):
+    """
+    Whether a cell fill holds every place of the cell that a query circle can return.
+    The query may be no wider than the fetch, and must either get the whole cell from
+    it or lie entirely inside the fetched circle.
+    """
+    if fill is None or radius > fill["radius"]:
+        return False
+    return fill["whole"] or geo.haversine_m(lat, lng, fill["lat"], fill["lng"]) + radius <= fill["radius"]
+
+
+def _load_nearby_places(lat, lng, radius, cells, cached, filter_key, keyword, place_type):
+    """
+    Fetch the query's own circle. When the response holds every place in it, each cell
+    it touches is cached with the circle, so later queries that it fully answers reuse
+    it. A capped response is used for this query only.
+    """
+    def load():
+        places, complete = fetch_nearby_places(lat, lng, radius, keyword, place_type)
+        if not complete:
+            metrics.incr("nearby_cache.capped")
+            return places
+        by_cell = {cell: [] for cell in cells}
+        for place in places:
+            cell = geo.geohash_encode(place["lat"], place["lng"], len(cells[0]))
+            if cell in by_cell:
+                by_cell[cell].append(place)
+        cache = get_tool_cache()
+        for cell, cell_places in by_cell.items():
+            whole = geo.cell_within(lat, lng, radius, cell)
+            # A partly covered cell does not replace a fill that has the whole cell
+            if not whole and cached.get(cell) is not None and cached[cell]["whole"]:
+                continue
+            fill = {"lat": lat, "lng": lng, "radius": radius, "whole": whole, "places": cell_places}
+            cache.set(_nearby_cell_key(cell, filter_key), "nearby_cell", json.dumps(fill), NEARBY_CACHE_TTL)
+        return places
+
+    places, shared = _nearby_flights.do(f"{lat:.5f},{lng:.5f}:{radius}:{filter_key}", load)
+    if shared:
+        metrics.incr("nearby_cache.coalesced")
     return places
 
+
+def rank_places(places, lat, lng, radius, sort_by="score", limit=NEARBY_MAX_RESULTS):
+    """
+    Top `limit` places within `radius` meters of (lat, lng), ranked in one vectorized pass.
+
+    "distance" puts the nearest first, "rating" the best rated, and "score" weighs the
+    rating out of 5, closeness within the radius and being open now with the
+    NEARBY_WEIGHT_* settings. Places without a rating count as 0 for it.
+    Each place gets its distance_m, and its score when ranked by score.
+    """
+    if not places:
+        return []
+    lats = np.fromiter((place["lat"] for place in places), dtype=float, count=len(places))
+    lngs = np.fromiter((place["lng"] for place in places), dtype=float, count=len(places))
+    ratings = np.array([place.get("rating") or 0.0 for place in places], dtype=float)
+    open_now = np.array([bool(place.get("open_now")) for place in places], dtype=float)
+
+    distances = geo.haversine_m_array(lat, lng, lats, lngs)
+    inside = np.flatnonzero(distances <= radius)
+    if not inside.size:
+        return []
+
+    scores = (
+        NEARBY_WEIGHT_RATING * ratings[inside] / 5
+        + NEARBY_WEIGHT_DISTANCE * (1 - distances[inside] / radius if radius > 0 else 1)
+        + NEARBY_WEIGHT_OPEN * open_now[inside]
+    )
+    if sort_by == "distance":
+        keys = distances[inside]
+    elif sort_by == "rating":
+        # Ratings come in steps of 0.1, so the distance term only orders equally rated places
+        keys = -ratings[inside] + 0.01 * distances[inside] / (radius + 1)
+    else:
+        keys = -scores
+
+    # argpartition picks the top k in linear time; only those k are then sorted
+    k = min(limit, inside.size)
+    top = np.argpartition(keys, k - 1)[:k] if k < inside.size else np.arange(inside.size)
+    top = top[np.argsort(keys[top], kind="stable")]
+
+    ranked = []
+    for index in top:
+        place = {**places[inside[index]], "distance_m": int(round(distances[inside[index]]))}
+        if sort_by == "score":
+            place["score"] = round(float(scores[index]), 3)
+        ranked.append(place)
+    return ranked
+
+
+@cached_tool("search_nearby_places", ttl=NEARBY_CACHE_TTL, normalize=normalize_text_args)
+def search_nearby_places(lat: float, lng: float, radius: int = 3000, keyword=None, place_type=None,
+                         sort_by="score", limit=NEARBY_MAX_RESULTS):
+    """
+    Search nearby places using coordinates and optional filters.
+
+    A repeat of the same search is answered by the tool cache. Below that, places are
+    cached per geohash cell and filter, so queries from coordinates a few meters apart
+    share them. A query covers the cells its circle touches; once enough of them hold
+    all of its places (see _cell_answers) it is answered without any request. Otherwise
+    its own circle is fetched with one request, the same as an uncached search. The
+    places are ranked by rank_places; open_now is as of when they were fetched.
+    """
+    if sort_by not in NEARBY_SORT_KEYS:
+        return {"error": f"sort_by must be one of {', '.join(NEARBY_SORT_KEYS)}."}
+    limit = max(1, min(int(limit or NEARBY_MAX_RESULTS), NEARBY_MAX_RESULTS))
+    radius = max(1, min(int(radius or 3000), NEARBY_MAX_RADIUS))
+
+    filter_key = nearby_filter_key(keyword, place_type)
+    cells = geo.covering_cells(lat, lng, radius)
+    cached = {cell: _cached_nearby_cell(cell, filter_key) for cell in cells}
+    usable = [fill for fill in cached.values() if _cell_answers(fill, lat, lng, radius)]
+    metrics.incr("nearby_cache.cell_hit", len(usable))
+    metrics.incr("nearby_cache.cell_miss", len(cells) - len(usable))
+
+    places = [place for fill in usable for place in fill["places"]]
+    failed = False
+    if len(usable) / len(cells) < NEARBY_MIN_COVERAGE:
+        try:
+            places += _load_nearby_places(lat, lng, radius, cells, cached, filter_key, keyword, place_type)
+        except Exception as e:
+            logging.warning(f"Nearby search around {lat},{lng} failed: {describe_error(e)}")
+            failed = True
+    else:
+        metrics.incr("nearby_cache.answered_from_cache")
+
+    # Cached cells and the fetched circle overlap; the fetched copy of a place wins
+    places = list({place["place_id"]: place for place in places}.values())
+    with metrics.timed("nearby_cache.rank"):
+        ranked = rank_places(places, lat, lng, radius, sort_by, limit)
+
+    if not ranked and failed:
+        return {"error": "No nearby results found"}
+    return ranked
+
+
+def get_nearby_cache_stats():
+    """How often nearby searches were answered from cached geohash cells."""
+    counters = metrics.snapshot()["counters"]
+    stats = {
+        name: counters.get(f"nearby_cache.{name}", 0)
+        for name in ("cell_hit", "cell_miss", "answered_from_cache", "upstream", "capped", "coalesced")
+    }
+    stats["exact_hit"] = sum(
+        counters.get(f"tool_cache.search_nearby_places.{tier}_hit", 0) for tier in ("memory", "shared")
+    )
+    lookups = stats["cell_hit"] + stats["cell_miss"]
+    stats["cell_hit_rate"] = round(stats["cell_hit"] / lookups, 3) if lookups else None
+    stats.update({"ttl": NEARBY_CACHE_TTL, "min_coverage": NEARBY_MIN_COVERAGE})
+    return stats
+
 # Obtain additional information about a place
+# Version 2 added opening_periods and utc_offset for plan_day_itinerary
+@cached_tool("get_location_details", ttl=3 * 24 * 3600, version=2)
 def get_location_details(place_id: str):
     """
     Retrieve detailed information about a location from its place_id.
     """
-    details = gmaps.place(
-        place_id=place_id,
-        fields=[
-            "name",
-            "formatted_address",
-            "rating",
-            "opening_hours",
-            "formatted_phone_number",
-            "website",
-            "photo",
-            "geometry"
-        ]
-    )
+    try:
+        details = gmaps.place(
+            place_id=place_id,
+            fields=[
+                "name",
+                "formatted_address",
+                "rating",
+                "opening_hours",
+                "formatted_phone_number",
+                "website",
+                "photo",
+                "geometry",
+                "utc_offset"
+            ]
+        )
+    except (googlemaps.exceptions.ApiError, googlemaps.exceptions.TransportError,
+            googlemaps.exceptions.Timeout) as e:
+        logging.warning(f"Place details for {place_id} failed: {describe_error(e)}")
+        details = None
 
     if not details or details.get("status") != "OK":
-        return {"error": "Could not retrieve details"}
+        # A place found by search_location still has its name, address and coordinates
+        place = get_geocode_cache().get_place(place_id)
+        return {"error": "Could not retrieve details", **(place or {})}
 
     result = details["result"]
 
@@ -91,6 +354,15 @@ def get_location_details(place_id: str):
     if result.get("photos"):
         photo_reference = result["photos"][0]["photo_reference"]
 
+    location = result["geometry"]["location"]
+    get_geocode_cache().store({
+        "place_id": place_id,
+        "name": result.get("name"),
+        "address": result.get("formatted_address"),
+        "lat": location["lat"],
+        "lng": location["lng"],
+    })
+
     return {
         "name": result.get("name"),
         "address": result.get("formatted_address"),
@@ -98,11 +370,22 @@ def get_location_details(place_id: str):
         "phone": result.get("formatted_phone_number"),
         "website": result.get("website"),
         "opening_hours": result.get("opening_hours", {}).get("weekday_text"),
+        # Google's periods ({"open": {"day", "time"}, "close": ...}, day 0 is Sunday), used by plan_day_itinerary
+        "opening_periods": result.get("opening_hours", {}).get("periods"),
         "photo_reference": photo_reference,
-        "lat": result["geometry"]["location"]["lat"],
-        "lng": result["geometry"]["location"]["lng"],
+        "lat": location["lat"],
+        "lng": location["lng"],
+        # Minutes from UTC of the place's local time
+        "utc_offset": result.get("utc_offset"),
     }
 # Generating the photo url
+def _is_resolved_photo(result):
+    """Whether a get_place_photo result points at the image itself rather than the key-bearing API URL."""
+    return "warning" not in result and not result.get("photo_url", "").startswith(PLACE_PHOTO_API_URL)
+
+
+# Fallback URLs carry the API key and are retried next time rather than cached
+@cached_tool("get_place_photo", ttl=PLACE_PHOTO_TTL, cache_if=_is_resolved_photo)
 def get_place_photo(photo_reference: str, max_width=800):
     """
     Returns a Google Maps Place Photo URL that is directly viewable.
@@ -112,7 +395,6 @@ def get_place_photo(photo_reference: str, max_width=800):
         return {"error": "No photo_reference provided"}
 
     # Build the initial URL with proper parameter encoding
-    base_url = "https://maps.googleapis.com/maps/api/place/photo"
     params = {
         "maxwidth": max_width,
         "photo_reference": photo_reference,
@@ -120,27 +402,27 @@ def get_place_photo(photo_reference: str, max_width=800):
     }
     
     # Create properly encoded URL
-    photo_url = f"{base_url}?{urllib.parse.urlencode(params)}"
+    photo_url = f"{PLACE_PHOTO_API_URL}?{urllib.parse.urlencode(params)}"
     
     try:
         # Follow the redirect to get the actual image URL
         # Use allow_redirects=False to get the redirect location without downloading the image
-        response = requests.get(photo_url, allow_redirects=False, timeout=5)
+        response = get_session("googlemaps").get(photo_url, allow_redirects=False, timeout=5)
         
-        if response.status_code == 302 or response.status_code == 301:
+        if (response.status_code == 302 or response.status_code == 301) and response.headers.get('Location'):
             # Get the final URL from the Location header
-            final_url = response.headers.get('Location', photo_url)
             return {
-                "photo_url": final_url,
+                "photo_url": response.headers['Location'],
                 "photo_reference": photo_reference,
                 "max_width": max_width
             }
-        elif response.status_code == 200:
-            # If no redirect, return the original URL
+        elif response.status_code in (200, 301, 302):
+            # No redirect to follow, return the original URL
             return {
                 "photo_url": photo_url,
                 "photo_reference": photo_reference,
-                "max_width": max_width
+                "max_width": max_width,
+                "warning": f"No redirect to the image (status: {response.status_code}). Using original URL."
             }
         else:
             # If there's an error, return the original URL as fallback
@@ -156,9 +438,21 @@ def get_place_photo(photo_reference: str, max_width=800):
             "photo_url": photo_url,
             "photo_reference": photo_reference,
             "max_width": max_width,
-            "warning": f"Could not resolve redirect: {str(e)}. Using original URL."
+            "warning": f"Could not resolve redirect: {describe_error(e)}. Using original URL."
         }
 
+def get_place_photos(photo_references, max_width=800):
+    """
+    Photo URLs for several photo_references in one call. Cached URLs cost nothing;
+    the redirects of the others are resolved concurrently.
+    """
+    references = list(dict.fromkeys(reference for reference in photo_references or [] if reference))
+    if not references:
+        return {"error": "No photo_reference provided"}
+    references = references[:PLACE_PHOTO_BATCH_LIMIT]
+    photos = list(_photo_executor.map(lambda reference: get_place_photo(reference, max_width), references))
+    return {"photos": photos}
+
 #Obtain the street view of the location
 def get_street_view_image(lat: float, lng: float, width=600, height=400):
     """
@@ -0,0 +1,194 @@
+import bisect
+import difflib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+from app.utils.sqlite_utils import get_connection
+
+load_dotenv()
+IATA_DATA_PATH = os.getenv(
+    "IATA_DATA_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "iata_locations.json")
+)
+IATA_CACHE_PATH = os.getenv("IATA_CACHE_PATH", "iata_cache.sqlite3")
+# Prefix matches shorter than this are too ambiguous ("ma" -> Madrid? Malindi? Manila?)
+IATA_MIN_PREFIX = int(os.getenv("IATA_MIN_PREFIX", "4"))
+IATA_FUZZY_CUTOFF = float(os.getenv("IATA_FUZZY_CUTOFF", "0.8"))
+# A local fuzzy match is only used as an answer when it looks like a typo of the name:
+# "Nairobbi" -> Nairobi, but not "Portland" -> Orlando
+IATA_TYPO_CUTOFF = float(os.getenv("IATA_TYPO_CUTOFF", "0.9"))
+IATA_TYPO_MAX_LENGTH_GAP = 2
+
+_AIRPORT_WORDS = re.compile(r"\b(international|intl|airport|airstrip|aeroport)\b")
+
+
+def normalize_place(name):
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch)).casefold()
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(name.split())
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """
+    In-memory index over the bundled city and airport list.
+    Lookups go exact name/alias -> unique prefix -> trigram fuzzy match, and return the
+    IATA code to search with: the city code for cities, the airport code for airports
+    (or the airport's city code when city_only is set, e.g. for hotel searches).
+    Only exact matches are answers; prefix and fuzzy matches are candidates, since the
+    bundled list is small and a real city missing from it ("Mali", "Portland") would
+    otherwise resolve to whichever listed name it resembles.
+    """
+
+    def __init__(self, cities, airports):
+        self.cities = {city["code"]: city for city in cities}
+        self._exact = {}
+        self._trigram_index = defaultdict(set)
+
+        # Cities are indexed first so they win over an airport that shares the name
+        for city in cities:
+            entry = {"type": "CITY", "code": city["code"], "city_code": city["code"], "name": city["name"]}
+            for key in [city["name"], *city.get("aliases", [])]:
+                self._add(key, entry)
+        for airport in airports:
+            entry = {"type": "AIRPORT", "code": airport["code"], "city_code": airport["city_code"], "name": airport["name"]}
+            short_name = _AIRPORT_WORDS.sub(" ", normalize_place(airport["name"]))
+            for key in [airport["name"], short_name, *airport.get("aliases", [])]:
+                self._add(key, entry)
+
+        self._sorted_keys = sorted(self._exact)
+
+    def _add(self, key, entry):
+        key = normalize_place(key)
+        if not key or key in self._exact:
+            return
+        self._exact[key] = entry
+        for gram in _trigrams(key):
+            self._trigram_index[gram].add(key)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def lookup(self, query):
+        """Returns (entry, match_type) or (None, None)."""
+        key = normalize_place(query)
+        if not key:
+            return None, None
+
+        entry = self._exact.get(key)
+        if entry:
+            return entry, "exact"
+
+        if len(key) >= IATA_MIN_PREFIX:
+            start = bisect.bisect_left(self._sorted_keys, key)
+            matches = []
+            for candidate in self._sorted_keys[start:]:
+                if not candidate.startswith(key):
+                    break
+                matches.append(self._exact[candidate])
+            # Only accept a prefix if every completion points at the same place
+            if matches and len({m["city_code"] for m in matches}) == 1:
+                cities = [m for m in matches if m["type"] == "CITY"]
+                return (cities or matches)[0], "prefix"
+
+        return self._fuzzy(key), "fuzzy"
+
+    def closest(self, query):
+        """The entry whose name the query is a likely typo of, or None."""
+        key = normalize_place(query)
+        if not key:
+            return None
+        return self._fuzzy(key, IATA_TYPO_CUTOFF, IATA_TYPO_MAX_LENGTH_GAP)
+
+    def _fuzzy(self, key, cutoff=IATA_FUZZY_CUTOFF, max_length_gap=None):
+        shared = defaultdict(int)
+        for gram in _trigrams(key):
+            for candidate in self._trigram_index.get(gram, ()):
+                shared[candidate] += 1
+        if not shared:
+            return None
+
+        best_key, best_score = None, cutoff
+        for candidate in sorted(shared, key=shared.get, reverse=True)[:10]:
+            if max_length_gap is not None and abs(len(candidate) - len(key)) > max_length_gap:
+                continue
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return self._exact[best_key] if best_key else None
+
+    def resolve(self, query, city_only=False):
+        """IATA code for a city or airport name, or None if it isn't in the gazetteer."""
+        entry, match_type = self.lookup(query)
+        if match_type != "exact":
+            return None
+        return entry["city_code"] if city_only else entry["code"]
+
+
+class IataCache:
+    """
+    Persistent keyword -> IATA code mapping for names resolved through the Amadeus API,
+    so each unknown name costs at most one API call across restarts and workers.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS iata_cache (
+            keyword TEXT PRIMARY KEY,
+            iata_code TEXT NOT NULL,
+            resolved_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _conn(self):
+        return get_connection(self.path, self.SCHEMA)
+
+    def get(self, keyword):
+        row = self._conn().execute(
+            "SELECT iata_code FROM iata_cache WHERE keyword = ?", (normalize_place(keyword),)
+        ).fetchone()
+        return row["iata_code"] if row else None
+
+    def set(self, keyword, iata_code):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO iata_cache (keyword, iata_code, resolved_at) VALUES (?, ?, ?)",
+            (normalize_place(keyword), iata_code, time.time()),
+        )
+
+
+_gazetteer = None
+_iata_cache = None
+_init_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Loads the bundled gazetteer once per process."""
+    global _gazetteer
+    with _init_lock:
+        if _gazetteer is None:
+            with open(IATA_DATA_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+            _gazetteer = Gazetteer(data["cities"], data["airports"])
+        return _gazetteer
+
+
+def get_iata_cache():
+    global _iata_cache
+    with _init_lock:
+        if _iata_cache is None:
+            _iata_cache = IataCache(IATA_CACHE_PATH)
+        return _iata_cache
@@ -0,0 +1,258 @@
+import datetime as dt
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.googlemaps_service import get_location_details
+from app.utils import geo, metrics
+
+load_dotenv()
+
+ITINERARY_MAX_STOPS = int(os.getenv("ITINERARY_MAX_STOPS", "12"))
+ITINERARY_VISIT_MINUTES = int(os.getenv("ITINERARY_VISIT_MINUTES", "60"))
+# Travel time between stops: the straight-line distance stretched by the detour factor, at an average city speed
+ITINERARY_SPEED_KMH = float(os.getenv("ITINERARY_SPEED_KMH", "25"))
+ITINERARY_DETOUR_FACTOR = float(os.getenv("ITINERARY_DETOUR_FACTOR", "1.3"))
+
+_details_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="itinerary")
+
+
+def parse_clock(value):
+    """Minutes after midnight of an "HH:MM" time. Raises ValueError for anything else."""
+    clock = dt.datetime.strptime(value.strip(), "%H:%M")
+    return clock.hour * 60 + clock.minute
+
+
+def _period_minutes(value):
+    """Minutes after midnight of a Google opening period time ("HHMM")."""
+    clock = dt.datetime.strptime(value, "%H%M")
+    return clock.hour * 60 + clock.minute
+
+
+def format_clock(minutes):
+    minutes = int(round(minutes))
+    clock = f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+    return clock if minutes < 24 * 60 else f"{clock} (+1 day)"
+
+
+def opening_windows(periods, date):
+    """
+    (open, close) windows in minutes after midnight of `date`, from Google opening
+    periods. A period that started the day before and closes after midnight counts.
+    Returns None when the hours are unknown, so the place is treated as always open.
+    """
+    if not periods:
+        return None
+    google_day = (date.weekday() + 1) % 7  # Google counts from Sunday, Python from Monday
+    windows = []
+    for period in periods:
+        opens, closes = period.get("open"), period.get("close")
+        if not opens:
+            continue
+        if not closes:  # Open 24 hours
+            return [(0, 2 * 24 * 60)]
+        day_offset = (opens["day"] - google_day + 3) % 7 - 3
+        start = day_offset * 24 * 60 + _period_minutes(opens["time"])
+        end = start + (closes["day"] - opens["day"]) % 7 * 24 * 60 + _period_minutes(closes["time"]) - _period_minutes(opens["time"])
+        if end <= start:
+            end += 7 * 24 * 60
+        if end > 0 and start < 2 * 24 * 60:
+            windows.append((start, end))
+    return sorted(windows)
+
+
+def _visit_start(windows, arrive, visit_minutes):
+    """Earliest start of a whole visit at or after arrive, and whether the place is open for it."""
+    if windows is None:
+        return arrive, True
+    for opens, closes in windows:
+        start = max(arrive, opens)
+        if start + visit_minutes <= closes:
+            return start, True
+    return arrive, False
+
+
+def _resolve_stop(stop, visit_minutes):
+    if isinstance(stop, str):
+        stop = {"place_id": stop}
+    resolved = {
+        "name": stop.get("name"),
+        "place_id": stop.get("place_id"),
+        "lat": stop.get("lat"),
+        "lng": stop.get("lng"),
+        "periods": None,
+        "utc_offset": None,
+        "visit_minutes": int(stop.get("visit_minutes") or visit_minutes),
+    }
+    if resolved["place_id"]:
+        details = get_location_details(resolved["place_id"])
+        # Without details a stop can still be routed from its cached coordinates, just not checked for hours
+        if "error" in details and "lat" not in details:
+            return {"stop": stop, "error": details["error"]}
+        resolved["name"] = resolved["name"] or details.get("name")
+        resolved["lat"], resolved["lng"] = details["lat"], details["lng"]
+        resolved["periods"] = details.get("opening_periods")
+        resolved["utc_offset"] = details.get("utc_offset")
+    if resolved["lat"] is None or resolved["lng"] is None:
+        return {"stop": stop, "error": "A stop needs a place_id or lat and lng."}
+    return resolved
+
+
+def local_today(places):
+    """
+    Today's date where the stops are: from the UTC offset Google gives for a place,
+    or, without one, estimated from the longitude of the first stop.
+    """
+    offset = next((place["utc_offset"] for place in places if place.get("utc_offset") is not None), None)
+    if offset is None:
+        offset = round(places[0]["lng"] / 15) * 60
+    return (dt.datetime.now(dt.timezone.utc) + dt.timedelta(minutes=offset)).date()
+
+
+def _nearest_neighbor(travel, first):
+    """Visiting order that always goes to the closest unvisited stop next."""
+    order = [first]
+    visited = np.zeros(len(travel), dtype=bool)
+    visited[first] = True
+    for _ in range(len(travel) - 1):
+        row = np.where(visited, np.inf, travel[order[-1]])
+        nearest = int(np.argmin(row))
+        order.append(nearest)
+        visited[nearest] = True
+    return order
+
+
+def _improve(order, cost, fixed_first):
+    """
+    Local search from order: 2-opt segment reversals plus moving a single stop,
+    applied while they lower cost. Moving stops lets opening hours reorder a route
+    that is already short.
+    """
+    best = cost(order)
+    first = 1 if fixed_first else 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(first, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                for candidate in (
+                    order[:i] + order[i:j + 1][::-1] + order[j + 1:],
+                    order[:i] + order[i + 1:j + 1] + [order[i]] + order[j + 1:],
+                    order[:i] + [order[j]] + order[i:j] + order[j + 1:],
+                ):
+                    candidate_cost = cost(candidate)
+                    if candidate_cost < best:
+                        order, best, improved = candidate, candidate_cost, True
+    return order, best
+
+
+def plan_day_itinerary(stops, date=None, start_time="09:00", start_lat=None, start_lng=None,
+                       visit_minutes=ITINERARY_VISIT_MINUTES):
+    """
+    Order a day's stops (place_ids or coordinates) to keep travel short and visit each
+    place while it is open. Travel times come from a haversine distance matrix; the
+    order from nearest neighbor and 2-opt, checked against the opening periods of
+    get_location_details on `date` (by default today where the stops are).
+    With start_lat/start_lng the day starts there.
+    """
+    if not stops:
+        return {"error": "Provide at least one stop."}
+    if len(stops) > ITINERARY_MAX_STOPS:
+        return {"error": f"Plan at most {ITINERARY_MAX_STOPS} stops per day."}
+    try:
+        day = dt.date.fromisoformat(date) if date else None
+        start_minutes = parse_clock(start_time or "09:00")
+    except ValueError:
+        return {"error": "Use YYYY-MM-DD for date and HH:MM (00:00-23:59) for start_time."}
+
+    resolved = list(_details_executor.map(lambda stop: _resolve_stop(stop, visit_minutes), stops))
+    skipped = [stop for stop in resolved if "error" in stop]
+    places = [stop for stop in resolved if "error" not in stop]
+    if not places:
+        return {"error": "None of the stops could be found.", "skipped": skipped}
+    if day is None:
+        day = local_today(places)
+
+    with metrics.timed("itinerary.solve"):
+        fixed_first = start_lat is not None and start_lng is not None
+        if fixed_first:
+            places.insert(0, {"name": "Start", "place_id": None, "lat": start_lat, "lng": start_lng,
+                              "periods": None, "utc_offset": None, "visit_minutes": 0})
+        windows = [opening_windows(place["periods"], day) for place in places]
+        visits = [place["visit_minutes"] for place in places]
+
+        distances = geo.haversine_matrix_m([place["lat"] for place in places], [place["lng"] for place in places])
+        distances *= ITINERARY_DETOUR_FACTOR
+        travel = distances / 1000 / ITINERARY_SPEED_KMH * 60
+        # The local search evaluates thousands of schedules; plain lists index much faster than arrays
+        travel_rows = travel.tolist()
+
+        def schedule(order):
+            clock, previous, closed, rows = start_minutes, None, 0, []
+            for index in order:
+                if previous is not None:
+                    clock += travel_rows[previous][index]
+                begin, is_open = _visit_start(windows[index], clock, visits[index])
+                closed += not is_open
+                rows.append((index, previous, clock, begin, is_open))
+                clock = begin + visits[index]
+                previous = index
+            return closed, clock, rows
+
+        def cost(order):
+            closed, finish, _ = schedule(order)
+            return closed, round(finish, 6), sum(travel_rows[a][b] for a, b in zip(order, order[1:]))
+
+        if fixed_first:
+            seeds = [0]
+        else:
+            # An open route usually starts at one end of the area or at the stop that opens first
+            far_a, far_b = np.unravel_index(int(np.argmax(distances)), distances.shape)
+            first_open = min(range(len(places)), key=lambda index: (windows[index] or [(0, 0)])[0][0])
+            seeds = sorted({int(far_a), int(far_b), first_open})
+        order, _ = min(
+            (_improve(_nearest_neighbor(travel, seed), cost, fixed_first) for seed in seeds),
+            key=lambda result: result[1],
+        )
+        _, finish, rows = schedule(order)
+
+    plan = []
+    for index, previous, arrive, begin, is_open in rows:
+        place = places[index]
+        if fixed_first and index == 0:
+            continue
+        entry = {
+            "order": len(plan) + 1,
+            "name": place["name"],
+            "place_id": place["place_id"],
+            "lat": place["lat"],
+            "lng": place["lng"],
+            "distance_km": round(distances[previous, index] / 1000, 1) if previous is not None else 0.0,
+            "travel_minutes": int(round(travel[previous, index])) if previous is not None else 0,
+            "arrive": format_clock(arrive),
+            "start": format_clock(begin),
+            "leave": format_clock(begin + place["visit_minutes"]),
+        }
+        if windows[index] is not None:
+            today = [(opens, closes) for opens, closes in windows[index] if opens < 24 * 60]
+            entry["open_hours"] = ", ".join(f"{format_clock(max(opens, 0))}-{format_clock(closes)}" for opens, closes in today) or "closed"
+        if not is_open:
+            entry["warning"] = "Not open long enough for this visit at this time"
+        plan.append(entry)
+
+    legs = list(zip(order, order[1:]))
+    result = {
+        "date": day.isoformat(),
+        "start_time": format_clock(start_minutes),
+        "end_time": format_clock(finish),
+        "total_distance_km": round(sum(distances[a, b] for a, b in legs) / 1000, 1),
+        "total_travel_minutes": int(round(sum(travel[a, b] for a, b in legs))),
+        "stops": plan,
+    }
+    if skipped:
+        logging.warning(f"Itinerary skipped {len(skipped)} stops: {skipped}")
+        result["skipped"] = skipped
+    return result
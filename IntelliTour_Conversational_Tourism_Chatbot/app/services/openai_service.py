@@ -1,31 +1,98 @@
-from openai import OpenAI
-import shelve
+from openai import OpenAI, APITimeoutError
 from dotenv import load_dotenv
 import os
 import time
 import logging
 import json
+import uuid
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from .openweathermap_service import get_weather
-from .amadeus_service import get_flight_offers, get_hotels
+from .amadeus_service import get_flight_offers, get_more_flight_offers, get_fare_calendar, get_hotels
 from .googlemaps_service import (
     search_location,
     get_location_details,
     get_place_photo,
+    get_place_photos,
     get_street_view_image,
     search_nearby_places
 )
+from .itinerary_service import ITINERARY_VISIT_MINUTES, plan_day_itinerary
+from .thread_store import get_thread_store
+from .tool_schemas import ASSISTANT_INSTRUCTIONS, FUNCTION_TOOLS, assistant_tools
+from app.utils import metrics
+from app.utils.deadline import Deadline, DeadlineExceeded, backoff_intervals
+from app.utils.http_client import describe_error, strip_query_strings
 
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Defaults to the public API; the benchmarks point this at a local stand-in server
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
 AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
 GOOGLEMAPS_API_KEY = os.getenv("GOOGLEMAPS_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+# "stream" runs the assistant over the Assistants event stream, "poll" polls runs.retrieve.
+# Streaming falls back to polling if the stream cannot be used.
+OPENAI_RUN_MODE = os.getenv("OPENAI_RUN_MODE", "stream")
+# Total time allowed for answering one message. Keep it inside the WhatsApp webhook retry window.
+RESPONSE_DEADLINE_SECONDS = float(os.getenv("RESPONSE_DEADLINE_SECONDS", "20"))
+# Polling fallback starts fast and backs off exponentially up to the cap
+POLL_INITIAL_INTERVAL = float(os.getenv("POLL_INITIAL_INTERVAL", "0.1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "2.0"))
+# A thread takes no new message or run while one of its runs is in these states
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+# Tool calls from one requires_action step run concurrently, on a pool of up to this many threads per step
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+# Threads are compacted once their estimated size passes the token budget (or message cap):
+# older turns become a short synopsis and the most recent ones are carried over verbatim.
+THREAD_TOKEN_BUDGET = int(os.getenv("THREAD_TOKEN_BUDGET", "6000"))
+THREAD_MAX_MESSAGES = int(os.getenv("THREAD_MAX_MESSAGES", "50"))
+THREAD_KEEP_RECENT_MESSAGES = int(os.getenv("THREAD_KEEP_RECENT_MESSAGES", "6"))
+# Most recent messages read back from the API for threads the store has no history of
+THREAD_HISTORY_LIMIT = int(os.getenv("THREAD_HISTORY_LIMIT", "500"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "10"))
+# "assistants" runs each message on an Assistants API thread. "chat" keeps the history in the
+# thread store and calls chat completions directly with the same tools (no file search).
+CONVERSATION_ENGINE = os.getenv("CONVERSATION_ENGINE", "assistants")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1")
+# Estimated history tokens sent with each chat completion; older turns are left out
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+CHAT_MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "4"))
+# Conversations of the chat engine only exist locally and get ids with this prefix
+LOCAL_THREAD_PREFIX = "local_"
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
-THREAD_DB = "user_threads.db"
+def count_api_call(endpoint):
+    """Count an OpenAI API request, in total and per endpoint, for the engine comparison in /metrics."""
+    metrics.incr("openai.api_calls")
+    metrics.incr(f"openai.{endpoint}")
+
+def get_engine_stats():
+    """The active conversation engine and how many OpenAI requests it needs per message."""
+    counters = metrics.snapshot()["counters"]
+    messages = counters.get(f"engine.{CONVERSATION_ENGINE}.messages", 0)
+    api_calls = counters.get("openai.api_calls", 0)
+    return {
+        "engine": CONVERSATION_ENGINE,
+        "messages": messages,
+        "api_calls": api_calls,
+        "api_calls_per_message": round(api_calls / messages, 2) if messages else None,
+        "endpoints": {
+            name[len("openai."):]: value for name, value in counters.items()
+            if name.startswith("openai.") and name != "openai.api_calls"
+        },
+    }
+
+def is_local_thread(thread_id):
+    return thread_id.startswith(LOCAL_THREAD_PREFIX)
+
+def new_local_thread_id():
+    return f"{LOCAL_THREAD_PREFIX}{uuid.uuid4().hex}"
 
 def get_or_create_thread_for_user(wa_id: str) -> str:
     """
@@ -33,41 +100,21 @@ def get_or_create_thread_for_user(wa_id: str) -> str:
     Creates one if it doesn't exist.
     """
     try:
-        with shelve.open(THREAD_DB) as db:
-            if wa_id in db:
-                thread_id = db[wa_id]
-                logging.info(f"Existing thread found for {wa_id}: {thread_id}")
-            else:
-                thread = client.beta.threads.create()
-                db[wa_id] = thread.id
-                thread_id = thread.id
-                logging.info(f"Created new thread for {wa_id}: {thread_id}")
+        store = get_thread_store()
+        thread_id = store.get(wa_id)
+        if thread_id is not None:
+            logging.info(f"Existing thread found for {wa_id}: {thread_id}")
+        else:
+            count_api_call("threads.create")
+            thread = client.beta.threads.create()
+            # Another worker may have created a thread for this user in the meantime
+            thread_id = store.set_if_absent(wa_id, thread.id)
+            logging.info(f"Created new thread for {wa_id}: {thread_id}")
         return thread_id
     except Exception as e:
         logging.error(f"Error accessing thread database: {e}")
         raise
 
-def wait_for_run_completion(thread_id: str, run_id: str, timeout: int = 60) -> None:
-    """
-    Polls the OpenAI API until the specified run is completed or fails.
-    Prevents trying to send a new message while the previous run is still active.
-    """
-    start_time = time.time()
-    while True:
-        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
-        status = run.status
-        logging.info(f"Run {run_id} status: {status}")
-
-        if status in ("completed", "failed", "cancelled", "expired"):
-            break
-
-        if time.time() - start_time > timeout:
-            logging.warning(f"Run {run_id} timed out after {timeout} seconds.")
-            break
-
-        time.sleep(2)  # Wait 2 seconds before checking again
-
-
 #def upload_file(path):
     # Upload a file with an "assistants" purpose
  #   file = client.files.create(
@@ -81,182 +128,21 @@ def create_assistant(file):
     """
     assistant = client.beta.assistants.create(
         name="WhatsApp Travel and Tourism Assistant",
-        instructions="You're a helpful WhatsApp assistant that can assist travelers with queries based off tourism and travel. Use your knowledge base to best respond to customer queries related to travel and tourism. If you don't know the answer, say simply that you cannot help with question and advice to contact the host directly. If the question is outside the travel and tourism scope, remind the user to remain within the scope for travel and tourism. Be friendly and funny.",
-        tools=[{"type": "file_search"},
-        {
-        "type": "function",
-        "function": {
-            "name": "get_weather",
-            "description": ( "Using the OpenWeatherMap API."
-                "Do not use for flights or hotels."
-                "Get the current weather for a city. "
-                "Use this ONLY when the user specifically asks about weather,temperature, climate, or conditions in a city."
-                            ),
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The name of the city."
-                            }
-                            },
-                "required": ["city"]
-                        }
-            } 
-        },
-
-        {
-                "type": "function",
-                "function": {
-                    "name": "get_flight_offers",
-                    "description":( "Search for flight offers between two cities using the Amadeus API."
-                    "Use this when the user asks about flights, tickets, air travel,airfare or ticket prices between two cities."
-                                    ),
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "origin": {
-                                "type": "string",
-                                "description": "IATA code for the origin airport or the name of the city, e.g., 'NBO or Nairobi' for Nairobi."
-                            },
-                            "destination": {
-                                "type": "string",
-                                "description": "IATA code for the destination airport or name of the city, e.g., 'DXB or Dubai' for Dubai."
-                            },
-                            "departure_date": {
-                                "type": "string",
-                                "description": "Departure date in YYYY-MM-DD format."
-                            },
-                            "return_date": {
-                                "type": "string",
-                                "description": "Optional return date in YYYY-MM-DD format.",
-                            },
-                            "adults": {
-                                "type": "integer",
-                                "description": "Number of adult passengers.",
-                                "default": 1
-                            }
-                        },
-                        "required": ["origin", "destination", "departure_date"]
-                    }
-                }
-            },
-
-            {
-                "type": "function",
-                "function": {
-                        "name": "get_hotels",
-                        "description": (
-                                    "Find available hotels in the destination city using the Amadeus API. "
-                                    "Use this when the user asks about hotels, accommodation, or staying in a city."
-                                        ),
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "city_code": {
-                                    "type": "string",
-                                    "description": "IATA city code or name of the city, e.g., 'NBO or Nairobi' for Nairobi."
-                                            }
-                                        },
-                "required": ["city_code"]
-                                    }
-                            }
-                },
-                {
-                "type": "function",
-                "function": {
-                    "name": "search_location",
-                    "description": "Search for a location using a text query. Returns the top match with name, address, place_id, and coordinates.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {"type": "string", "description": "Free text search query, e.g., 'Nairobi National Park'."}
-                        },
-                        "required": ["query"],
-                    },
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_location_details",
-                    "description": "Given a Google place_id, return detailed information including photos and coordinates.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "place_id": {"type": "string", "description": "Google Place ID."}
-                        },
-                        "required": ["place_id"],
-                    },
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_place_photo",
-                    "description": "Return a Google Maps Place Photo URL given a photo_reference.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "photo_reference": {"type": "string", "description": "Google photo_reference returned by place details."},
-                            "max_width": {"type": "integer", "description": "Maximum width of the photo in pixels.", "default": 800},
-                        },
-                        "required": ["photo_reference"],
-                    },
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_street_view_image",
-                    "description": "Return a Google Street View image URL for given coordinates.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "lat": {"type": "number"},
-                            "lng": {"type": "number"},
-                            "width": {"type": "integer", "description": "Image width in px", "default": 600},
-                            "height": {"type": "integer", "description": "Image height in px", "default": 400},
-                        },
-                        "required": ["lat", "lng"],
-                    },
-                }
-            }, 
-            {
-                "type": "function",
-                "function": {
-                    "name": "search_nearby_places",
-                    "description": "Search for nearby points of interest using coordinates, keyword or place type. Useful for queries like 'find 5-star hotels near Nairobi'.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "lat": {"type": "number", "description": "Latitude of the center location"},
-                            "lng": {"type": "number", "description": "Longitude of the center location"},
-                            "radius": {"type": "integer", "description": "Search radius in meters", "default": 3000},
-                            "keyword": {"type": "string", "description": "Search keyword filter", "nullable": True},
-                            "place_type": {"type": "string", "description": "Google Maps place type filter (e.g. 'restaurant', 'hotel')", "nullable": True}
-                        },
-                        "required": ["lat", "lng"]
-                    }
-                }
-            },
-
-],
+        instructions=ASSISTANT_INSTRUCTIONS,
+        tools=assistant_tools(),
         model="gpt-4-1106-preview",
         file_ids=[file.id],
     )
     return assistant
 
 
-# Use context manager to ensure the shelf file is closed properly
+# Both legacy shelve stores are imported into the thread store on first use
 def check_if_thread_exists(wa_id):
-    with shelve.open("threads_db") as threads_shelf:
-        return threads_shelf.get(wa_id, None)
+    return get_thread_store().get(wa_id)
 
 
 def store_thread(wa_id, thread_id):
-    with shelve.open("threads_db", writeback=True) as threads_shelf:
-        threads_shelf[wa_id] = thread_id
+    get_thread_store().set(wa_id, thread_id)
 
 
 '''def run_assistant(thread, name):
@@ -356,38 +242,163 @@ def store_thread(wa_id, thread_id):
 
 '''
 
-def check_thread_size_and_manage(thread_id, wa_id):
-    """Check thread size and manage it to prevent rate limit issues."""
-    try:
-        # Get message count to estimate thread size
-        messages = client.beta.threads.messages.list(thread_id=thread_id, limit=100)
-        message_count = len(messages.data)
-        
-        # If thread has more than 50 messages, create a new one to prevent token limit issues
-        if message_count > 50:
-            logging.info(f"Thread {thread_id} has {message_count} messages. Creating new thread to prevent rate limits.")
-            new_thread = client.beta.threads.create()
-            with shelve.open(THREAD_DB, writeback=True) as db:
-                db[wa_id] = new_thread.id
-            logging.info(f"Created new thread {new_thread.id} for user {wa_id}")
-            return new_thread.id
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), good enough for the thread budget."""
+    return len(text or "") // 4 + 1
+
+def check_thread_size_and_manage(thread_id, wa_id, deadline=None):
+    """
+    Compact the thread once the locally tracked size passes the budget.
+    Uses the counters in the thread store, so no API call is made on the common path.
+    """
+    store = get_thread_store()
+    record = store.get_record(wa_id)
+    if record is None or record["thread_id"] != thread_id:
+        return thread_id
+    if not record.get("synced", 1) and not is_local_thread(thread_id):
+        # Migrated threads start with zero counters and no mirror; read their history once from the API
+        try:
+            history = list_thread_messages(thread_id)
+            store.replace_messages(thread_id, history)
+            store.mark_synced(wa_id, thread_id, len(history), sum(estimate_tokens(m["content"]) for m in history))
+            metrics.incr("thread.synced")
+            record = store.get_record(wa_id)
+        except Exception as e:
+            logging.warning(f"Error reading history of thread {thread_id}: {e}")
+    if record["token_count"] <= THREAD_TOKEN_BUDGET and record["message_count"] <= THREAD_MAX_MESSAGES:
         return thread_id
+
+    logging.info(
+        f"Thread {thread_id} has {record['message_count']} messages (~{record['token_count']} tokens). Compacting."
+    )
+    try:
+        return compact_thread(wa_id, thread_id, deadline)
     except Exception as e:
-        logging.warning(f"Error checking thread size: {e}. Continuing with existing thread.")
+        logging.warning(f"Error compacting thread: {e}. Continuing with existing thread.")
         return thread_id
 
-def generate_response(message_body, wa_id, name):
+def list_thread_messages(thread_id, limit=THREAD_HISTORY_LIMIT):
+    """
+    The most recent `limit` text messages of an API thread, oldest first, as
+    {message_id, run_id, role, content} dicts. Pages newest first, so long threads
+    keep their latest turns rather than their first ones.
+    """
+    messages, after = [], None
+    while len(messages) < limit:
+        count_api_call("threads.messages.list")
+        page = client.beta.threads.messages.list(
+            thread_id=thread_id, limit=min(100, limit - len(messages)), order="desc",
+            **({"after": after} if after else {}),
+        )
+        for message in page.data:
+            text = message_text(message)
+            if text:
+                messages.append({"message_id": message.id, "run_id": message.run_id,
+                                 "role": message.role, "content": text})
+        if not page.has_more or not page.data:
+            break
+        after = page.data[-1].id
+    messages.reverse()
+    return messages
+
+def fetch_thread_turns(thread_id, mirrored=True):
+    """
+    The thread's text messages, oldest first, as (role, text) pairs. Read from the local
+    mirror when it holds the whole thread (mirrored); otherwise listed from the API.
+    """
+    if mirrored or is_local_thread(thread_id):
+        return [(message["role"], message["content"]) for message in get_thread_store().get_messages(thread_id)]
+    return [(message["role"], message["content"]) for message in list_thread_messages(thread_id)]
+
+def summarize_turns(turns, deadline=None):
+    """Condense conversation turns into a short synopsis with one chat completion."""
+    timeout = SUMMARY_TIMEOUT_SECONDS if deadline is None else deadline.cap(SUMMARY_TIMEOUT_SECONDS)
+    transcript = "\n".join(f"{role}: {text}" for role, text in turns)
+    with metrics.timed("thread.summarize"):
+        count_api_call("chat.completions.create")
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "Summarize this conversation between a traveler and a travel assistant in at most "
+                    "150 words. Keep names, destinations, dates, budgets, party size, preferences and "
+                    "any options already suggested or chosen. Write it as notes for the assistant."
+                )},
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=300,
+            timeout=timeout,
+        )
+    return response.choices[0].message.content.strip()
+
+def compact_thread(wa_id, thread_id, deadline=None):
+    """
+    Start a new thread from a synopsis of the older turns plus the most recent turns verbatim,
+    and point wa_id at it. Returns the new thread id. The new thread belongs to the active
+    engine, which is also how a conversation is carried over when the engine is switched.
+    """
+    store = get_thread_store()
+    # Only a thread created (or synced) by this store has every message in the mirror
+    record = store.get_record(wa_id)
+    mirrored = record is not None and record["thread_id"] == thread_id and bool(record.get("synced", 1))
+    turns = fetch_thread_turns(thread_id, mirrored)
+    recent = turns[-THREAD_KEEP_RECENT_MESSAGES:] if THREAD_KEEP_RECENT_MESSAGES > 0 else []
+    older = turns[:len(turns) - len(recent)]
+
+    messages = []
+    if older:
+        synopsis = summarize_turns(older, deadline)
+        messages.append({"role": "assistant", "content": f"Summary of our conversation so far: {synopsis}"})
+    messages.extend({"role": role, "content": text} for role, text in recent)
+
+    if CONVERSATION_ENGINE == "chat":
+        new_thread_id = new_local_thread_id()
+    else:
+        count_api_call("threads.create")
+        new_thread_id = client.beta.threads.create(messages=messages).id
+    store.set(wa_id, new_thread_id)
+    for message in messages:
+        store.add_message(new_thread_id, message["role"], message["content"])
+    store.delete_messages(thread_id)
+    store.record_messages(wa_id, len(messages), sum(estimate_tokens(m["content"]) for m in messages))
+    metrics.incr("thread.compacted")
+    logging.info(
+        f"Compacted thread {thread_id} ({len(turns)} turns) into {new_thread_id} for user {wa_id}"
+    )
+    return new_thread_id
+
+def generate_response(message_body, wa_id, name, deadline=None):
+    """
+    Add the user's message to their thread, run the assistant and return its reply.
+    All stages share one Deadline, so the reply is produced (or abandoned) within the budget.
+    """
+    if deadline is None:
+        deadline = Deadline(RESPONSE_DEADLINE_SECONDS)
+    engine = _generate_chat_response if CONVERSATION_ENGINE == "chat" else _generate_response
+    metrics.incr(f"engine.{CONVERSATION_ENGINE}.messages")
+    try:
+        with metrics.timed(f"engine.{CONVERSATION_ENGINE}.response"):
+            return engine(message_body, wa_id, name, deadline)
+    except (DeadlineExceeded, APITimeoutError) as e:
+        if not isinstance(e, DeadlineExceeded) and not deadline.expired():
+            raise
+        metrics.incr("deadline.exceeded")
+        logging.warning(f"Giving up on message from {wa_id}: {e}")
+        return "Sorry, this is taking longer than expected. Please try again in a moment."
+
+def _generate_response(message_body, wa_id, name, deadline):
     thread_id = get_or_create_thread_for_user(wa_id)
+
+    if is_local_thread(thread_id):
+        # The conversation so far ran on the chat engine; move it onto an Assistants thread
+        thread_id = compact_thread(wa_id, thread_id, deadline)
+    else:
+        # Check thread size and manage it to prevent rate limit issues
+        thread_id = check_thread_size_and_manage(thread_id, wa_id, deadline)
     
-    # Check thread size and manage it to prevent rate limit issues
-    thread_id = check_thread_size_and_manage(thread_id, wa_id)
-    
-    #Check for active threads
-    active_runs = client.beta.threads.runs.list(thread_id=thread_id)
-    for run in active_runs.data:
-        if run.status in ["in_progress", "queued", "requires_action"]:
-            logging.info(f"Active run {run.id} found. Waiting for it to finish...")
-            wait_for_run_completion(thread_id, run.id)
+    # Messages from one user are handled one at a time (see per_user_queue), so the thread
+    # normally has no active run here. Another worker process can still have started one;
+    # that case surfaces as an error from messages.create / runs.create and is waited out there.
 
     '''
     # Check if there is already a thread_id for the wa_id
@@ -422,17 +433,22 @@ def generate_response(message_body, wa_id, name):
     message = None
     
     for attempt in range(max_retries):
+        deadline.check("message creation")
         try:
+            count_api_call("threads.messages.create")
             message = client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role="user",
                 content=message_body,
+                timeout=deadline.remaining(),
             )
             break
         except Exception as e:
-            if "rate_limit" in str(e).lower() and attempt < max_retries - 1:
+            if is_active_run_error(e) and attempt < max_retries - 1:
+                wait_for_active_runs(thread_id, deadline)
+            elif "rate_limit" in str(e).lower() and attempt < max_retries - 1:
                 logging.warning(f"Rate limit when adding message (attempt {attempt + 1}). Waiting {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                deadline.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
             else:
                 raise
@@ -440,46 +456,295 @@ def generate_response(message_body, wa_id, name):
     if message is None:
         return "I'm experiencing high demand. Please try again in a moment."
 
-    # Run the assistant with retry logic for rate limits
+    store = get_thread_store()
+    store.add_message(thread_id, "user", message_body, message.id)
+    store.record_messages(wa_id, tokens=estimate_tokens(message_body))
+
+    final_run = None
+    if OPENAI_RUN_MODE == "stream":
+        final_run, assistant_reply = run_assistant_streaming(thread_id, deadline)
+
+    # Polling mode, or the stream could not start a run
+    if final_run is None:
+        started = time.perf_counter()
+        run = create_run_with_retries(thread_id, deadline, max_retries)
+        if run is None:
+            return "I'm experiencing high demand. Please try again in a moment."
+
+        # Wait for run to complete and process any tool calls
+        final_run, assistant_reply = wait_for_run_completion_and_get_response(thread_id, run.id, deadline)
+        # The reply only becomes visible once the run has finished, so first token == total
+        record_run_timing("poll", run.id, started, time.perf_counter())
+
+    # If we got a rate limit error, handle it by creating a new thread
+    if final_run.status == "failed" and hasattr(final_run, 'last_error') and final_run.last_error:
+        error_code = getattr(final_run.last_error, 'code', None)
+        if error_code == "rate_limit_exceeded" or "rate_limit" in str(getattr(final_run.last_error, 'message', '')).lower():
+            # Create new thread for future requests
+            new_thread_id, fallback_message = handle_rate_limit_error(wa_id, thread_id, str(final_run.last_error.message))
+            # Return user-friendly message
+            return fallback_message
+
+    if final_run.status == "completed":
+        get_thread_store().record_messages(wa_id, tokens=estimate_tokens(assistant_reply))
+
+    return assistant_reply
+
+def _generate_chat_response(message_body, wa_id, name, deadline):
+    """
+    Chat completions engine: the history lives in the thread store and each message costs
+    one chat completion per tool round, with no thread, run or polling requests.
+    """
+    store = get_thread_store()
+    thread_id = store.get(wa_id)
+    if thread_id is None:
+        thread_id = store.set_if_absent(wa_id, new_local_thread_id())
+        logging.info(f"Started local conversation for {wa_id}: {thread_id}")
+    elif not is_local_thread(thread_id):
+        # The conversation so far ran on an Assistants thread; carry it over from the mirror
+        thread_id = compact_thread(wa_id, thread_id, deadline)
+    else:
+        thread_id = check_thread_size_and_manage(thread_id, wa_id, deadline)
+
+    messages = [{"role": "system", "content": ASSISTANT_INSTRUCTIONS}]
+    messages.extend(chat_history(store.get_messages(thread_id), CHAT_CONTEXT_TOKENS))
+    messages.append({"role": "user", "content": message_body})
+    store.add_message(thread_id, "user", message_body)
+    store.record_messages(wa_id, tokens=estimate_tokens(message_body))
+
+    assistant_reply = run_chat_completion(messages, deadline)
+    store.add_message(thread_id, "assistant", assistant_reply)
+    store.record_messages(wa_id, tokens=estimate_tokens(assistant_reply))
+    return assistant_reply
+
+def chat_history(turns, budget):
+    """The most recent turns that fit in the token budget, oldest first, as chat messages."""
+    history = []
+    for turn in reversed(turns):
+        budget -= estimate_tokens(turn["content"])
+        if budget < 0:
+            break
+        history.append({"role": turn["role"], "content": turn["content"]})
+    history.reverse()
+    return history
+
+def run_chat_completion(messages, deadline):
+    """
+    Call chat completions until the model answers without tool calls. Requested tools run
+    concurrently like a run's tool calls; after CHAT_MAX_TOOL_ROUNDS the model must answer.
+    """
+    for round_index in range(CHAT_MAX_TOOL_ROUNDS + 1):
+        deadline.check("chat completion")
+        count_api_call("chat.completions.create")
+        with metrics.timed("chat.completion"):
+            response = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                tools=FUNCTION_TOOLS,
+                tool_choice="auto" if round_index < CHAT_MAX_TOOL_ROUNDS else "none",
+                timeout=deadline.remaining(),
+            )
+        message = response.choices[0].message
+        if not message.tool_calls:
+            return (message.content or "").strip()
+
+        logging.info(f"Chat completion requested {len(message.tool_calls)} tool calls (round {round_index + 1})")
+        messages.append({
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": [
+                {"id": tool.id, "type": "function",
+                 "function": {"name": tool.function.name, "arguments": tool.function.arguments}}
+                for tool in message.tool_calls
+            ],
+        })
+        for output in execute_tool_calls(message.tool_calls, deadline):
+            messages.append({"role": "tool", "tool_call_id": output["tool_call_id"], "content": output["output"]})
+
+    return "I apologize, but I couldn't generate a response. Please try again."
+
+def create_run_with_retries(thread_id, deadline, max_retries=3):
+    """Create a run on the thread, backing off on rate limits. Returns None if no run was created."""
     run = None
     retry_delay = 2
     for attempt in range(max_retries):
+        deadline.check("run creation")
         try:
+            count_api_call("threads.runs.create")
             run = client.beta.threads.runs.create(
                 thread_id=thread_id,
                 assistant_id=OPENAI_ASSISTANT_ID,
+                timeout=deadline.remaining(),
             )
             break
         except Exception as e:
-            if "rate_limit" in str(e).lower() and attempt < max_retries - 1:
+            if is_active_run_error(e) and attempt < max_retries - 1:
+                wait_for_active_runs(thread_id, deadline)
+            elif "rate_limit" in str(e).lower() and attempt < max_retries - 1:
                 logging.warning(f"Rate limit when creating run (attempt {attempt + 1}). Waiting {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                deadline.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
             else:
                 raise
-    
-    if run is None:
-        return "I'm experiencing high demand. Please try again in a moment."
+    return run
 
-    # Wait for run to complete and process any tool calls
-    final_run, assistant_reply = wait_for_run_completion_and_get_response(thread_id, run.id)
-    
-    # If we got a rate limit error, handle it by creating a new thread
-    if final_run.status == "failed" and hasattr(final_run, 'last_error') and final_run.last_error:
-        error_code = getattr(final_run.last_error, 'code', None)
-        if error_code == "rate_limit_exceeded" or "rate_limit" in str(getattr(final_run.last_error, 'message', '')).lower():
-            # Create new thread for future requests
-            new_thread_id, fallback_message = handle_rate_limit_error(wa_id, thread_id, str(final_run.last_error.message))
-            # Return user-friendly message
-            return fallback_message
+def is_active_run_error(error):
+    """True for the API error returned when a thread already has a run in progress."""
+    message = str(error).lower()
+    return "while a run" in message or "already has an active run" in message
 
-    return assistant_reply
+def wait_for_active_runs(thread_id, deadline):
+    """
+    Wait out runs started on the thread by another process. Only called after the API
+    reported an active run, so the common path never pays for the runs.list call.
+    """
+    metrics.incr("run.active_run_conflicts")
+    count_api_call("threads.runs.list")
+    active_runs = client.beta.threads.runs.list(thread_id=thread_id, limit=5)
+    for run in active_runs.data:
+        if run.status in ACTIVE_RUN_STATUSES:
+            logging.info(f"Active run {run.id} found. Waiting for it to finish...")
+            wait_for_foreign_run(thread_id, run.id, deadline)
+
+def wait_for_foreign_run(thread_id, run_id, deadline):
+    """
+    Poll a run started by another process until it is no longer active. Its tool calls
+    belong to that process, so unlike wait_for_run_completion this never answers them.
+    Gives up quietly at the deadline; the caller's next deadline check reports it.
+    """
+    intervals = backoff_intervals(POLL_INITIAL_INTERVAL, POLL_MAX_INTERVAL)
+    while True:
+        count_api_call("threads.runs.retrieve")
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        metrics.incr("run.poll.requests")
+        if run.status not in ACTIVE_RUN_STATUSES:
+            return run
+        if not deadline.sleep(next(intervals)):
+            return run
+
+def record_run_timing(mode, run_id, started, finished, first_token=None):
+    """Record total run time and time-to-first-token for a run mode ("stream" or "poll")."""
+    if first_token is None:
+        first_token = finished
+    metrics.observe(f"run.{mode}.total", finished - started)
+    metrics.observe(f"run.{mode}.first_token", first_token - started)
+    logging.info(
+        f"Run {run_id} ({mode}) finished in {finished - started:.2f}s, "
+        f"first token after {first_token - started:.2f}s"
+    )
+
+def cancel_run(thread_id, run_id):
+    """Best-effort cancel, so an abandoned run does not block the next message on the thread."""
+    try:
+        count_api_call("threads.runs.cancel")
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        logging.info(f"Cancelled run {run_id}")
+    except Exception as e:
+        logging.warning(f"Could not cancel run {run_id}: {e}")
+
+def run_assistant_streaming(thread_id, deadline):
+    """
+    Run the assistant on the thread using the Assistants event stream.
+    Tool calls are executed as soon as the requires_action event arrives, without any polling.
+    Returns (final_run, assistant_reply), or (None, None) if the stream could not start a run.
+    """
+    started = time.perf_counter()
+    first_token = None
+    run_id = None
+    final_run = None
+    assistant_reply = None
+
+    try:
+        count_api_call("threads.runs.stream")
+        manager = client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=OPENAI_ASSISTANT_ID,
+            timeout=deadline.remaining(),
+        )
+        while manager is not None:
+            pending_tool_outputs = None
+            with manager as stream:
+                for event in stream:
+                    if event.event == "thread.run.created":
+                        run_id = event.data.id
+
+                    elif event.event == "thread.message.delta" and first_token is None:
+                        first_token = time.perf_counter()
+
+                    elif event.event == "thread.message.completed":
+                        text = message_text(event.data)
+                        if event.data.role == "assistant" and text:
+                            assistant_reply = text
+                            # Mirror the reply so nothing has to be fetched once the run completes
+                            get_thread_store().add_message(thread_id, "assistant", text, event.data.id, run_id)
 
-def wait_for_run_completion(thread_id, run_id, poll_interval=2, timeout = 60):
-    """Wait for a run to complete, handling tool calls if needed. Returns the completed run."""
-    start_time = time.time()
+                    elif event.event == "thread.run.requires_action":
+                        # The run pauses here; the stream ends after this event
+                        run = event.data
+                        logging.info(f"Run {run.id} requires action. Processing tool calls from stream...")
+                        pending_tool_outputs = execute_tool_calls(
+                            run.required_action.submit_tool_outputs.tool_calls, deadline
+                        )
+
+                    elif event.event in ("thread.run.completed", "thread.run.failed", "thread.run.cancelled",
+                                         "thread.run.expired", "thread.run.incomplete"):
+                        final_run = event.data
+
+                    if deadline.expired() and final_run is None:
+                        if run_id is not None:
+                            cancel_run(thread_id, run_id)
+                        raise DeadlineExceeded(f"Deadline of {deadline.seconds}s exceeded during streaming run")
+
+            manager = None
+            if pending_tool_outputs is not None:
+                count_api_call("threads.runs.submit_tool_outputs_stream")
+                manager = client.beta.threads.runs.submit_tool_outputs_stream(
+                    thread_id=thread_id,
+                    run_id=run_id,
+                    tool_outputs=pending_tool_outputs,
+                    timeout=deadline.remaining(),
+                )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if deadline.expired():
+            raise DeadlineExceeded(f"Deadline of {deadline.seconds}s exceeded during streaming run") from e
+        logging.warning(f"Streaming run failed ({e}). Falling back to polling.")
+        if run_id is None:
+            return None, None
+        # The run exists already, so keep waiting on it by polling
+        final_run, assistant_reply = wait_for_run_completion_and_get_response(thread_id, run_id, deadline)
+        record_run_timing("poll", run_id, started, time.perf_counter())
+        return final_run, assistant_reply
+
+    if final_run is None:
+        if run_id is None:
+            return None, None
+        logging.warning(f"Stream for run {run_id} ended without a final status. Falling back to polling.")
+        final_run, assistant_reply = wait_for_run_completion_and_get_response(thread_id, run_id, deadline)
+        record_run_timing("poll", run_id, started, time.perf_counter())
+        return final_run, assistant_reply
+
+    record_run_timing("stream", final_run.id, started, time.perf_counter(), first_token)
+
+    if final_run.status == "completed" and assistant_reply:
+        return final_run, assistant_reply
+
+    # Failed runs and completed runs without text go through the usual error/retrieval handling
+    return wait_for_run_completion_and_get_response(thread_id, final_run.id, deadline)
+
+def wait_for_run_completion(thread_id, run_id, deadline=None):
+    """
+    Wait for a run to complete, handling tool calls if needed. Returns the completed run.
+    Polls quickly at first and backs off exponentially (with jitter), within the message deadline.
+    """
+    if deadline is None:
+        deadline = Deadline(RESPONSE_DEADLINE_SECONDS)
+    intervals = backoff_intervals(POLL_INITIAL_INTERVAL, POLL_MAX_INTERVAL)
     while True:
+        count_api_call("threads.runs.retrieve")
         run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        metrics.incr("run.poll.requests")
         status = run.status
         logging.info(f"Run {run_id} current status: {status}")
 
@@ -487,52 +752,58 @@ def wait_for_run_completion(thread_id, run_id, poll_interval=2, timeout = 60):
             # Process tool calls and continue waiting for completion
             logging.info(f"Run {run_id} requires action. Processing tool calls...")
             try:
-                run, _ = process_tools_calls(thread_id, run)
-                # After submitting tool outputs, the run will continue processing
-                # Add a small delay to allow the run to transition back to in_progress
-                time.sleep(1)
-                # Continue polling to wait for the run to complete after tool execution
+                run, _ = process_tools_calls(thread_id, run, deadline)
+                # The run resumes right after the tool outputs are submitted, so start polling fast again
+                intervals = backoff_intervals(POLL_INITIAL_INTERVAL, POLL_MAX_INTERVAL)
                 continue
             except Exception as e:
                 logging.error(f"Error processing tool calls for run {run_id}: {e}")
                 import traceback
                 logging.error(traceback.format_exc())
                 # Re-retrieve the run to check if it failed
+                count_api_call("threads.runs.retrieve")
                 run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
                 if run.status == "failed":
                     return run
-                # If not failed, continue waiting
-                continue
+                # If not failed, retry after the usual backoff, within the deadline
 
-        elif status in ["completed", "failed", "cancelled"]:
+        elif status in ["completed", "failed", "cancelled", "expired", "incomplete"]:
             return run
-        
-        elif status == "queued" or status == "in_progress":
-            if time.time() - start_time > timeout:
-                raise TimeoutError(f"Run {run_id} timed out waiting for completion.")
-            time.sleep(poll_interval)
-        
-        else:
+
+        if status not in ("queued", "in_progress", "cancelling", "requires_action"):
             logging.warning(f"Unexpected run status: {status}")
-            time.sleep(poll_interval)
+
+        if not deadline.sleep(next(intervals)):
+            cancel_run(thread_id, run_id)
+            raise DeadlineExceeded(f"Run {run_id} did not complete within {deadline.seconds}s.")
 
 def handle_rate_limit_error(wa_id, thread_id, error_message):
-    """Handle rate limit errors by creating a new thread and returning a user-friendly message."""
-    logging.warning(f"Rate limit error detected. Creating new thread for user {wa_id}")
+    """
+    Handle rate limit errors by moving the user to a compacted thread (synopsis plus recent turns),
+    or to an empty one if compaction fails, and return a user-friendly message.
+    """
+    logging.warning(f"Rate limit error detected. Compacting thread for user {wa_id}")
+    try:
+        new_thread_id = compact_thread(wa_id, thread_id)
+        return new_thread_id, "I've condensed our conversation so I can keep helping you. Please try your request again."
+    except Exception as e:
+        logging.warning(f"Could not compact thread {thread_id}: {e}. Starting a new one.")
     try:
         # Create a new thread for the user
+        count_api_call("threads.create")
         new_thread = client.beta.threads.create()
-        with shelve.open(THREAD_DB, writeback=True) as db:
-            db[wa_id] = new_thread.id
+        get_thread_store().set(wa_id, new_thread.id)
         logging.info(f"Created new thread {new_thread.id} for user {wa_id}")
         return new_thread.id, "I've started a new conversation to continue helping you. Please try your request again."
     except Exception as e:
         logging.error(f"Failed to create new thread: {e}")
         return thread_id, "I'm experiencing high demand right now. Please try again in a moment."
 
-def wait_for_run_completion_and_get_response(thread_id, run_id, poll_interval=2, timeout=60):
+def wait_for_run_completion_and_get_response(thread_id, run_id, deadline=None):
     """Wait for run completion and return the most recent assistant message."""
-    final_run = wait_for_run_completion(thread_id, run_id, poll_interval, timeout)
+    if deadline is None:
+        deadline = Deadline(RESPONSE_DEADLINE_SECONDS)
+    final_run = wait_for_run_completion(thread_id, run_id, deadline)
     
     if final_run.status != "completed":
         # Get detailed error information
@@ -561,86 +832,299 @@ def wait_for_run_completion_and_get_response(thread_id, run_id, poll_interval=2,
         # Even if the run failed, try to get any message that might have been created
         # Sometimes a partial response exists before the failure
         logging.info(f"Attempting to retrieve message despite run failure...")
-        try:
-            messages = client.beta.threads.messages.list(thread_id=thread_id, limit=5)
-            for message in messages.data:
-                if message.role == "assistant" and message.content:
-                    for content_item in message.content:
-                        if hasattr(content_item, 'text') and content_item.text:
-                            reply = content_item.text.value
-                            if reply and reply.strip():
-                                logging.info(f"Found partial response despite run failure")
-                                return final_run, reply
-        except Exception as e:
-            logging.warning(f"Could not retrieve partial message: {e}")
-        
+        reply = get_run_reply(thread_id, run_id, deadline, attempts=1)
+        if reply:
+            logging.info(f"Found partial response despite run failure")
+            return final_run, reply
+
         # If no message found, return error
         return final_run, f"I encountered an error processing your request. {error_message}"
-    
-    # Retry mechanism to get the message (sometimes it takes a moment to be created)
-    max_retries = 5
-    retry_delay = 0.5
-    for attempt in range(max_retries):
-        if attempt > 0:
-            time.sleep(retry_delay)
-            logging.info(f"Retrying message retrieval (attempt {attempt + 1}/{max_retries})")
-    
-        # Try to get the message ID from run steps first (more reliable)
+
+    assistant_reply = get_run_reply(thread_id, run_id, deadline)
+    if assistant_reply:
+        return final_run, assistant_reply
+
+    logging.error(f"No assistant message found in thread after run completion")
+    return final_run, "I apologize, but I couldn't generate a response. Please try again."
+
+def message_text(message):
+    """The text content of an API message object, or an empty string."""
+    return " ".join(
+        item.text.value for item in message.content or [] if hasattr(item, "text") and item.text
+    ).strip()
+
+def get_run_reply(thread_id, run_id, deadline, attempts=3):
+    """
+    The assistant reply produced by a run. Served from the local message mirror when the
+    stream already delivered it; otherwise one messages.list filtered to the run, retried
+    briefly in case the message is not visible yet. Fetched replies are mirrored.
+    """
+    store = get_thread_store()
+    reply = store.get_run_reply(thread_id, run_id)
+    if reply:
+        metrics.incr("mirror.reply_hit")
+        return reply
+
+    intervals = backoff_intervals(POLL_INITIAL_INTERVAL, POLL_MAX_INTERVAL)
+    for attempt in range(attempts):
+        if attempt > 0 and not deadline.sleep(next(intervals)):
+            break
         try:
-            run_steps = client.beta.threads.runs.steps.list(thread_id=thread_id, run_id=run_id, limit=20)
-            # Steps are in reverse chronological order, so we need to find the message_creation step
-            for step in run_steps.data:
-                if hasattr(step, 'step_details'):
-                    step_details = step.step_details
-                    # Check for message creation step
-                    if hasattr(step_details, 'message_creation'):
-                        message_id = step_details.message_creation.message_id
-                        # Retrieve the specific message
-                        message = client.beta.threads.messages.retrieve(thread_id=thread_id, message_id=message_id)
-                        if message.role == "assistant" and message.content:
-                            if len(message.content) > 0:
-                                # Handle different content types
-                                content_item = message.content[0]
-                                if hasattr(content_item, 'text') and content_item.text:
-                                    assistant_reply = content_item.text.value
-                                    if assistant_reply and assistant_reply.strip():
-                                        logging.info(f"Assistant reply retrieved from run step (message_id: {message_id}): {assistant_reply[:100]}...")
-                                        return final_run, assistant_reply
+            count_api_call("threads.messages.list")
+            messages = client.beta.threads.messages.list(
+                thread_id=thread_id, run_id=run_id, limit=10, timeout=deadline.remaining()
+            )
+            metrics.incr("mirror.reply_fetch")
+            # Newest first; mirror in chronological order
+            for message in reversed(messages.data):
+                text = message_text(message)
+                if message.role == "assistant" and text:
+                    store.add_message(thread_id, "assistant", text, message.id, run_id)
+                    reply = text
+            if reply:
+                logging.info(f"Assistant reply for run {run_id} retrieved: {reply[:100]}...")
+                return reply
         except Exception as e:
-            logging.warning(f"Could not retrieve message from run steps (attempt {attempt + 1}): {e}")
-            if attempt == max_retries - 1:
-                import traceback
-                logging.debug(traceback.format_exc())
+            logging.warning(f"Could not retrieve reply for run {run_id} (attempt {attempt + 1}): {e}")
+    return None
+
+def tool_time_left(deadline=None):
+    """Seconds a tool that starts now has before execute_tool_calls stops waiting for it."""
+    return TOOL_TIMEOUT_SECONDS if deadline is None else deadline.cap(TOOL_TIMEOUT_SECONDS)
+
+def run_tool_call(tool, deadline=None):
+    """
+    Execute a single tool call requested by a run and return its result.
+    Errors are returned as the result rather than raised.
+    """
+    started = time.perf_counter()
+    try:
+        # Don't start another upstream call once the message deadline has passed
+        if deadline is not None and deadline.expired():
+            result = {"error": "Tool skipped: the response deadline was reached."}
+
+        #Weather tool
+        elif tool.function.name == "get_weather":
+            args = json.loads(tool.function.arguments)
+            city = args.get("city_name") or args.get("city")
+            logging.info(f"Weather tool called for city: {city}")
+            result = get_weather(city)
+
+        #Flight search tool
+        elif tool.function.name == "get_flight_offers":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Flight offers requested: {args}")
+            result = get_flight_offers(
+                origin=args["origin"],
+                destination=args["destination"],
+                departure_date=args["departure_date"],
+                return_date=args.get("return_date"),
+                adults=args.get("adults", 1)
+            )
+
+        # Paging and re-sorting of an earlier flight search
+        elif tool.function.name == "get_more_flight_offers":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"More flight offers requested: {args}")
+            result = get_more_flight_offers(
+                args["search_id"],
+                page=args.get("page", 1),
+                sort_by=args.get("sort_by", "price"),
+                max_stops=args.get("max_stops"),
+            )
+
+        # Cheapest days to fly across a date range
+        elif tool.function.name == "get_fare_calendar":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Fare calendar requested: {args}")
+            result = get_fare_calendar(
+                args["origin"],
+                args["destination"],
+                args["start_date"],
+                days=args.get("days", 7),
+                trip_length_days=args.get("trip_length_days"),
+                adults=args.get("adults", 1),
+                # Return the dates found so far while the tool output can still be submitted
+                deadline=Deadline(max(0.0, tool_time_left(deadline) - 0.5)),
+            )
+
+        #Hotel search tool
+        elif tool.function.name == "get_hotels":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Hotels requested for city code: {args.get('city_code')}")
+            result = get_hotels(
+                args["city_code"],
+                adults=args.get("adults", 1),
+                check_in_date=args.get("check_in_date"),
+                check_out_date=args.get("check_out_date"),
+            )
         
-        # Fallback: Get the most recent messages (they are returned in reverse chronological order)
-        try:
-            messages = client.beta.threads.messages.list(thread_id=thread_id, limit=10)
-            
-            # Find the most recent assistant message that belongs to this run
-            # Messages are ordered newest first, so we look for the first assistant message
-            for message in messages.data:
-                if message.role == "assistant":
-                    # Check if message has content
-                    if message.content and len(message.content) > 0:
-                        # Handle different content types - iterate through content items
-                        for content_item in message.content:
-                            # Check if it's a text message (not just tool calls)
-                            if hasattr(content_item, 'text') and content_item.text:
-                                assistant_reply = content_item.text.value
-                                if assistant_reply and assistant_reply.strip():  # Ensure it's not empty
-                                    logging.info(f"Assistant reply retrieved from message list (message_id: {message.id}): {assistant_reply[:100]}...")
-                                    return final_run, assistant_reply
-        except Exception as e:
-            logging.error(f"Error retrieving messages (attempt {attempt + 1}): {e}")
-            if attempt == max_retries - 1:
-                import traceback
-                logging.debug(traceback.format_exc())
-    
-    # Fallback if no assistant message found after all retries
-    logging.error(f"No assistant message found in thread after run completion (tried {max_retries} times)")
-    return final_run, "I apologize, but I couldn't generate a response. Please try again."
-   
-def process_tools_calls(thread_id, run):
+        #Location Search
+        elif tool.function.name == "search_location":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Location search requested: {args}")
+            result = search_location(query=args["query"])
+        
+        # Get Location Details
+        elif tool.function.name == "get_location_details":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Location details requested: {args}")
+            result = get_location_details(place_id=args["place_id"])
+        
+        #Get Place Photo
+        elif tool.function.name == "get_place_photo":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Place photo requested: {args}")
+            result = get_place_photo(
+                photo_reference=args["photo_reference"],
+                max_width=args.get("max_width", 800)
+            )
+
+        # Several place photos at once
+        elif tool.function.name == "get_place_photos":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Place photos requested: {len(args.get('photo_references', []))}")
+            result = get_place_photos(
+                photo_references=args["photo_references"],
+                max_width=args.get("max_width", 800)
+            )
+        
+        #Street View Image
+        elif tool.function.name == "get_street_view_image":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Street view requested: {args}")
+            result = get_street_view_image(
+                lat=args["lat"],
+                lng=args["lng"],
+                width=args.get("width", 600),
+                height=args.get("height", 400)
+            )
+        
+        # Search nearby places tool
+        elif tool.function.name == "search_nearby_places":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Nearby places requested: {args}")
+            result = search_nearby_places(
+                lat=args["lat"],
+                lng=args["lng"],
+                radius=args.get("radius", 3000),
+                keyword=args.get("keyword"),
+                place_type=args.get("place_type"),
+                sort_by=args.get("sort_by", "score"),
+                limit=args.get("limit")
+            )
+
+        # Day itinerary tool
+        elif tool.function.name == "plan_day_itinerary":
+            args = json.loads(tool.function.arguments)
+            logging.info(f"Itinerary requested for {len(args.get('stops', []))} stops")
+            result = plan_day_itinerary(
+                args["stops"],
+                date=args.get("date"),
+                start_time=args.get("start_time", "09:00"),
+                start_lat=args.get("start_lat"),
+                start_lng=args.get("start_lng"),
+                visit_minutes=args.get("visit_minutes", ITINERARY_VISIT_MINUTES),
+            )
+
+        else:
+            result = {"error": f"Unknown function call: {tool.function.name}"}
+            logging.warning(f"Unknown tool function: {tool.function.name}")
+
+    except Exception as e:
+        # Catch any errors during tool execution and return error result
+        error_msg = describe_error(e)
+        logging.error(f"Error executing tool {tool.function.name}: {error_msg}")
+        import traceback
+        logging.error(strip_query_strings(traceback.format_exc()))
+        result = {"error": f"Tool execution failed: {error_msg}"}
+
+    elapsed = time.perf_counter() - started
+    metrics.observe(f"tool.{tool.function.name}", elapsed)
+    logging.info(f"Tool {tool.function.name} ({tool.id}) finished in {elapsed:.2f}s")
+    return result
+
+def serialize_tool_output(tool, result):
+    """Build the output entry submitted to the run for a tool call's result."""
+    try:
+        # Ensure result can be serialized to JSON
+        if not isinstance(result, (dict, list, str, int, float, bool, type(None))):
+            result = {"error": f"Tool returned invalid result type: {type(result)}"}
+        
+        output_str = json.dumps(result)
+        return {
+            "tool_call_id": tool.id,
+            "output": output_str
+        }
+    except (TypeError, ValueError) as e:
+        # If JSON serialization fails, send error message
+        logging.error(f"Failed to serialize tool result to JSON: {e}")
+        return {
+            "tool_call_id": tool.id,
+            "output": json.dumps({"error": f"Failed to serialize result: {str(e)}"})
+        }
+
+def execute_tool_calls(tool_calls, deadline=None):
+    """
+    Execute the tool calls requested by a run concurrently and return the tool outputs to submit,
+    in the same order as tool_calls. Each step gets its own pool, so a hung tool only holds up
+    its own message. A tool that fails, runs longer than TOOL_TIMEOUT_SECONDS from when it
+    started, or is still running (or waiting for a thread) at the message deadline gets an
+    error output instead.
+    """
+    if not tool_calls:
+        return []
+    started = time.monotonic()
+    workers = min(TOOL_MAX_WORKERS, len(tool_calls))
+    # Calls beyond the pool size wait for a thread; at worst every wave before theirs runs into its timeout
+    queue_expiry = started + math.ceil(len(tool_calls) / workers) * TOOL_TIMEOUT_SECONDS
+    message_expiry = deadline.expires_at if deadline is not None else math.inf
+    start_times = {}
+
+    def run(index, tool):
+        start_times[index] = time.monotonic()
+        return run_tool_call(tool, deadline)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+    futures = {executor.submit(run, index, tool): index for index, tool in enumerate(tool_calls)}
+    results = {}
+    try:
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            expiries = {}
+            for future in pending:
+                index = futures[future]
+                expiry = start_times[index] + TOOL_TIMEOUT_SECONDS if index in start_times else queue_expiry
+                expiries[future] = min(expiry, message_expiry)
+            for future in [future for future in pending if expiries[future] <= now]:
+                pending.discard(future)
+                index = futures[future]
+                tool = tool_calls[index]
+                if future.cancel():
+                    metrics.incr("tool.cancelled")
+                    logging.warning(f"Tool {tool.function.name} ({tool.id}) cancelled before it started")
+                else:
+                    metrics.incr("tool.timeouts")
+                    logging.warning(
+                        f"Tool {tool.function.name} ({tool.id}) timed out after {now - start_times.get(index, now):.2f}s"
+                    )
+                results[index] = {"error": f"Tool {tool.function.name} timed out. Please try again later."}
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=min(expiries[future] for future in pending) - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                results[futures[future]] = future.result()
+    finally:
+        # Timed out tools finish in the background without holding anyone else's threads
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logging.info(f"Executed {len(tool_calls)} tool calls in {time.monotonic() - started:.2f}s")
+    return [serialize_tool_output(tool, results[index]) for index, tool in enumerate(tool_calls)]
+
+
+def process_tools_calls(thread_id, run, deadline=None):
     """
     Process tool calls for a run that requires action.
     Returns the updated run object (after submitting tool outputs).
@@ -656,109 +1140,7 @@ def process_tools_calls(thread_id, run):
         return run, None
 
     tool_calls = run.required_action.submit_tool_outputs.tool_calls
-    tool_outputs = []
-
-    for tool in tool_calls:
-        try:
-            #Weather tool
-            if tool.function.name == "get_weather":
-                args = json.loads(tool.function.arguments)
-                city = args.get("city_name") or args.get("city")
-                logging.info(f"Weather tool called for city: {city}")
-                result = get_weather(city)
-
-            #Flight search tool
-            elif tool.function.name == "get_flight_offers":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Flight offers requested: {args}")
-                result = get_flight_offers(
-                    origin=args["origin"],
-                    destination=args["destination"],
-                    departure_date=args["departure_date"],
-                    return_date=args.get("return_date"),
-                    adults=args.get("adults", 1)
-                )
-
-            #Hotel search tool
-            elif tool.function.name == "get_hotels":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Hotels requested for city code: {args.get('city_code')}")
-                result = get_hotels(args["city_code"])
-            
-            #Location Search
-            elif tool.function.name == "search_location":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Location search requested: {args}")
-                result = search_location(query=args["query"])
-            
-            # Get Location Details
-            elif tool.function.name == "get_location_details":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Location details requested: {args}")
-                result = get_location_details(place_id=args["place_id"])
-            
-            #Get Place Photo
-            elif tool.function.name == "get_place_photo":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Place photo requested: {args}")
-                result = get_place_photo(
-                    photo_reference=args["photo_reference"],
-                    max_width=args.get("max_width", 800)
-                )
-            
-            #Street View Image
-            elif tool.function.name == "get_street_view_image":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Street view requested: {args}")
-                result = get_street_view_image(
-                    lat=args["lat"],
-                    lng=args["lng"],
-                    width=args.get("width", 600),
-                    height=args.get("height", 400)
-                )
-            
-            # Search nearby places tool
-            elif tool.function.name == "search_nearby_places":
-                args = json.loads(tool.function.arguments)
-                logging.info(f"Nearby places requested: {args}")
-                result = search_nearby_places(
-                    lat=args["lat"],
-                    lng=args["lng"],
-                    radius=args.get("radius", 3000),
-                    keyword=args.get("keyword"),
-                    place_type=args.get("place_type")
-                )
-
-            else:
-                result = {"error": f"Unknown function call: {tool.function.name}"}
-                logging.warning(f"Unknown tool function: {tool.function.name}")
-
-        except Exception as e:
-            # Catch any errors during tool execution and return error result
-            error_msg = str(e)
-            logging.error(f"Error executing tool {tool.function.name}: {error_msg}")
-            import traceback
-            logging.error(traceback.format_exc())
-            result = {"error": f"Tool execution failed: {error_msg}"}
-
-        # Always append result, even if it's an error
-        try:
-            # Ensure result can be serialized to JSON
-            if not isinstance(result, (dict, list, str, int, float, bool, type(None))):
-                result = {"error": f"Tool returned invalid result type: {type(result)}"}
-            
-            output_str = json.dumps(result)
-            tool_outputs.append({
-                "tool_call_id": tool.id,
-                "output": output_str
-            })
-        except (TypeError, ValueError) as e:
-            # If JSON serialization fails, send error message
-            logging.error(f"Failed to serialize tool result to JSON: {e}")
-            tool_outputs.append({
-                "tool_call_id": tool.id,
-                "output": json.dumps({"error": f"Failed to serialize result: {str(e)}"})
-            })
+    tool_outputs = execute_tool_calls(tool_calls, deadline)
 
     # Submit the tool outputs
     if tool_outputs:
@@ -767,6 +1149,7 @@ def process_tools_calls(thread_id, run):
             logging.debug(f"Tool output {i+1}: tool_call_id={output['tool_call_id']}, output_length={len(output['output'])}")
         
         try:
+            count_api_call("threads.runs.submit_tool_outputs")
             client.beta.threads.runs.submit_tool_outputs(
                 thread_id=thread_id,
                 run_id=run.id,
@@ -774,6 +1157,7 @@ def process_tools_calls(thread_id, run):
             )
             logging.info(f"Tool outputs successfully submitted for run {run.id}")
             # Retrieve the updated run to get the new status
+            count_api_call("threads.runs.retrieve")
             run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
             logging.info(f"Run {run.id} status after tool submission: {run.status}")
         except Exception as e:
@@ -1,18 +1,30 @@
 import datetime as dt
 import os
-import requests
 from dotenv import load_dotenv
+from app.utils.http_client import get_session
+from app.utils.tool_cache import cached_tool, normalize_text_args
 
 load_dotenv()
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
+OPENWEATHERMAP_BASE_URL = os.getenv("OPENWEATHERMAP_BASE_URL", "http://api.openweathermap.org")
+# Fresh entries are served from the tool cache for WEATHER_CACHE_TTL seconds. After that they are
+# still served (and refreshed in the background) until WEATHER_CACHE_MAX_STALE seconds old.
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_MAX_STALE = int(os.getenv("WEATHER_CACHE_MAX_STALE", "3600"))
+WEATHER_NEGATIVE_TTL = int(os.getenv("WEATHER_NEGATIVE_TTL", "60"))
 
-def get_weather(city_name):
-    #Fetch the conditions for a specified city 
-    if not city_name:
-        return {"error": "City name required."}
 
-    base_url = f"http://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={OPENWEATHERMAP_API_KEY}&units=metric"
-    response = requests.get(base_url)
+@cached_tool(
+    "get_weather",
+    ttl=WEATHER_CACHE_TTL,
+    max_stale=WEATHER_CACHE_MAX_STALE,
+    negative_ttl=WEATHER_NEGATIVE_TTL,
+    normalize=normalize_text_args,
+)
+def fetch_weather(city_name):
+    #Fetch the conditions for a specified city
+    base_url = f"{OPENWEATHERMAP_BASE_URL}/data/2.5/weather?q={city_name}&appid={OPENWEATHERMAP_API_KEY}&units=metric"
+    response = get_session("openweathermap").get(base_url)
     data = response.json()
 
     if response.status_code == 200:
@@ -26,4 +38,15 @@ def get_weather(city_name):
             "description": weather,
         }
     else:
-        return {"error": "Could not retrieve weather data for that city."}
\ No newline at end of file
+        return {"error": "Could not retrieve weather data for that city."}
+
+
+def get_weather(city_name):
+    """
+    Current conditions for a city, cached by the normalized city name (see fetch_weather).
+    Stale entries are returned immediately while a single background refresh runs.
+    Failed lookups are cached briefly so repeated bad city names don't hit the API.
+    """
+    if not city_name:
+        return {"error": "City name required."}
+    return fetch_weather(city_name)
@@ -0,0 +1,414 @@
+import logging
+import os
+import shelve
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from app.utils.sqlite_utils import get_connection
+
+load_dotenv()
+THREAD_STORE_BACKEND = os.getenv("THREAD_STORE_BACKEND", "sqlite")
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH", "user_threads.sqlite3")
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "1024"))
+THREAD_CACHE_TTL = int(os.getenv("THREAD_CACHE_TTL", "300"))
+
+# Shelve files written by earlier versions, in order of precedence.
+# user_threads.db is the store the app has been using; threads_db is the older one.
+LEGACY_SHELVE_STORES = ("user_threads.db", "threads_db")
+
+
+class SQLiteThreadStore:
+    """
+    Maps WhatsApp ids to OpenAI thread ids in a SQLite table keyed on wa_id.
+    Uses WAL mode so several worker processes can read and write concurrently.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS threads (
+            wa_id TEXT PRIMARY KEY,
+            thread_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            token_count INTEGER NOT NULL DEFAULT 0,
+            synced INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_threads_last_used ON threads (last_used);
+        CREATE TABLE IF NOT EXISTS thread_store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS thread_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            thread_id TEXT NOT NULL,
+            message_id TEXT,
+            run_id TEXT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_thread_messages_thread ON thread_messages (thread_id, id);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_thread_messages_message_id ON thread_messages (message_id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._migrated = False
+
+    def _conn(self):
+        conn = get_connection(self.path, self.SCHEMA)
+        if not self._migrated:
+            # Stores created before token counting (or history syncing) lack the columns.
+            # Existing rows get synced = 0, so their counters are seeded from the API on next use.
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(threads)")]
+            for column in ("token_count", "synced"):
+                if column not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE threads ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+                    except sqlite3.OperationalError:
+                        pass  # added by another worker in the meantime
+            self._migrated = True
+        return conn
+
+    def get(self, wa_id):
+        row = self._conn().execute(
+            "SELECT thread_id FROM threads WHERE wa_id = ?", (wa_id,)
+        ).fetchone()
+        return row["thread_id"] if row else None
+
+    def get_record(self, wa_id):
+        row = self._conn().execute("SELECT * FROM threads WHERE wa_id = ?", (wa_id,)).fetchone()
+        return dict(row) if row else None
+
+    def set(self, wa_id, thread_id):
+        """Point wa_id at a (new) thread and reset its counters."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO threads (wa_id, thread_id, created_at, last_used, message_count, token_count, synced) "
+            "VALUES (?, ?, ?, ?, 0, 0, 1) "
+            "ON CONFLICT(wa_id) DO UPDATE SET thread_id = excluded.thread_id, "
+            "created_at = excluded.created_at, last_used = excluded.last_used, "
+            "message_count = 0, token_count = 0, synced = 1",
+            (wa_id, thread_id, now, now),
+        )
+
+    def set_if_absent(self, wa_id, thread_id, synced=True):
+        """
+        Store thread_id unless wa_id already has one. Returns the thread id that is stored.
+        synced=False marks a thread created elsewhere, whose counters are not known yet.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR IGNORE INTO threads (wa_id, thread_id, created_at, last_used, synced) VALUES (?, ?, ?, ?, ?)",
+            (wa_id, thread_id, now, now, int(synced)),
+        )
+        return self.get(wa_id)
+
+    def mark_synced(self, wa_id, thread_id, message_count, token_count):
+        """Set the counters of a thread created elsewhere from its actual messages."""
+        self._conn().execute(
+            "UPDATE threads SET message_count = ?, token_count = ?, synced = 1 WHERE wa_id = ? AND thread_id = ?",
+            (message_count, token_count, wa_id, thread_id),
+        )
+
+    def record_messages(self, wa_id, count=1, tokens=0):
+        """Add messages (and their estimated tokens) to wa_id's thread counters."""
+        self._conn().execute(
+            "UPDATE threads SET message_count = message_count + ?, token_count = token_count + ?, "
+            "last_used = ? WHERE wa_id = ?",
+            (count, tokens, time.time(), wa_id),
+        )
+
+    def get_meta(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM thread_store_meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO thread_store_meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    # Local mirror of thread messages, written as they are sent and received
+
+    def add_message(self, thread_id, role, content, message_id=None, run_id=None):
+        """Mirror a thread message. A message id that is already mirrored is ignored."""
+        self._conn().execute(
+            "INSERT OR IGNORE INTO thread_messages (thread_id, message_id, run_id, role, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (thread_id, message_id, run_id, role, content, time.time()),
+        )
+
+    def get_messages(self, thread_id):
+        """Mirrored messages of a thread, oldest first."""
+        rows = self._conn().execute(
+            "SELECT message_id, run_id, role, content FROM thread_messages WHERE thread_id = ? ORDER BY id",
+            (thread_id,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_run_reply(self, thread_id, run_id):
+        row = self._conn().execute(
+            "SELECT content FROM thread_messages WHERE thread_id = ? AND run_id = ? AND role = 'assistant' "
+            "ORDER BY id DESC LIMIT 1",
+            (thread_id, run_id),
+        ).fetchone()
+        return row["content"] if row else None
+
+    def delete_messages(self, thread_id):
+        self._conn().execute("DELETE FROM thread_messages WHERE thread_id = ?", (thread_id,))
+
+    def replace_messages(self, thread_id, messages):
+        """Replace the mirror of a thread with messages ({message_id, run_id, role, content}, oldest first)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM thread_messages WHERE thread_id = ?", (thread_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO thread_messages (thread_id, message_id, run_id, role, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(thread_id, m.get("message_id"), m.get("run_id"), m["role"], m["content"], now) for m in messages],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def message_stats(self):
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS messages, COUNT(DISTINCT thread_id) AS threads FROM thread_messages"
+        ).fetchone()
+        return dict(row)
+
+
+class MemoryThreadStore:
+    """Process-local thread store, for development and benchmarks."""
+
+    def __init__(self):
+        self._records = {}
+        self._meta = {}
+        self._messages = {}
+        self._message_ids = set()
+        self._lock = threading.Lock()
+
+    def get(self, wa_id):
+        record = self._records.get(wa_id)
+        return record["thread_id"] if record else None
+
+    def get_record(self, wa_id):
+        record = self._records.get(wa_id)
+        return dict(record) if record else None
+
+    def set(self, wa_id, thread_id):
+        now = time.time()
+        with self._lock:
+            self._records[wa_id] = {
+                "wa_id": wa_id,
+                "thread_id": thread_id,
+                "created_at": now,
+                "last_used": now,
+                "message_count": 0,
+                "token_count": 0,
+                "synced": 1,
+            }
+
+    def set_if_absent(self, wa_id, thread_id, synced=True):
+        with self._lock:
+            if wa_id not in self._records:
+                now = time.time()
+                self._records[wa_id] = {
+                    "wa_id": wa_id,
+                    "thread_id": thread_id,
+                    "created_at": now,
+                    "last_used": now,
+                    "message_count": 0,
+                    "token_count": 0,
+                    "synced": int(synced),
+                }
+            return self._records[wa_id]["thread_id"]
+
+    def mark_synced(self, wa_id, thread_id, message_count, token_count):
+        with self._lock:
+            record = self._records.get(wa_id)
+            if record and record["thread_id"] == thread_id:
+                record.update(message_count=message_count, token_count=token_count, synced=1)
+
+    def record_messages(self, wa_id, count=1, tokens=0):
+        with self._lock:
+            record = self._records.get(wa_id)
+            if record:
+                record["message_count"] += count
+                record["token_count"] += tokens
+                record["last_used"] = time.time()
+
+    def get_meta(self, key):
+        return self._meta.get(key)
+
+    def set_meta(self, key, value):
+        self._meta[key] = value
+
+    def add_message(self, thread_id, role, content, message_id=None, run_id=None):
+        with self._lock:
+            if message_id is not None:
+                if message_id in self._message_ids:
+                    return
+                self._message_ids.add(message_id)
+            self._messages.setdefault(thread_id, []).append(
+                {"message_id": message_id, "run_id": run_id, "role": role, "content": content}
+            )
+
+    def get_messages(self, thread_id):
+        with self._lock:
+            return [dict(message) for message in self._messages.get(thread_id, [])]
+
+    def get_run_reply(self, thread_id, run_id):
+        with self._lock:
+            for message in reversed(self._messages.get(thread_id, [])):
+                if message["run_id"] == run_id and message["role"] == "assistant":
+                    return message["content"]
+        return None
+
+    def delete_messages(self, thread_id):
+        with self._lock:
+            for message in self._messages.pop(thread_id, []):
+                self._message_ids.discard(message["message_id"])
+
+    def replace_messages(self, thread_id, messages):
+        self.delete_messages(thread_id)
+        for message in messages:
+            self.add_message(thread_id, message["role"], message["content"],
+                             message.get("message_id"), message.get("run_id"))
+
+    def message_stats(self):
+        with self._lock:
+            return {
+                "messages": sum(len(messages) for messages in self._messages.values()),
+                "threads": len(self._messages),
+            }
+
+
+class CachedThreadStore:
+    """
+    Per-process LRU of wa_id -> thread_id in front of another store.
+    Entries expire after a TTL so a thread rotated by another process is picked up.
+    """
+
+    def __init__(self, backend, max_entries, ttl):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, wa_id, thread_id):
+        with self._lock:
+            self._cache[wa_id] = (thread_id, time.time())
+            self._cache.move_to_end(wa_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get(self, wa_id):
+        with self._lock:
+            entry = self._cache.get(wa_id)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                self._cache.move_to_end(wa_id)
+                return entry[0]
+        thread_id = self.backend.get(wa_id)
+        if thread_id is not None:
+            self._remember(wa_id, thread_id)
+        return thread_id
+
+    def get_record(self, wa_id):
+        return self.backend.get_record(wa_id)
+
+    def set(self, wa_id, thread_id):
+        self.backend.set(wa_id, thread_id)
+        self._remember(wa_id, thread_id)
+
+    def set_if_absent(self, wa_id, thread_id, synced=True):
+        stored = self.backend.set_if_absent(wa_id, thread_id, synced)
+        self._remember(wa_id, stored)
+        return stored
+
+    def mark_synced(self, wa_id, thread_id, message_count, token_count):
+        self.backend.mark_synced(wa_id, thread_id, message_count, token_count)
+
+    def record_messages(self, wa_id, count=1, tokens=0):
+        self.backend.record_messages(wa_id, count, tokens)
+
+    def get_meta(self, key):
+        return self.backend.get_meta(key)
+
+    def set_meta(self, key, value):
+        self.backend.set_meta(key, value)
+
+    def add_message(self, thread_id, role, content, message_id=None, run_id=None):
+        self.backend.add_message(thread_id, role, content, message_id, run_id)
+
+    def get_messages(self, thread_id):
+        return self.backend.get_messages(thread_id)
+
+    def get_run_reply(self, thread_id, run_id):
+        return self.backend.get_run_reply(thread_id, run_id)
+
+    def delete_messages(self, thread_id):
+        self.backend.delete_messages(thread_id)
+
+    def replace_messages(self, thread_id, messages):
+        self.backend.replace_messages(thread_id, messages)
+
+    def message_stats(self):
+        return self.backend.message_stats()
+
+
+def migrate_shelve_stores(store, paths=LEGACY_SHELVE_STORES):
+    """
+    One-shot import of the legacy shelve thread stores into the given store.
+    Earlier paths take precedence; existing mappings in the store are never overwritten.
+    Returns the number of mappings imported.
+    """
+    if store.get_meta("shelve_migrated"):
+        return 0
+
+    imported = 0
+    for path in paths:
+        try:
+            with shelve.open(path, flag="r") as db:
+                for wa_id in db.keys():
+                    thread_id = db[wa_id]
+                    if store.get(wa_id) is None:
+                        store.set_if_absent(wa_id, thread_id, synced=False)
+                        imported += 1
+        except Exception as e:
+            # dbm raises a different error type per backend when the file does not exist
+            logging.info(f"Skipping legacy thread store '{path}': {e}")
+
+    store.set_meta("shelve_migrated", str(time.time()))
+    if imported:
+        logging.info(f"Imported {imported} thread mappings from legacy shelve stores")
+    return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_thread_store():
+    """Returns the process-wide thread store, creating it (and running the migration) on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if THREAD_STORE_BACKEND == "memory":
+                backend = MemoryThreadStore()
+            else:
+                backend = SQLiteThreadStore(THREAD_STORE_PATH)
+            migrate_shelve_stores(backend)
+            _store = CachedThreadStore(backend, THREAD_CACHE_SIZE, THREAD_CACHE_TTL)
+        return _store
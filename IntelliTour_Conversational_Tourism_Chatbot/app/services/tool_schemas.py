@@ -0,0 +1,339 @@
+"""
+Instructions and function tool schemas shared by both conversation engines.
+
+create_assistant()/setup_assistant.py register them on the Assistant, and the chat
+completions engine sends them with every request, so both engines offer the same tools.
+This module has no package imports so setup_assistant.py can import it as a script.
+"""
+
+ASSISTANT_INSTRUCTIONS = (
+    "You're a helpful WhatsApp assistant that assists travelers with queries "
+    "related to tourism and travel. Use your knowledge base and provided tools "
+    "to respond to user queries. If you don't know the answer, say so politely "
+    "and suggest contacting the host. If a query is outside the travel/tourism scope, "
+    "remind the user to stay within the travel and tourism scope only. Be friendly and funny."
+)
+
+FUNCTION_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "description": (
+                "Fetch the current weather for a given city using the OpenWeatherMap API. "
+                "Use this ONLY when the user asks about weather, temperature, climate, or conditions."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "city": {
+                        "type": "string",
+                        "description": "The name of the city (e.g., 'Nairobi')."
+                    }
+                },
+                "required": ["city"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_flight_offers",
+            "description": (
+                "Search for flight offers between two cities using the Amadeus API. "
+                "Use this when the user asks about flights, airfares, or ticket prices."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "origin": {
+                        "type": "string",
+                        "description": "Origin airport/city (IATA code or name, e.g., 'NBO' or 'Nairobi')."
+                    },
+                    "destination": {
+                        "type": "string",
+                        "description": "Destination airport/city (IATA code or name, e.g., 'DXB' or 'Dubai')."
+                    },
+                    "departure_date": {
+                        "type": "string",
+                        "description": "Departure date in YYYY-MM-DD format."
+                    },
+                    "return_date": {
+                        "type": "string",
+                        "description": "Optional return date in YYYY-MM-DD format."
+                    },
+                    "adults": {
+                        "type": "integer",
+                        "description": "Number of adult passengers.",
+                        "default": 1
+                    },
+                },
+                "required": ["origin", "destination", "departure_date"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_more_flight_offers",
+            "description": (
+                "Show more or re-sorted offers from an earlier get_flight_offers search without searching again. "
+                "Use this when the user asks for more options, cheaper, faster or direct flights on the same route and dates."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "search_id": {
+                        "type": "string",
+                        "description": "The search_id returned by get_flight_offers."
+                    },
+                    "page": {
+                        "type": "integer",
+                        "description": "Page number, starting at 1.",
+                        "default": 1
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["price", "duration", "stops", "departure"],
+                        "description": "Order of the offers: cheapest, shortest, fewest stops or earliest departure first.",
+                        "default": "price"
+                    },
+                    "max_stops": {
+                        "type": "integer",
+                        "description": "Optional maximum number of stops, e.g. 0 for direct flights only."
+                    }
+                },
+                "required": ["search_id"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_fare_calendar",
+            "description": (
+                "Compare flight prices across a range of departure dates in one call and find the cheapest, "
+                "fastest and best-value days. Use this when the user asks which day is cheapest to fly, "
+                "or is flexible on dates."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "origin": {
+                        "type": "string",
+                        "description": "Origin airport/city (IATA code or name, e.g., 'NBO' or 'Nairobi')."
+                    },
+                    "destination": {
+                        "type": "string",
+                        "description": "Destination airport/city (IATA code or name, e.g., 'DXB' or 'Dubai')."
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "First departure date to compare, in YYYY-MM-DD format."
+                    },
+                    "days": {
+                        "type": "integer",
+                        "description": "Number of consecutive departure dates to compare (at most 14).",
+                        "default": 7
+                    },
+                    "trip_length_days": {
+                        "type": "integer",
+                        "description": "Optional length of a return trip in days; omit for one-way fares."
+                    },
+                    "adults": {
+                        "type": "integer",
+                        "description": "Number of adult passengers.",
+                        "default": 1
+                    }
+                },
+                "required": ["origin", "destination", "start_date"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_hotels",
+            "description": (
+                "Find available hotels in a destination city using the Amadeus API. "
+                "Use this when the user asks about hotels, accommodation, or places to stay."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "city_code": {
+                        "type": "string",
+                        "description": "IATA city code or city name (e.g., 'NBO' or 'Nairobi')."
+                    },
+                    "check_in_date": {
+                        "type": "string",
+                        "description": "Optional check-in date in YYYY-MM-DD format. With check_out_date, returns prices."
+                    },
+                    "check_out_date": {
+                        "type": "string",
+                        "description": "Optional check-out date in YYYY-MM-DD format."
+                    },
+                    "adults": {
+                        "type": "integer",
+                        "description": "Number of adult guests.",
+                        "default": 1
+                    }
+                },
+                "required": ["city_code"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_location",
+            "description": "Search for a location using a text query. Returns the top match with name, address, place_id, and coordinates.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Free text search query, e.g., 'Nairobi National Park'."}
+                },
+                "required": ["query"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_location_details",
+            "description": "Given a Google place_id, return detailed information including photos and coordinates.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "place_id": {"type": "string", "description": "Google Place ID."}
+                },
+                "required": ["place_id"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_place_photo",
+            "description": "Return a Google Maps Place Photo URL given a photo_reference.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "photo_reference": {"type": "string", "description": "Google photo_reference returned by place details."},
+                    "max_width": {"type": "integer", "description": "Maximum width of the photo in pixels.", "default": 800},
+                },
+                "required": ["photo_reference"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_place_photos",
+            "description": (
+                "Return Google Maps Place Photo URLs for several photo_references in one call, e.g. for a list of "
+                "nearby places. Prefer this over calling get_place_photo once per place."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "photo_references": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Google photo_references returned by place details or nearby search (at most 10)."
+                    },
+                    "max_width": {"type": "integer", "description": "Maximum width of the photos in pixels.", "default": 800},
+                },
+                "required": ["photo_references"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_street_view_image",
+            "description": "Return a Google Street View image URL for given coordinates.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "lat": {"type": "number"},
+                    "lng": {"type": "number"},
+                    "width": {"type": "integer", "description": "Image width in px", "default": 600},
+                    "height": {"type": "integer", "description": "Image height in px", "default": 400},
+                },
+                "required": ["lat", "lng"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_nearby_places",
+            "description": (
+                "Search for nearby points of interest using coordinates, keyword or place type. Useful for queries like "
+                "'find 5-star hotels near Nairobi'. Returns each place's coordinates, distance in meters, rating, "
+                "photo_reference and whether it was open when last checked, ranked by a mix of rating, closeness and opening, or by distance or rating."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "lat": {"type": "number", "description": "Latitude of the center location"},
+                    "lng": {"type": "number", "description": "Longitude of the center location"},
+                    "radius": {"type": "integer", "description": "Search radius in meters", "default": 3000},
+                    "keyword": {"type": "string", "description": "Search keyword filter", "nullable": True},
+                    "place_type": {"type": "string", "description": "Google Maps place type filter (e.g. 'restaurant', 'hotel')", "nullable": True},
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["score", "distance", "rating"],
+                        "description": "Ranking: best overall mix of rating and closeness, nearest first, or best rated first.",
+                        "default": "score"
+                    },
+                    "limit": {"type": "integer", "description": "Number of places to return (at most 20).", "default": 20}
+                },
+                "required": ["lat", "lng"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "plan_day_itinerary",
+            "description": (
+                "Plan the visiting order for a day out in one call: the shortest route between the stops that "
+                "visits each place while it is open, with arrival and departure times. Use this when the user "
+                "asks to plan a day or a route through several places, instead of working out the order yourself. "
+                "Travel times are estimates from straight-line distances."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "stops": {
+                        "type": "array",
+                        "description": "Places to visit (at most 12), each with a Google place_id or lat and lng.",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "place_id": {"type": "string", "description": "Google Place ID, e.g. from search_location."},
+                                "name": {"type": "string"},
+                                "lat": {"type": "number"},
+                                "lng": {"type": "number"},
+                                "visit_minutes": {"type": "integer", "description": "Optional time to spend at this stop."}
+                            }
+                        }
+                    },
+                    "date": {"type": "string", "description": "Day of the visit in YYYY-MM-DD format, for opening hours. Defaults to today in the stops' time zone."},
+                    "start_time": {"type": "string", "description": "Time the day starts, HH:MM in 24-hour time.", "default": "09:00"},
+                    "start_lat": {"type": "number", "description": "Optional latitude where the day starts, e.g. the hotel."},
+                    "start_lng": {"type": "number", "description": "Optional longitude where the day starts."},
+                    "visit_minutes": {"type": "integer", "description": "Default time to spend at each stop.", "default": 60}
+                },
+                "required": ["stops"]
+            }
+        }
+    },
+]
+
+
+def assistant_tools():
+    """Tools for the Assistants API: the knowledge-base file search plus every function tool."""
+    return [{"type": "file_search"}, *FUNCTION_TOOLS]
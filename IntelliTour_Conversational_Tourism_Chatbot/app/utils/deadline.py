@@ -0,0 +1,48 @@
+import random
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Time budget for answering one message.
+    The same object is passed to every stage (message creation, run, tools, reply retrieval)
+    so that together they never run past the budget.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, timeout):
+        """Limit a stage timeout to what is left of the budget."""
+        return min(timeout, self.remaining())
+
+    def sleep(self, seconds):
+        """Sleep for up to the given time without passing the deadline. Returns False once expired."""
+        time.sleep(self.cap(seconds))
+        return not self.expired()
+
+    def check(self, stage):
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds}s exceeded during {stage}")
+
+
+def backoff_intervals(initial=0.1, maximum=2.0, factor=2.0, jitter=0.2):
+    """
+    Yields exponentially growing sleep intervals, capped at `maximum`,
+    each randomized by +/- `jitter` so concurrent pollers do not line up.
+    """
+    interval = initial
+    while True:
+        yield interval * random.uniform(1 - jitter, 1 + jitter)
+        interval = min(interval * factor, maximum)
@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+EARTH_RADIUS_M = 6371008.8
+_METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def geohash_encode(lat, lng, precision):
+    """Geohash of a point: each character halves the cell 5 times, alternating longitude and latitude."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, span = (lng, lng_range) if even else (lat, lat_range)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(cell):
+    """(lat_min, lat_max, lng_min, lng_max) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            span = lng_range if even else lat_range
+            mid = (span[0] + span[1]) / 2
+            if value >> shift & 1:
+                span[0] = mid
+            else:
+                span[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def cell_center(cell):
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(cell)
+    return (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+
+
+def cell_size_m(precision, lat):
+    """(height, width) in meters of a geohash cell of this precision at latitude lat."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    height = 180 / 2 ** lat_bits * _METERS_PER_DEGREE
+    width = 360 / 2 ** lng_bits * _METERS_PER_DEGREE * math.cos(math.radians(lat))
+    return height, width
+
+
+def cell_radius_m(cell):
+    """Distance from the center of a cell to its farthest corner."""
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(cell)
+    lat, lng = cell_center(cell)
+    return max(haversine_m(lat, lng, corner_lat, corner_lng)
+               for corner_lat in (lat_min, lat_max) for corner_lng in (lng_min, lng_max))
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_m_array(lat, lng, lats, lngs):
+    """Great-circle distances in meters from one point to arrays of points."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.asarray(lngs, dtype=float) - lng)
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def haversine_matrix_m(lats, lngs):
+    """Matrix of great-circle distances in meters between every pair of points."""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lngs = np.radians(np.asarray(lngs, dtype=float))
+    d_phi = lats[:, None] - lats[None, :]
+    d_lambda = lngs[:, None] - lngs[None, :]
+    a = np.sin(d_phi / 2) ** 2 + np.cos(lats)[:, None] * np.cos(lats)[None, :] * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def covering_precision(lat, radius, max_cells=256, min_precision=3, max_precision=8):
+    """
+    Finest precision at which a circle of this radius around lat touches at most about
+    max_cells cells. Fine cells let a query reuse most of what an overlapping query
+    fetched, since only the cells wholly inside a fetched circle are filled from it.
+    """
+    for precision in range(max_precision, min_precision - 1, -1):
+        height, width = cell_size_m(precision, lat)
+        if (2 * radius / height + 1) * (2 * radius / width + 1) <= max_cells:
+            return precision
+    return min_precision
+
+
+def _distance_to_cell_m(lat, lng, cell):
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(cell)
+    # Measure across the antimeridian when the cell is on the other side of it
+    if lng - lng_max > 180:
+        lng -= 360
+    elif lng_min - lng > 180:
+        lng += 360
+    return haversine_m(lat, lng, min(max(lat, lat_min), lat_max), min(max(lng, lng_min), lng_max))
+
+
+def cell_within(lat, lng, radius, cell):
+    """Whether the whole cell lies within `radius` meters of (lat, lng)."""
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(cell)
+    return all(haversine_m(lat, lng, corner_lat, corner_lng) <= radius
+               for corner_lat in (lat_min, lat_max) for corner_lng in (lng_min, lng_max))
+
+
+def covering_cells(lat, lng, radius, max_cells=256, min_precision=3, max_precision=8):
+    """Geohash cells that intersect the circle of `radius` meters around (lat, lng)."""
+    precision = covering_precision(lat, radius, max_cells, min_precision, max_precision)
+    center = geohash_encode(lat, lng, precision)
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(center)
+    d_lat, d_lng = lat_max - lat_min, lng_max - lng_min
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+
+    # Cells on each side of the center one that the circle can reach; near the poles at most once around
+    rows = math.ceil(radius / (d_lat * _METERS_PER_DEGREE))
+    cols = math.ceil(radius / (d_lng * _METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)))
+    cols = min(cols, math.ceil(180 / d_lng))
+
+    cells = []
+    for row in range(-rows, rows + 1):
+        cell_lat = center_lat + row * d_lat
+        if not -90 < cell_lat < 90:
+            continue
+        for col in range(-cols, cols + 1):
+            cell_lng = (center_lng + col * d_lng + 180) % 360 - 180
+            cell = geohash_encode(cell_lat, cell_lng, precision)
+            if cell not in cells and _distance_to_cell_m(lat, lng, cell) <= radius:
+                cells.append(cell)
+    return cells
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils import metrics
+
+load_dotenv()
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+# Connections kept alive per host. Should cover QUEUE_WORKERS x TOOL_MAX_WORKERS in-flight calls.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.3"))
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+# Google Maps and OpenWeatherMap take their API key as a query parameter
+_QUERY_STRING = re.compile(r"\?[^\s'\")]*")
+
+
+def strip_query_strings(text):
+    """Text with the query string of every URL in it removed."""
+    return _QUERY_STRING.sub("", text)
+
+
+def describe_error(error):
+    """
+    An exception as its class and message, safe to log or hand to the model.
+    requests and googlemaps errors quote the request URL, API key included.
+    """
+    return f"{type(error).__name__}: {strip_query_strings(str(error))}"
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that counts requests in flight per host, so /metrics can show
+    when the keep-alive pool is saturated and new connections are being opened.
+    """
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self._in_flight = {}
+        self._peak_in_flight = {}
+        self._stats_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host = requests.utils.urlparse(request.url).netloc
+        with self._stats_lock:
+            in_flight = self._in_flight.get(host, 0) + 1
+            self._in_flight[host] = in_flight
+            self._peak_in_flight[host] = max(self._peak_in_flight.get(host, 0), in_flight)
+        if in_flight > self._pool_maxsize:
+            metrics.incr(f"http.{self.name}.pool_saturated")
+        try:
+            with metrics.timed(f"http.{self.name}"):
+                return super().send(request, **kwargs)
+        finally:
+            with self._stats_lock:
+                self._in_flight[host] -= 1
+
+    def pool_stats(self):
+        stats = {}
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            opened = pool.num_connections
+            sent = pool.num_requests
+            with self._stats_lock:
+                in_flight = self._in_flight.get(host, 0)
+                peak = self._peak_in_flight.get(host, 0)
+            stats[host] = {
+                "requests": sent,
+                "connections_opened": opened,
+                "reused": max(0, sent - opened),
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "in_flight": in_flight,
+                "peak_in_flight": peak,
+                "pool_size": self._pool_maxsize,
+            }
+        return stats
+
+
+class PooledSession(requests.Session):
+    """requests.Session that applies the default connect/read timeout when none is given."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name, retries=HTTP_MAX_RETRIES):
+    """
+    Returns the shared keep-alive session for an upstream service.
+    Each service gets its own connection pools (one per host) and retry policy.
+    Only idempotent methods are retried, so a WhatsApp send is never duplicated.
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            retry = Retry(
+                total=retries,
+                connect=retries,
+                read=retries,
+                status=retries,
+                backoff_factor=HTTP_RETRY_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = InstrumentedAdapter(
+                name, pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry
+            )
+            session = PooledSession()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return session
+
+
+def get_http_stats():
+    """Connection reuse and pool saturation per service and host."""
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    counters = metrics.snapshot()["counters"]
+    stats = {}
+    for name, session in sessions.items():
+        adapter = session.get_adapter("https://")
+        stats[name] = {
+            "hosts": adapter.pool_stats(),
+            "pool_saturated": counters.get(f"http.{name}.pool_saturated", 0),
+        }
+    return stats
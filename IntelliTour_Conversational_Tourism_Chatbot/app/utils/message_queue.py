@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from app.utils import metrics
+from app.utils.sqlite_utils import get_connection
+
+Job = namedtuple("Job", ["id", "body", "enqueued_at"])
+
+# Claimed SQLite jobs that are not acknowledged within this window are handed out again
+JOB_VISIBILITY_TIMEOUT = 300
+
+
+class InMemoryMessageQueue:
+    """Bounded FIFO of webhook payloads, local to this process."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, body):
+        try:
+            self._queue.put_nowait(Job(None, body, time.time()))
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=1.0):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, job):
+        pass
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+class SQLiteMessageQueue:
+    """Bounded FIFO of webhook payloads stored in SQLite, shared by every worker process."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS message_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            enqueued_at REAL NOT NULL,
+            claimed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_message_jobs_claimed ON message_jobs (claimed_at, id);
+    """
+
+    def __init__(self, path, maxsize, poll_interval=0.05):
+        self.path = path
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self._available = threading.Condition()
+
+    def _conn(self):
+        return get_connection(self.path, self.SCHEMA)
+
+    def put(self, body):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (depth,) = conn.execute("SELECT COUNT(*) FROM message_jobs").fetchone()
+            if depth >= self.maxsize:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO message_jobs (payload, enqueued_at) VALUES (?, ?)",
+                (json.dumps(body), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._available:
+            self._available.notify()
+        return True
+
+    def _claim(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, payload, enqueued_at FROM message_jobs "
+                "WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT 1",
+                (now - JOB_VISIBILITY_TIMEOUT,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE message_jobs SET claimed_at = ? WHERE id = ?", (now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        return Job(row["id"], json.loads(row["payload"]), row["enqueued_at"])
+
+    def get(self, timeout=1.0):
+        deadline = time.time() + timeout
+        while True:
+            job = self._claim()
+            if job is not None:
+                return job
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            # Woken early by puts from this process; other processes are picked up by polling
+            with self._available:
+                self._available.wait(min(self.poll_interval, remaining))
+
+    def ack(self, job):
+        self._conn().execute("DELETE FROM message_jobs WHERE id = ?", (job.id,))
+
+    def depth(self):
+        (depth,) = self._conn().execute(
+            "SELECT COUNT(*) FROM message_jobs WHERE claimed_at IS NULL"
+        ).fetchone()
+        return depth
+
+
+class MessageWorkerPool:
+    """
+    Runs the message handler for queued webhook payloads on a fixed number of threads.
+    Threads are started lazily, once per process, so the pool also works after a gunicorn fork.
+    """
+
+    def __init__(self, app, job_queue, handler, workers):
+        self.app = app
+        self.job_queue = job_queue
+        self.handler = handler
+        self.workers = workers
+        self._pid = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"message-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            logging.info(f"Started {self.workers} message workers in process {self._pid}")
+
+    def _run(self):
+        while True:
+            try:
+                job = self.job_queue.get(timeout=1.0)
+            except Exception as e:
+                logging.error(f"Error reading from message queue: {e}")
+                time.sleep(1)
+                continue
+            if job is None:
+                continue
+
+            metrics.observe("queue.wait", time.time() - job.enqueued_at)
+            try:
+                with self.app.app_context(), metrics.timed("queue.process"):
+                    self.handler(job.body)
+                metrics.incr("queue.processed")
+            except Exception as e:
+                metrics.incr("queue.failed")
+                logging.error(f"Error processing queued message: {e}")
+                import traceback
+                logging.error(traceback.format_exc())
+            finally:
+                try:
+                    self.job_queue.ack(job)
+                except Exception as e:
+                    logging.error(f"Error acknowledging queued message: {e}")
+
+
+def init_message_queue(app, handler):
+    """Create the message queue and worker pool configured for this app, if queue mode is enabled."""
+    if app.config["WEBHOOK_MODE"] != "queue":
+        return None
+
+    if app.config["QUEUE_BACKEND"] == "sqlite":
+        job_queue = SQLiteMessageQueue(app.config["QUEUE_DB_PATH"], app.config["QUEUE_MAX_SIZE"])
+    else:
+        job_queue = InMemoryMessageQueue(app.config["QUEUE_MAX_SIZE"])
+
+    pool = MessageWorkerPool(app, job_queue, handler, app.config["QUEUE_WORKERS"])
+    app.extensions["message_queue"] = pool
+    pool.ensure_started()
+    return pool
+
+
+def enqueue_message(app, body):
+    """Put a webhook payload on the queue. Returns False when the queue is full."""
+    pool = app.extensions["message_queue"]
+    pool.ensure_started()
+    if not pool.job_queue.put(body):
+        metrics.incr("queue.rejected")
+        logging.warning("Message queue is full. Rejecting webhook.")
+        return False
+    metrics.incr("queue.enqueued")
+    return True
+
+
+def get_queue_stats(app):
+    pool = app.extensions.get("message_queue")
+    if pool is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "backend": app.config["QUEUE_BACKEND"],
+        "depth": pool.job_queue.depth(),
+        "max_size": pool.job_queue.maxsize,
+        "workers": pool.workers,
+    }
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Keep the most recent samples per timer for percentile estimates
+SAMPLE_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+
+
+def incr(name, value=1):
+    """Increment a named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def observe(name, seconds):
+    """Record a duration (in seconds) for a named timer."""
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = {"count": 0, "total": 0.0, "max": 0.0, "samples": deque(maxlen=SAMPLE_WINDOW)}
+            _timers[name] = timer
+        timer["count"] += 1
+        timer["total"] += seconds
+        timer["max"] = max(timer["max"], seconds)
+        timer["samples"].append(seconds)
+
+
+@contextmanager
+def timed(name):
+    """Context manager that records how long the wrapped block took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def snapshot():
+    """Return a JSON-serializable copy of all counters and timer summaries (timings in ms)."""
+    with _lock:
+        counters = dict(_counters)
+        timers = {}
+        for name, timer in _timers.items():
+            samples = sorted(timer["samples"])
+            timers[name] = {
+                "count": timer["count"],
+                "avg_ms": round(timer["total"] / timer["count"] * 1000, 2) if timer["count"] else 0.0,
+                "max_ms": round(timer["max"] * 1000, 2),
+                "p50_ms": round(_percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(_percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(_percentile(samples, 99) * 1000, 2),
+            }
+    return {"counters": counters, "timers": timers}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from app.utils import metrics
+
+
+class _Ticket:
+    __slots__ = ("item", "enqueued_at", "done", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+
+
+class PerUserQueue:
+    """
+    Processes messages for the same key (a WhatsApp id) one batch at a time, in arrival order,
+    while different keys run fully in parallel.
+
+    The first caller for an idle key becomes its drainer. It waits for the key's debounce
+    window to pass without new messages, then hands every queued item to the handler as one
+    batch, and repeats until the key's FIFO is empty. Later callers just append to the FIFO;
+    with wait=True they block until their item has been handled, so a durable queue job is
+    only acknowledged once it has been answered.
+    """
+
+    def __init__(self):
+        self._queues = {}  # key -> deque of tickets waiting for the drainer
+        self._last_arrival = {}
+        self._lock = threading.Lock()
+
+    def process(self, key, item, handler, debounce=0.0, max_wait=0.0, wait=True):
+        """
+        Queue item for key and run handler(items) on it together with any other items for
+        key that arrive within `debounce` seconds of each other (but no later than `max_wait`
+        after the first one).
+        """
+        ticket = _Ticket(item)
+        with self._lock:
+            self._last_arrival[key] = ticket.enqueued_at
+            pending = self._queues.get(key)
+            if pending is not None:
+                # A drainer is active for this key; it will pick this ticket up
+                pending.append(ticket)
+                metrics.incr("user_queue.queued_behind")
+            else:
+                self._queues[key] = deque()
+
+        if pending is None:
+            self._drain(key, ticket, handler, debounce, max_wait)
+        elif not wait:
+            return
+
+        ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+
+    def _debounce(self, key, first, debounce, max_wait):
+        """Sleep until no message has arrived for `debounce` seconds, or `max_wait` has passed."""
+        if debounce <= 0:
+            return
+        latest = first.enqueued_at + max(max_wait, debounce)
+        while True:
+            with self._lock:
+                quiet_until = min(self._last_arrival[key] + debounce, latest)
+            remaining = quiet_until - time.perf_counter()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _drain(self, key, ticket, handler, debounce, max_wait):
+        while ticket is not None:
+            self._debounce(key, ticket, debounce, max_wait)
+            with self._lock:
+                batch = [ticket, *self._queues[key]]
+                self._queues[key].clear()
+
+            now = time.perf_counter()
+            for queued in batch:
+                metrics.observe("user_queue.wait", now - queued.enqueued_at)
+            metrics.incr("user_queue.batches")
+            if len(batch) > 1:
+                metrics.incr("user_queue.coalesced", len(batch) - 1)
+
+            try:
+                handler([queued.item for queued in batch])
+            except Exception as e:
+                logging.error(f"Error handling {len(batch)} queued message(s) for {key}: {e}")
+                for queued in batch:
+                    queued.error = e
+            finally:
+                for queued in batch:
+                    queued.done.set()
+
+            with self._lock:
+                pending = self._queues[key]
+                if pending:
+                    ticket = pending.popleft()
+                else:
+                    del self._queues[key]
+                    self._last_arrival.pop(key, None)
+                    ticket = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_users": len(self._queues),
+                "queued_messages": sum(len(pending) for pending in self._queues.values()),
+            }
+
+
+user_queue = PerUserQueue()
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from app.utils import metrics
+
+
+class RateLimiter:
+    """
+    Spaces out calls to at most `rate` per second across all threads of the process.
+    acquire() reserves the next free slot and sleeps until it comes up.
+    """
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            metrics.observe(f"rate_limit.{self.name}.wait", wait)
+            time.sleep(wait)
@@ -0,0 +1,27 @@
+import sqlite3
+import threading
+
+_local = threading.local()
+
+
+def get_connection(path, schema=None):
+    """
+    Returns a SQLite connection for the current thread.
+    Connections are opened once per thread and path, in autocommit mode with WAL
+    journaling so several gunicorn workers can share the same file.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        if schema:
+            conn.executescript(schema)
+        connections[path] = conn
+    return conn
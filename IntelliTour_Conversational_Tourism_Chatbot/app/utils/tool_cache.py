@@ -0,0 +1,326 @@
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from app.utils import metrics
+from app.utils.http_client import describe_error
+from app.utils.singleflight import SingleFlight
+from app.utils.sqlite_utils import get_connection
+
+load_dotenv()
+# "sqlite" adds a shared tier on disk that every gunicorn worker reads and fills;
+# "memory" keeps only the per-process tier
+TOOL_CACHE_BACKEND = os.getenv("TOOL_CACHE_BACKEND", "sqlite")
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "tool_cache.sqlite3")
+TOOL_CACHE_MEMORY_SIZE = int(os.getenv("TOOL_CACHE_MEMORY_SIZE", "2048"))
+TOOL_CACHE_MAX_ROWS = int(os.getenv("TOOL_CACHE_MAX_ROWS", "50000"))
+TOOL_CACHE_MMAP_BYTES = int(os.getenv("TOOL_CACHE_MMAP_BYTES", str(64 * 1024 * 1024)))
+# Error results ({"error": ...}) are kept briefly so a bad query does not hit the API on every retry
+TOOL_CACHE_NEGATIVE_TTL = int(os.getenv("TOOL_CACHE_NEGATIVE_TTL", "60"))
+
+_PRUNE_EVERY = 200  # shared-tier writes between size checks
+_OUTCOMES = ("memory_hit", "shared_hit", "stale_hit", "negative_hit", "coalesced", "miss")
+
+
+def normalize_text_args(args):
+    """Key normalizer for free-text arguments: case and extra whitespace do not matter."""
+    return {
+        name: " ".join(value.split()).casefold() if isinstance(value, str) else value
+        for name, value in args.items()
+    }
+
+
+def _default_normalize(args):
+    return {
+        name: round(value, 6) if isinstance(value, float) else value
+        for name, value in args.items()
+    }
+
+
+class SharedTier:
+    """
+    Cache entries in a SQLite file shared by all workers, read through a memory map.
+    Rows are bounded by max_rows: expired rows go first, then the ones closest to expiry.
+    """
+
+    def __init__(self, path, max_rows):
+        self.path = path
+        self.max_rows = max_rows
+        self.schema = f"""
+            PRAGMA mmap_size={TOOL_CACHE_MMAP_BYTES};
+            CREATE TABLE IF NOT EXISTS tool_cache (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                stale_until REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tool_cache_stale_until ON tool_cache (stale_until);
+        """
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.path, self.schema)
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at, stale_until FROM tool_cache WHERE key = ? AND stale_until > ?",
+            (key, time.time()),
+        ).fetchone()
+        return (row["expires_at"], row["stale_until"], row["value"]) if row else None
+
+    def set(self, key, tool, value, expires_at, stale_until):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO tool_cache (key, tool, value, expires_at, stale_until) VALUES (?, ?, ?, ?, ?)",
+            (key, tool, value, expires_at, stale_until),
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM tool_cache WHERE stale_until <= ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM tool_cache WHERE key IN "
+                "(SELECT key FROM tool_cache ORDER BY stale_until LIMIT ?)",
+                (excess,),
+            )
+            metrics.incr("tool_cache.evicted", excess)
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0]
+
+
+class ToolCache:
+    """
+    Two-tier cache for tool results: a per-process LRU in front of the optional shared tier.
+    Values are kept as JSON text, so every caller gets its own copy of the result.
+    """
+
+    def __init__(self, memory_size, shared=None):
+        self.memory_size = memory_size
+        self.shared = shared
+        self._memory = OrderedDict()  # key -> (expires_at, stale_until, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (expires_at, stale_until, value, tier) for a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return (*entry, "memory")
+                del self._memory[key]
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                logging.warning(f"Could not read the shared tool cache: {e}")
+                return None
+            if entry is not None:
+                self._remember(key, entry)
+                return (*entry, "shared")
+        return None
+
+    def set(self, key, tool, value, ttl, max_stale=0):
+        now = time.time()
+        entry = (now + ttl, now + ttl + max_stale, value)
+        self._remember(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, tool, value, *entry[:2])
+            except Exception as e:
+                logging.warning(f"Could not write {tool} result to the shared tool cache: {e}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def start_refresh(self, key):
+        """True if the caller should refresh key; only one refresh per key runs at a time."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            stats = {"memory_entries": len(self._memory), "refreshing": len(self._refreshing)}
+        if self.shared is not None:
+            try:
+                stats["shared_entries"] = self.shared.size()
+            except Exception as e:
+                logging.warning(f"Could not read the shared tool cache size: {e}")
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_tools = {}  # tool name -> policy, for the stats
+# Concurrent misses for the same tool and arguments share one upstream call
+_flights = SingleFlight()
+
+
+def get_tool_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            shared = SharedTier(TOOL_CACHE_PATH, TOOL_CACHE_MAX_ROWS) if TOOL_CACHE_BACKEND == "sqlite" else None
+            _cache = ToolCache(TOOL_CACHE_MEMORY_SIZE, shared)
+        return _cache
+
+
+def _is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def cached_tool(tool, ttl, max_stale=0, negative_ttl=TOOL_CACHE_NEGATIVE_TTL, normalize=_default_normalize,
+                cache_if=None, version=1):
+    """
+    Cache a tool function's results for `ttl` seconds, keyed by the tool name and its
+    normalized arguments. TOOL_CACHE_TTL_<TOOL> in the environment overrides the ttl.
+
+    With max_stale, an expired result is still returned for that many more seconds while
+    one background call refreshes it. Error results are cached for negative_ttl seconds,
+    exceptions are not cached, and neither are results rejected by cache_if. Concurrent
+    misses for the same key make a single call and all receive its result.
+
+    Bump version when the tool's results change shape, so entries cached before are not served.
+    """
+    ttl = int(os.getenv(f"TOOL_CACHE_TTL_{tool.upper()}", ttl))
+    _tools[tool] = {"ttl": ttl, "max_stale": max_stale, "negative_ttl": negative_ttl}
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def store(cache, key, result):
+            if cache_if is not None and not cache_if(result):
+                return
+            try:
+                value = json.dumps(result)
+            except (TypeError, ValueError) as e:
+                logging.warning(f"Not caching {tool} result: {e}")
+                return
+            if _is_error(result):
+                cache.set(key, tool, value, negative_ttl)
+            else:
+                cache.set(key, tool, value, ttl, max_stale)
+
+        def refresh(cache, key, args, kwargs):
+            try:
+                result = func(*args, **kwargs)
+                # Keep serving the stale value rather than replacing it with an error
+                if not _is_error(result):
+                    store(cache, key, result)
+            except Exception as e:
+                metrics.incr(f"tool_cache.{tool}.refresh_failed")
+                logging.warning(f"Background refresh of {tool} failed: {describe_error(e)}")
+            finally:
+                cache.end_refresh(key)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_args = json.dumps(normalize(dict(bound.arguments)), sort_keys=True, default=str)
+            key_prefix = tool if version == 1 else f"{tool}:v{version}"
+            key = hashlib.sha256(f"{key_prefix}:{key_args}".encode("utf-8")).hexdigest()
+
+            cache = get_tool_cache()
+            entry = cache.get(key)
+            if entry is not None:
+                expires_at, _, value, tier = entry
+                result = json.loads(value)
+                if expires_at > time.time():
+                    outcome = "negative_hit" if _is_error(result) else f"{tier}_hit"
+                    metrics.incr(f"tool_cache.{tool}.{outcome}")
+                    return result
+                # Past its ttl but within max_stale
+                metrics.incr(f"tool_cache.{tool}.stale_hit")
+                if cache.start_refresh(key):
+                    threading.Thread(target=refresh, args=(cache, key, args, kwargs), daemon=True).start()
+                return result
+
+            def load():
+                # A call for this key may have finished between the lookup above and joining the flight
+                entry = cache.get(key)
+                if entry is not None and entry[0] > time.time():
+                    result = json.loads(entry[2])
+                    return result, "negative_hit" if _is_error(result) else f"{entry[3]}_hit"
+                result = func(*args, **kwargs)
+                store(cache, key, result)
+                return result, "miss"
+
+            (result, outcome), shared = _flights.do(key, load)
+            if shared:
+                metrics.incr(f"tool_cache.{tool}.coalesced")
+                return copy.deepcopy(result)
+            metrics.incr(f"tool_cache.{tool}.{outcome}")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_tool_cache_stats():
+    """Hit rates per tool and the size of both tiers."""
+    counters = metrics.snapshot()["counters"]
+    tools = {}
+    for tool, policy in _tools.items():
+        counts = {outcome: counters.get(f"tool_cache.{tool}.{outcome}", 0) for outcome in _OUTCOMES}
+        lookups = sum(counts.values())
+        tools[tool] = {
+            **counts,
+            "hit_rate": round((lookups - counts["miss"]) / lookups, 3) if lookups else None,
+            "coalescing_ratio": _coalescing_ratio(counts["coalesced"], counts["miss"]),
+            **policy,
+        }
+    coalesced = sum(tool["coalesced"] for tool in tools.values())
+    upstream = sum(tool["miss"] for tool in tools.values())
+    stats = get_tool_cache().stats()
+    stats.update({
+        "backend": TOOL_CACHE_BACKEND,
+        "evicted": counters.get("tool_cache.evicted", 0),
+        "singleflight": {
+            **_flights.in_flight(),
+            "coalesced": coalesced,
+            "upstream_calls": upstream,
+            "coalescing_ratio": _coalescing_ratio(coalesced, upstream),
+        },
+        "tools": tools,
+    })
+    return stats
+
+
+def _coalescing_ratio(coalesced, upstream):
+    """Share of cache misses that were answered by another caller's in-flight request."""
+    total = coalesced + upstream
+    return round(coalesced / total, 3) if total else None
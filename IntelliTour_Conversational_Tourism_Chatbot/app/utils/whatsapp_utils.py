@@ -2,7 +2,14 @@ import logging
 from flask import current_app, jsonify
 import json
 import requests
+import threading
+import time
+from collections import OrderedDict
 from app.services.openai_service import generate_response
+from app.utils import metrics
+from app.utils.http_client import get_session
+from app.utils.per_user_queue import user_queue
+from app.utils.sqlite_utils import get_connection
 import re
 
 
@@ -35,10 +42,10 @@ def send_message(data):
         "Authorization": f"Bearer {current_app.config['ACCESS_TOKEN']}",
     }
 
-    url = f"https://graph.facebook.com/{current_app.config['VERSION']}/{current_app.config['PHONE_NUMBER_ID']}/messages"
+    url = f"{current_app.config['GRAPH_API_BASE_URL']}/{current_app.config['VERSION']}/{current_app.config['PHONE_NUMBER_ID']}/messages"
 
     try:
-        response = requests.post(
+        response = get_session("graph").post(
             url, data=data, headers=headers, timeout=10
         )  # 10 seconds timeout as an example
         response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
@@ -72,16 +79,137 @@ def process_text_for_whatsapp(text):
     return whatsapp_style_text
 
 
+class MessageIdCache:
+    """
+    Remembers recently seen WhatsApp message ids in an LRU with a per-entry TTL.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, message_id):
+        """Returns True if the id was already seen within the TTL, otherwise records it."""
+        now = time.time()
+        with self._lock:
+            seen_at = self._entries.get(message_id)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._entries.move_to_end(message_id)
+                return True
+            self._entries[message_id] = now
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return False
+
+
+class SQLiteMessageIdStore:
+    """
+    Shared record of seen message ids, so retries landing on another worker process are caught too.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS seen_messages (
+            message_id TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_seen_messages_seen_at ON seen_messages (seen_at);
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._last_purge = 0.0
+
+    def check_and_add(self, message_id):
+        conn = get_connection(self.path, self.SCHEMA)
+        now = time.time()
+        # Inserts new ids and refreshes expired ones; an unexpired id changes no rows
+        cursor = conn.execute(
+            "INSERT INTO seen_messages (message_id, seen_at) VALUES (?, ?) "
+            "ON CONFLICT(message_id) DO UPDATE SET seen_at = excluded.seen_at "
+            "WHERE seen_messages.seen_at < ?",
+            (message_id, now, now - self.ttl),
+        )
+        if now - self._last_purge > self.ttl:
+            self._last_purge = now
+            conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.ttl,))
+        return cursor.rowcount == 0
+
+
+_message_id_cache = None
+_message_id_store = None
+_dedup_lock = threading.Lock()
+
+
+def is_duplicate_message(message_id):
+    """
+    Check a WhatsApp message id against the in-memory cache and, if configured, the shared store.
+    Every duplicate found is counted in the "dedup.suppressed" metric.
+    """
+    global _message_id_cache, _message_id_store
+
+    if not message_id:
+        return False
+
+    with _dedup_lock:
+        if _message_id_cache is None:
+            ttl = current_app.config["DEDUP_TTL_SECONDS"]
+            _message_id_cache = MessageIdCache(current_app.config["DEDUP_MAX_ENTRIES"], ttl)
+            if current_app.config["DEDUP_DB_PATH"]:
+                _message_id_store = SQLiteMessageIdStore(current_app.config["DEDUP_DB_PATH"], ttl)
+
+    duplicate = _message_id_cache.check_and_add(message_id)
+    if not duplicate and _message_id_store is not None:
+        try:
+            duplicate = _message_id_store.check_and_add(message_id)
+        except Exception as e:
+            logging.warning(f"Could not check shared message id store: {e}")
+
+    if duplicate:
+        metrics.incr("dedup.suppressed")
+    return duplicate
+
+
 def process_whatsapp_message(body):
     wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
     name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
 
     message = body["entry"][0]["changes"][0]["value"]["messages"][0]
+
+    # WhatsApp redelivers the webhook when our ack is slow; only answer each message once
+    if is_duplicate_message(message.get("id")):
+        logging.info(f"Duplicate message {message.get('id')} from {wa_id} ignored.")
+        return
+
     message_body = message["text"]["body"]
 
     # TODO: implement custom function here for additional interactions with the API's
     #response = generate_response(message_body)
 
+    # One run per user at a time, in order, so a thread never has two runs in flight.
+    # Messages sent in a quick burst are answered together by a single run.
+    config = current_app.config
+    user_queue.process(
+        wa_id,
+        (message_body, wa_id, name),
+        answer_messages,
+        debounce=config["MESSAGE_DEBOUNCE_SECONDS"],
+        max_wait=config["MESSAGE_DEBOUNCE_MAX_SECONDS"],
+        # SQLite queue jobs must stay unacknowledged until the message has been answered
+        wait=config["WEBHOOK_MODE"] == "queue" and config["QUEUE_BACKEND"] == "sqlite",
+    )
+
+
+def answer_messages(items):
+    """Answer one or more messages from the same user with a single assistant reply."""
+    message_body = "\n".join(body for body, _, _ in items)
+    _, wa_id, name = items[-1]
+    if len(items) > 1:
+        logging.info(f"Answering {len(items)} messages from {wa_id} together")
+
     # OpenAI Integration
     response = generate_response(message_body, wa_id, name)
     response = process_text_for_whatsapp(response)
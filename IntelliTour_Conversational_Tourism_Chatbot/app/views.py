@@ -4,6 +4,15 @@ import json
 from flask import Blueprint, request, jsonify, current_app
 
 from .decorators.security import signature_required
+from .utils import metrics
+from .utils.http_client import get_http_stats
+from .utils.per_user_queue import user_queue
+from .utils.tool_cache import get_tool_cache_stats
+from .utils.message_queue import enqueue_message, get_queue_stats
+from .services.thread_store import get_thread_store
+from .services.geocode_cache import get_geocode_cache_stats
+from .services.googlemaps_service import get_nearby_cache_stats
+from .services.openai_service import get_engine_stats
 from .utils.whatsapp_utils import (
     process_whatsapp_message,
     is_valid_whatsapp_message,
@@ -44,6 +53,15 @@ def handle_message():
 
     try:
         if is_valid_whatsapp_message(body):
+            # In queue mode, acknowledge right away and let a worker generate the reply
+            if current_app.config["WEBHOOK_MODE"] == "queue":
+                if not enqueue_message(current_app, body):
+                    return (
+                        jsonify({"status": "error", "message": "Message queue is full"}),
+                        503,
+                    )
+                return jsonify({"status": "ok"}), 200
+
             process_whatsapp_message(body)
             return jsonify({"status": "ok"}), 200
         else:
@@ -90,3 +108,17 @@ def webhook_post():
     return handle_message()
 
 
+@webhook_blueprint.route("/metrics", methods=["GET"])
+def metrics_get():
+    stats = metrics.snapshot()
+    stats["queue"] = get_queue_stats(current_app)
+    stats["tool_cache"] = get_tool_cache_stats()
+    stats["nearby_cache"] = get_nearby_cache_stats()
+    stats["geocode_cache"] = get_geocode_cache_stats()
+    stats["http"] = get_http_stats()
+    stats["user_queue"] = user_queue.stats()
+    stats["conversations"] = get_thread_store().message_stats()
+    stats["engine"] = get_engine_stats()
+    return jsonify(stats), 200
+
+
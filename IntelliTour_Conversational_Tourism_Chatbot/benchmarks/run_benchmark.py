@@ -0,0 +1,284 @@
+"""
+End-to-end latency benchmark with stand-in upstream servers.
+
+Starts the stub servers, points the app at them through the usual environment variables,
+serves create_app() on a local port and sends signed webhook payloads at a target rate.
+End-to-end latency runs from sending the webhook to the reply reaching the Graph stub.
+
+Run from the project directory:
+
+    python -m benchmarks.run_benchmark --rate 5 --messages 100 --tool-script travel
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stubs import (
+    TOOL_SCRIPTS,
+    AmadeusStub,
+    GooglePlacesStub,
+    GraphStub,
+    OpenAIStub,
+    OpenWeatherMapStub,
+    StubConfig,
+)
+
+APP_SECRET = "benchmark-secret"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=5.0, help="webhooks sent per second")
+    parser.add_argument("--messages", type=int, default=50, help="total webhooks to send")
+    parser.add_argument("--users", type=int, default=10, help="distinct WhatsApp ids the messages are spread over")
+    parser.add_argument("--mode", choices=["sync", "queue"], default="queue", help="WEBHOOK_MODE for the app")
+    parser.add_argument("--engine", choices=["assistants", "chat"], default="assistants",
+                        help="CONVERSATION_ENGINE for the app")
+    parser.add_argument("--run-mode", choices=["stream", "poll"], default="stream", help="OPENAI_RUN_MODE")
+    parser.add_argument("--tool-script", choices=sorted(TOOL_SCRIPTS), default="weather",
+                        help="tool-call rounds the assistant stub asks for on every run")
+    parser.add_argument("--run-latency", type=float, default=0.5,
+                        help="assistant think time before each tool round and before the reply (s)")
+    parser.add_argument("--latency", type=float, default=0.05, help="per-request latency of every stub (s)")
+    parser.add_argument("--openai-latency", type=float, help="per-request latency of the OpenAI stub (s)")
+    parser.add_argument("--amadeus-latency", type=float, help="per-request latency of the Amadeus stub (s)")
+    parser.add_argument("--google-latency", type=float, help="per-request latency of the Google stub (s)")
+    parser.add_argument("--weather-latency", type=float, help="per-request latency of the weather stub (s)")
+    parser.add_argument("--graph-latency", type=float, help="per-request latency of the Graph stub (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests answered with a 500")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="how long to wait for outstanding replies after the last webhook (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the app, e.g. --env QUEUE_WORKERS=8")
+    return parser.parse_args(argv)
+
+
+def start_stubs(args):
+    def config(latency):
+        return StubConfig(args.latency if latency is None else latency, error_rate=args.error_rate, seed=args.seed)
+
+    return {
+        "openai": OpenAIStub(config(args.openai_latency), args.run_latency, args.tool_script).start(),
+        "graph": GraphStub(config(args.graph_latency)).start(),
+        "amadeus": AmadeusStub(config(args.amadeus_latency)).start(),
+        "google": GooglePlacesStub(config(args.google_latency)).start(),
+        "openweathermap": OpenWeatherMapStub(config(args.weather_latency)).start(),
+    }
+
+
+def configure_environment(args, stubs):
+    """Point every service module at the stubs. Must run before the app is imported."""
+    amadeus_host, amadeus_port = stubs["amadeus"].base_url[len("http://"):].split(":")
+    env = {
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_ASSISTANT_ID": "asst_benchmark",
+        "OPENAI_BASE_URL": f"{stubs['openai'].base_url}/v1",
+        "OPENAI_RUN_MODE": args.run_mode,
+        "CONVERSATION_ENGINE": args.engine,
+        "GRAPH_API_BASE_URL": stubs["graph"].base_url,
+        "AMADEUS_API_KEY": "benchmark",
+        "AMADEUS_API_SECRET": "benchmark",
+        "AMADEUS_HOST": amadeus_host,
+        "AMADEUS_PORT": amadeus_port,
+        "AMADEUS_SSL": "false",
+        "GOOGLEMAPS_API_KEY": "AIzaBenchmarkKey",
+        "GOOGLEMAPS_BASE_URL": stubs["google"].base_url,
+        "GOOGLEMAPS_QUERIES_PER_SECOND": "1000",
+        "OPENWEATHERMAP_API_KEY": "benchmark",
+        "OPENWEATHERMAP_BASE_URL": stubs["openweathermap"].base_url,
+        "APP_SECRET": APP_SECRET,
+        "ACCESS_TOKEN": "benchmark",
+        "VERSION": "v18.0",
+        "PHONE_NUMBER_ID": "1234567890",
+        "RECIPIENT_WAID": "254700000000",
+        "VERIFY_TOKEN": "benchmark",
+        "WEBHOOK_MODE": args.mode,
+        "THREAD_STORE_BACKEND": "memory",
+        "QUEUE_BACKEND": "memory",
+        "QUEUE_MAX_SIZE": str(max(100, args.messages)),
+        "IATA_CACHE_PATH": ":memory:",
+        # Nothing carried over between runs; --env TOOL_CACHE_BACKEND=sqlite to include the shared tier
+        "TOOL_CACHE_BACKEND": "memory",
+    }
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+    os.environ.update(env)
+
+
+def webhook_payload(index, wa_id):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "benchmark",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "1234567890"},
+                    "contacts": [{"profile": {"name": f"Bench User {wa_id}"}, "wa_id": wa_id}],
+                    "messages": [{
+                        "from": wa_id,
+                        "id": f"wamid.bench.{index}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": f"Any tips for Mombasa next week? [bench:{index}]"},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def run(args):
+    stubs = start_stubs(args)
+    configure_environment(args, stubs)
+
+    # Imported only now: the service modules read their configuration at import time
+    import requests
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.utils import metrics
+
+    app = create_app()
+    if not args.verbose:
+        for logger_name in ("", "werkzeug"):
+            logging.getLogger(logger_name).setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True).start()
+    webhook_url = f"http://127.0.0.1:{server.server_port}/webhook"
+    metrics.reset()
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=64)
+    session.mount("http://", adapter)
+    sent_at = {}
+    ack_times = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(index):
+        wa_id = f"2547{index % args.users:08d}"
+        body = json.dumps(webhook_payload(index, wa_id)).encode("utf-8")
+        signature = hmac.new(APP_SECRET.encode("latin-1"), body, hashlib.sha256).hexdigest()
+        started = time.perf_counter()
+        with lock:
+            sent_at[index] = started
+        try:
+            response = session.post(webhook_url, data=body, timeout=120, headers={
+                "Content-Type": "application/json",
+                "X-Hub-Signature-256": f"sha256={signature}",
+            })
+            status = response.status_code
+        except requests.RequestException:
+            status = "error"
+        with lock:
+            ack_times.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    # Open-loop load: webhooks go out on schedule whether or not earlier ones were answered
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(256, args.messages)) as pool:
+        for index in range(args.messages):
+            delay = started + index / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index)
+
+        drain_until = time.perf_counter() + args.drain_timeout
+        while time.perf_counter() < drain_until and len(stubs["graph"].delivered) < args.messages:
+            time.sleep(0.05)
+    finished = time.perf_counter()
+
+    delivered = dict(stubs["graph"].delivered)
+    end_to_end = [delivered[i] - sent_at[i] for i in delivered if i in sent_at]
+    last_delivery = max(delivered.values(), default=finished)
+    report = {
+        "config": {
+            "rate": args.rate, "messages": args.messages, "users": args.users, "mode": args.mode,
+            "engine": args.engine, "run_mode": args.run_mode, "tool_script": args.tool_script, "run_latency": args.run_latency,
+            "latency": args.latency, "error_rate": args.error_rate, "env": args.env,
+        },
+        "webhook_status": {str(k): v for k, v in statuses.items()},
+        "replies_delivered": len(delivered),
+        "replies_missing": args.messages - len(delivered),
+        "throughput_rps": round(len(delivered) / max(last_delivery - started, 1e-9), 2),
+        "webhook_ack": percentiles(ack_times),
+        "end_to_end": percentiles(end_to_end),
+        "stages": metrics.snapshot(),
+        "upstream_requests": {name: stub.counts() for name, stub in stubs.items()},
+        "wall_time_s": round(finished - started, 2),
+    }
+
+    server.shutdown()
+    for stub in stubs.values():
+        stub.stop()
+    return report
+
+
+def print_report(report):
+    print(f"\nConfig: {json.dumps(report['config'])}")
+    print(f"Webhook responses: {report['webhook_status']}")
+    print(f"Replies delivered: {report['replies_delivered']} (missing {report['replies_missing']}), "
+          f"throughput {report['throughput_rps']} replies/s, wall time {report['wall_time_s']}s")
+    for name in ("webhook_ack", "end_to_end"):
+        stats = report[name]
+        if stats["count"]:
+            print(f"{name:>12}: p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  "
+                  f"p99 {stats['p99_ms']}ms  max {stats['max_ms']}ms  (n={stats['count']})")
+
+    print("\nStages:")
+    for name, timer in sorted(report["stages"]["timers"].items()):
+        print(f"  {name:<40} n={timer['count']:<6} p50 {timer['p50_ms']:>8}ms  "
+              f"p95 {timer['p95_ms']:>8}ms  p99 {timer['p99_ms']:>8}ms")
+    print("\nCounters:")
+    for name, value in sorted(report["stages"]["counters"].items()):
+        print(f"  {name:<40} {value}")
+    print("\nUpstream requests:")
+    for stub_name, counts in report["upstream_requests"].items():
+        total = sum(v for k, v in counts.items() if k != "injected_errors")
+        print(f"  {stub_name} ({total} total)")
+        for route, count in sorted(counts.items()):
+            print(f"    {route:<60} {count}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["replies_missing"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,706 @@
+"""
+Local stand-in servers for the APIs the bot calls: the OpenAI Assistants API, the WhatsApp
+Graph send endpoint, Amadeus, Google Places and OpenWeatherMap.
+
+Each server adds a configurable latency (with jitter) and error rate to every request and
+counts requests per route, so a benchmark can compare upstream call counts between runs.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubConfig:
+    """Latency (seconds) and error rate applied to every request a stub server handles."""
+
+    def __init__(self, latency=0.05, jitter=0.2, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, latency=None):
+        latency = self.latency if latency is None else latency
+        with self._lock:
+            factor = self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(max(0.0, latency * factor))
+
+    def should_fail(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        stub = self.server.stub
+        parsed = urlparse(self.path)
+        body = self._read_body()
+        route = stub.route_name(method, parsed.path)
+        stub.count(route)
+        stub.config.delay()
+        if stub.config.should_fail():
+            stub.count("injected_errors")
+            self.send_json(500, {"error": {"message": "Injected stub failure", "type": "server_error"}})
+            return
+        stub.handle(self, method, parsed.path, parse_qs(parsed.query), body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_event_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, event, data):
+        payload = data if isinstance(data, str) else json.dumps(data)
+        chunk = f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def end_event_stream(self):
+        self.send_event("done", "[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer:
+    """Base class: a threaded HTTP server on a free localhost port with per-route counters."""
+
+    name = "stub"
+
+    def __init__(self, config=None):
+        self.config = config or StubConfig()
+        self._counts = defaultdict(int)
+        self._counts_lock = threading.Lock()
+        self._server = None
+
+    def route_name(self, method, path):
+        return f"{method} {path}"
+
+    def count(self, route):
+        with self._counts_lock:
+            self._counts[route] += 1
+
+    def counts(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def handle(self, request, method, path, query, body):
+        request.send_json(404, {"error": f"No stub route for {method} {path}"})
+
+    def start(self):
+        self._server = _Server(("127.0.0.1", 0), StubHandler)
+        self._server.stub = self
+        threading.Thread(target=self._server.serve_forever, name=f"{self.name}-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+
+# Tool-call scripts: each round is the list of tool calls one requires_action step asks for
+TOOL_SCRIPTS = {
+    "none": [],
+    "weather": [
+        [{"name": "get_weather", "arguments": {"city": "Mombasa"}}],
+    ],
+    "travel": [
+        [
+            {"name": "get_weather", "arguments": {"city": "Mombasa"}},
+            {"name": "get_hotels", "arguments": {"city_code": "Mombasa"}},
+            {"name": "get_flight_offers", "arguments": {
+                "origin": "Nairobi", "destination": "Mombasa", "departure_date": "2030-01-15"}},
+        ],
+    ],
+    "flights": [
+        [{"name": "get_flight_offers", "arguments": {
+            "origin": "Nairobi", "destination": "Mombasa", "departure_date": "2030-01-15"}}],
+        [{"name": "get_more_flight_offers", "arguments": {
+            "search_id": "NBO:MBA:2030-01-15::1", "page": 2, "sort_by": "duration"}}],
+    ],
+    "fares": [
+        [{"name": "get_fare_calendar", "arguments": {
+            "origin": "NBO", "destination": "DXB", "start_date": "2030-01-13", "days": 7}}],
+    ],
+    "hotel_offers": [
+        [{"name": "get_hotels", "arguments": {
+            "city_code": "Mombasa", "check_in_date": "2030-01-15", "check_out_date": "2030-01-18", "adults": 2}}],
+    ],
+    "places": [
+        [{"name": "search_location", "arguments": {"query": "Fort Jesus Mombasa"}}],
+        [
+            {"name": "get_location_details", "arguments": {"place_id": "stub-place-0"}},
+            {"name": "search_nearby_places", "arguments": {"lat": -4.0627, "lng": 39.6794, "keyword": "restaurant"}},
+        ],
+    ],
+    "itinerary": [
+        [{"name": "plan_day_itinerary", "arguments": {
+            "stops": [f"stub-place-{i}" for i in range(6)], "date": "2030-01-15", "start_time": "08:30"}}],
+    ],
+    "photos": [
+        [{"name": "get_place_photos", "arguments": {
+            "photo_references": [f"photo-stub-place-{i}" for i in range(5)], "max_width": 800}}],
+    ],
+    # "Restaurants near me" from a few meters apart in the same neighbourhood
+    "nearby": [
+        [{"name": "search_nearby_places", "arguments": {"lat": -4.0627, "lng": 39.6794, "radius": 1000, "keyword": "restaurant"}}],
+        [{"name": "search_nearby_places", "arguments": {"lat": -4.0631, "lng": 39.6790, "radius": 1000, "keyword": "Restaurant"}}],
+        [{"name": "search_nearby_places", "arguments": {"lat": -4.0624, "lng": 39.6799, "radius": 800, "keyword": "restaurant"}}],
+    ],
+}
+
+BENCH_TOKEN = re.compile(r"\[bench:(\d+)\]")
+
+
+class OpenAIStub(StubServer):
+    """
+    Minimal Assistants API: threads, messages, runs (streamed over SSE or polled),
+    tool-call rounds from a script, run steps and run cancellation, plus chat completions.
+    Each run "thinks" for run_latency seconds before every tool round and before the reply.
+    The reply echoes the [bench:N] tokens of the user messages it answers.
+    """
+
+    name = "openai"
+
+    def __init__(self, config=None, run_latency=0.5, tool_script="weather"):
+        super().__init__(config)
+        self.run_latency = run_latency
+        self.tool_script = TOOL_SCRIPTS[tool_script] if isinstance(tool_script, str) else tool_script
+        self._threads = {}
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def route_name(self, method, path):
+        path = re.sub(r"^/v1", "", path)
+        path = re.sub(r"/(thread|msg|run|step|call|chatcmpl)_\d+", r"/{\1}", path)
+        return f"{method} {path}"
+
+    # Object builders
+
+    def _thread_obj(self, thread_id):
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    def _message_obj(self, message, status="completed"):
+        content = [{"type": "text", "text": {"value": message["text"], "annotations": []}}] if message["text"] else []
+        return {
+            "id": message["id"],
+            "object": "thread.message",
+            "created_at": message["created_at"],
+            "thread_id": message["thread_id"],
+            "role": message["role"],
+            "content": content,
+            "assistant_id": None,
+            "run_id": message.get("run_id"),
+            "attachments": [],
+            "metadata": {},
+            "status": status,
+        }
+
+    def _run_obj(self, run):
+        required_action = None
+        if run["status"] == "requires_action":
+            required_action = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": run["tool_calls"]},
+            }
+        return {
+            "id": run["id"],
+            "object": "thread.run",
+            "created_at": int(run["created_at"]),
+            "thread_id": run["thread_id"],
+            "assistant_id": run["assistant_id"],
+            "status": run["status"],
+            "required_action": required_action,
+            "last_error": None,
+            "model": "stub-model",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+
+    def _list_obj(self, data, has_more=False):
+        return {
+            "object": "list",
+            "data": data,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+            "has_more": has_more,
+        }
+
+    # Run state machine
+
+    def _new_run(self, thread_id, assistant_id):
+        run = {
+            "id": self._id("run"),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "round": 0,
+            "tool_calls": [],
+            "ready_at": time.time() + self.run_latency,
+            "message_id": None,
+        }
+        with self._lock:
+            self._runs[run["id"]] = run
+        return run
+
+    def _reply_text(self, thread_id):
+        with self._lock:
+            messages = self._threads[thread_id]["messages"]
+            # Answer every user message added since the last assistant reply
+            pending = []
+            for message in reversed(messages):
+                if message["role"] == "assistant":
+                    break
+                pending.append(message["text"])
+        tokens = BENCH_TOKEN.findall(" ".join(reversed(pending)))
+        marker = " ".join(f"[bench:{token}]" for token in tokens)
+        return f"Here is what I found for you. {marker}".strip()
+
+    def _advance(self, run):
+        """Move a polled run forward once its think time has elapsed."""
+        if run["status"] not in ("queued", "in_progress") or time.time() < run["ready_at"]:
+            if run["status"] == "queued":
+                run["status"] = "in_progress"
+            return
+        if run["round"] < len(self.tool_script):
+            run["tool_calls"] = self._tool_calls(run["round"])
+            run["status"] = "requires_action"
+        else:
+            self._complete(run)
+
+    def _tool_calls(self, round_index):
+        return [
+            {"id": self._id("call"), "type": "function",
+             "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}}
+            for call in self.tool_script[round_index]
+        ]
+
+    def _complete(self, run):
+        message = self._add_message(run["thread_id"], "assistant", self._reply_text(run["thread_id"]), run["id"])
+        run["message_id"] = message["id"]
+        run["status"] = "completed"
+        return message
+
+    def _add_message(self, thread_id, role, text, run_id=None):
+        message = {
+            "id": self._id("msg"),
+            "thread_id": thread_id,
+            "role": role,
+            "text": text,
+            "created_at": int(time.time()),
+            "run_id": run_id,
+        }
+        with self._lock:
+            self._threads[thread_id]["messages"].append(message)
+        return message
+
+    def _stream_run(self, request, run):
+        """Stream a run segment: think, then either requires_action or the reply."""
+        request.start_event_stream()
+        if run["round"] == 0 and run["status"] == "queued":
+            request.send_event("thread.run.created", self._run_obj(run))
+        run["status"] = "in_progress"
+        request.send_event("thread.run.in_progress", self._run_obj(run))
+        time.sleep(self.run_latency)
+
+        if run["round"] < len(self.tool_script):
+            run["tool_calls"] = self._tool_calls(run["round"])
+            run["status"] = "requires_action"
+            request.send_event("thread.run.requires_action", self._run_obj(run))
+        else:
+            text = self._reply_text(run["thread_id"])
+            placeholder = {"id": self._id("msg"), "thread_id": run["thread_id"], "role": "assistant",
+                           "text": "", "created_at": int(time.time()), "run_id": run["id"]}
+            request.send_event("thread.message.created", self._message_obj(placeholder, "in_progress"))
+            for index, piece in enumerate(re.findall(r"\S+\s*", text)):
+                request.send_event("thread.message.delta", {
+                    "id": placeholder["id"], "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": piece}}]},
+                })
+            message = self._complete(run)
+            request.send_event("thread.message.completed", self._message_obj(message))
+            request.send_event("thread.run.completed", self._run_obj(run))
+        request.end_event_stream()
+
+    def _active_run(self, thread_id):
+        with self._lock:
+            for run in self._runs.values():
+                if run["thread_id"] == thread_id and run["status"] in ("queued", "in_progress", "requires_action"):
+                    return run
+        return None
+
+    def _chat_completion(self, request, payload):
+        """
+        Chat completion for the chat engine and for conversation summaries. Requests that carry
+        tools go through the same tool-call rounds as a run, counted from the tool results
+        since the last user message, then answer the pending user messages.
+        """
+        time.sleep(self.run_latency)
+        messages = payload.get("messages", [])
+        if not payload.get("tools"):
+            prompt = " ".join(str(m.get("content") or "") for m in messages)
+            return self._send_completion(request, payload, {"role": "assistant", "content":
+                                         f"Summary of {len(prompt.split())} words of conversation."})
+
+        pending = []
+        rounds = 0
+        for message in reversed(messages):
+            if message["role"] == "assistant" and not message.get("tool_calls"):
+                break
+            if message["role"] == "assistant":
+                rounds += 1
+            elif message["role"] == "user":
+                pending.append(str(message.get("content") or ""))
+        if rounds < len(self.tool_script) and payload.get("tool_choice") != "none":
+            return self._send_completion(request, payload, {
+                "role": "assistant", "content": None, "tool_calls": self._tool_calls(rounds),
+            }, finish_reason="tool_calls")
+
+        tokens = BENCH_TOKEN.findall(" ".join(reversed(pending)))
+        marker = " ".join(f"[bench:{token}]" for token in tokens)
+        return self._send_completion(request, payload, {
+            "role": "assistant", "content": f"Here is what I found for you. {marker}".strip(),
+        })
+
+    def _send_completion(self, request, payload, message, finish_reason="stop"):
+        prompt_tokens = len(json.dumps(payload.get("messages", []))) // 4
+        return request.send_json(200, {
+            "id": self._id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub-model"),
+            "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 10,
+                      "total_tokens": prompt_tokens + 10},
+        })
+
+    # Routing
+
+    def handle(self, request, method, path, query, body):
+        path = re.sub(r"^/v1", "", path)
+        payload = json.loads(body) if body else {}
+        parts = [part for part in path.split("/") if part]
+
+        if method == "POST" and parts == ["threads"]:
+            thread_id = self._id("thread")
+            with self._lock:
+                self._threads[thread_id] = {"messages": []}
+            for message in payload.get("messages", []):
+                self._add_message(thread_id, message.get("role", "user"), message.get("content"))
+            return request.send_json(200, self._thread_obj(thread_id))
+
+        if method == "POST" and parts == ["chat", "completions"]:
+            return self._chat_completion(request, payload)
+
+        if len(parts) < 2 or parts[0] != "threads" or parts[1] not in self._threads:
+            return request.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+        thread_id = parts[1]
+        rest = parts[2:]
+
+        active = self._active_run(thread_id) if method == "POST" and rest in (["messages"], ["runs"]) else None
+        if active is not None:
+            # Same errors the real API returns when a thread already has a run in flight
+            self.count("active_run_conflicts")
+            if rest == ["messages"]:
+                message = f"Can't add messages to {thread_id} while a run {active['id']} is active."
+            else:
+                message = f"Thread {thread_id} already has an active run {active['id']}."
+            return request.send_json(400, {"error": {"message": message, "type": "invalid_request_error"}})
+
+        if rest == ["messages"] and method == "POST":
+            content = payload.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content)
+            message = self._add_message(thread_id, payload.get("role", "user"), content)
+            return request.send_json(200, self._message_obj(message))
+
+        if rest == ["messages"] and method == "GET":
+            with self._lock:
+                messages = list(self._threads[thread_id]["messages"])
+            run_id = query.get("run_id", [None])[0]
+            if run_id:
+                messages = [m for m in messages if m.get("run_id") == run_id]
+            if query.get("order", ["desc"])[0] == "desc":
+                messages.reverse()
+            after = query.get("after", [None])[0]
+            if after:
+                ids = [m["id"] for m in messages]
+                messages = messages[ids.index(after) + 1:] if after in ids else []
+            limit = int(query.get("limit", ["20"])[0])
+            return request.send_json(200, self._list_obj(
+                [self._message_obj(m) for m in messages[:limit]], has_more=len(messages) > limit))
+
+        if len(rest) == 2 and rest[0] == "messages" and method == "GET":
+            with self._lock:
+                matches = [m for m in self._threads[thread_id]["messages"] if m["id"] == rest[1]]
+            if not matches:
+                return request.send_json(404, {"error": {"message": "No such message"}})
+            return request.send_json(200, self._message_obj(matches[0]))
+
+        if rest == ["runs"] and method == "POST":
+            run = self._new_run(thread_id, payload.get("assistant_id"))
+            if payload.get("stream"):
+                return self._stream_run(request, run)
+            return request.send_json(200, self._run_obj(run))
+
+        if rest == ["runs"] and method == "GET":
+            with self._lock:
+                runs = [r for r in self._runs.values() if r["thread_id"] == thread_id]
+            return request.send_json(200, self._list_obj([self._run_obj(r) for r in reversed(runs)]))
+
+        run = self._runs.get(rest[1]) if len(rest) >= 2 and rest[0] == "runs" else None
+        if run is None:
+            return request.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+        if len(rest) == 2 and method == "GET":
+            self._advance(run)
+            return request.send_json(200, self._run_obj(run))
+
+        if rest[2:] == ["submit_tool_outputs"] and method == "POST":
+            if run["status"] != "requires_action":
+                return request.send_json(400, {"error": {"message": "Run is not waiting for tool outputs"}})
+            run["round"] += 1
+            run["tool_calls"] = []
+            run["status"] = "queued"
+            run["ready_at"] = time.time() + self.run_latency
+            if payload.get("stream"):
+                return self._stream_run(request, run)
+            return request.send_json(200, self._run_obj(run))
+
+        if rest[2:] == ["cancel"] and method == "POST":
+            run["status"] = "cancelled"
+            return request.send_json(200, self._run_obj(run))
+
+        if rest[2:] == ["steps"] and method == "GET":
+            steps = []
+            if run["message_id"]:
+                steps.append({
+                    "id": self._id("step"), "object": "thread.run.step", "created_at": int(time.time()),
+                    "run_id": run["id"], "thread_id": thread_id, "assistant_id": run["assistant_id"],
+                    "type": "message_creation", "status": "completed",
+                    "step_details": {"type": "message_creation",
+                                     "message_creation": {"message_id": run["message_id"]}},
+                })
+            return request.send_json(200, self._list_obj(steps))
+
+        return request.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+
+class GraphStub(StubServer):
+    """WhatsApp Cloud API send endpoint. Records when each [bench:N] token is delivered."""
+
+    name = "graph"
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.delivered = {}
+        self._delivered_lock = threading.Lock()
+
+    def route_name(self, method, path):
+        return f"{method} /{{version}}/{{phone_number_id}}/messages"
+
+    def handle(self, request, method, path, query, body):
+        payload = json.loads(body or b"{}")
+        text = payload.get("text", {}).get("body", "")
+        now = time.perf_counter()
+        with self._delivered_lock:
+            for token in BENCH_TOKEN.findall(text):
+                self.delivered.setdefault(int(token), now)
+        request.send_json(200, {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+        })
+
+
+class AmadeusStub(StubServer):
+    """OAuth token, city search, flight offers, hotels by city and hotel offers."""
+
+    name = "amadeus"
+
+    def __init__(self, config=None, hotels_per_city=20, offers_per_search=25):
+        super().__init__(config)
+        self.hotels_per_city = hotels_per_city
+        self.offers_per_search = offers_per_search
+
+    def handle(self, request, method, path, query, body):
+        arg = lambda name, default=None: query.get(name, [default])[0]
+
+        if path == "/v1/security/oauth2/token":
+            return request.send_json(200, {
+                "type": "amadeusOAuth2Token", "access_token": "stub-token",
+                "token_type": "Bearer", "expires_in": 1799, "state": "approved",
+            })
+
+        if path == "/v1/reference-data/locations":
+            keyword = (arg("keyword") or "XXX").upper()
+            return request.send_json(200, {"data": [{"subType": "CITY", "iataCode": keyword[:3], "name": keyword}]})
+
+        if path == "/v2/shopping/flight-offers":
+            origin, destination = arg("originLocationCode"), arg("destinationLocationCode")
+            date = arg("departureDate")
+            # Fares vary with the departure date so a fare calendar has a cheapest day
+            date_markup = sum(map(ord, date or "")) * 7 % 90
+            offers = []
+            for i in range(self.offers_per_search):
+                stops = i % 3
+                segments = []
+                for s in range(stops + 1):
+                    segments.append({
+                        "departure": {"iataCode": origin if s == 0 else "ADD", "at": f"{date}T{6 + i % 12:02d}:00:00"},
+                        "arrival": {"iataCode": destination if s == stops else "ADD", "at": f"{date}T{8 + i % 12 + s:02d}:30:00"},
+                        "carrierCode": "KQ", "number": str(100 + i), "duration": f"PT{1 + s}H30M",
+                    })
+                offers.append({
+                    "id": str(i + 1),
+                    "price": {"total": f"{120 + date_markup + (i * 37) % 400}.00", "currency": "EUR"},
+                    "itineraries": [{"duration": f"PT{2 + stops * 2}H{(i * 7) % 60}M", "segments": segments}],
+                    "numberOfBookableSeats": 9,
+                })
+            return request.send_json(200, {"data": offers})
+
+        if path == "/v1/reference-data/locations/hotels/by-city":
+            city = arg("cityCode", "XXX")
+            return request.send_json(200, {"data": [
+                {"hotelId": f"HT{city}{i:03d}", "name": f"Stub Hotel {city} {i}",
+                 "address": {"lines": [f"{i} Beach Road"]}, "iataCode": city}
+                for i in range(self.hotels_per_city)
+            ]})
+
+        if path == "/v3/shopping/hotel-offers":
+            hotel_ids = (arg("hotelIds") or "").split(",")
+            city = arg("cityCode")
+            if city:
+                hotel_ids = [f"HT{city}{i:03d}" for i in range(5)]
+            return request.send_json(200, {"data": [
+                {"hotel": {"hotelId": hotel_id, "name": f"Stub Hotel {hotel_id}", "rating": "4"},
+                 "offers": [{"id": f"OF{hotel_id}", "price": {"total": "150.00", "currency": "EUR"}}]}
+                for hotel_id in hotel_ids if hotel_id
+            ]})
+
+        request.send_json(404, {"errors": [{"detail": f"No stub route for {path}"}]})
+
+
+class GooglePlacesStub(StubServer):
+    """Find Place, Nearby Search, Place Details and the Place Photo redirect."""
+
+    name = "google"
+
+    def handle(self, request, method, path, query, body):
+        arg = lambda name, default=None: query.get(name, [default])[0]
+
+        if path == "/maps/api/place/findplacefromtext/json":
+            text = arg("input", "")
+            if "nowhere" in text.lower():
+                return request.send_json(200, {"status": "ZERO_RESULTS", "candidates": []})
+            return request.send_json(200, {"status": "OK", "candidates": [{
+                "name": text.title(), "formatted_address": f"{text}, Kenya", "place_id": "stub-place-0",
+                "geometry": {"location": {"lat": -4.0627, "lng": 39.6794}},
+            }]})
+
+        if path == "/maps/api/place/nearbysearch/json":
+            lat, lng = (float(v) for v in arg("location", "0,0").split(","))
+            spread = float(arg("radius", "2000")) / 111320  # degrees, keeps results inside the radius
+            rng = random.Random(arg("location"))
+            # Sparse areas return fewer places than the 20 of a full page
+            count = rng.choice([8, 12, 16, 20])
+            return request.send_json(200, {"status": "OK", "results": [
+                {"name": f"Stub Place {i}", "vicinity": f"{i} Main Street", "rating": round(rng.uniform(3, 5), 1),
+                 "place_id": f"stub-place-{rng.randrange(10 ** 8)}",
+                 "geometry": {"location": {"lat": lat + rng.uniform(-spread, spread), "lng": lng + rng.uniform(-spread, spread)}},
+                 "opening_hours": {"open_now": rng.random() < 0.8},
+                 "photos": [{"photo_reference": f"photo-nearby-{i}", "width": 1600, "height": 1200}]}
+                for i in range(count)
+            ]})
+
+        if path == "/maps/api/place/details/json":
+            place_id = arg("placeid") or arg("place_id", "stub-place-0")  # the googlemaps client sends "placeid"
+            # Each place sits somewhere around Mombasa and opens between 06:00 and 12:00
+            rng = random.Random(place_id)
+            opens = rng.randrange(6, 13)
+            return request.send_json(200, {"status": "OK", "result": {
+                "name": f"Stub {place_id}", "formatted_address": "Mombasa, Kenya", "rating": 4.5,
+                "formatted_phone_number": "+254 700 000000", "website": "https://example.com",
+                "opening_hours": {
+                    "weekday_text": [f"Monday: {opens}:00 – {opens + 10}:00"],
+                    "periods": [{"open": {"day": d, "time": f"{opens:02d}00"}, "close": {"day": d, "time": f"{opens + 10:02d}00"}}
+                                for d in range(7)],
+                },
+                "photos": [{"photo_reference": f"photo-{place_id}", "width": 1600, "height": 1200}],
+                "geometry": {"location": {"lat": -4.0627 + rng.uniform(-0.05, 0.05), "lng": 39.6794 + rng.uniform(-0.05, 0.05)}},
+                "utc_offset": 180,
+            }})
+
+        if path == "/maps/api/place/photo":
+            reference = arg("photo_reference", "none")
+            request.send_response(302)
+            request.send_header("Location", f"https://lh3.example.com/{reference}=w{arg('maxwidth', '800')}")
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        request.send_json(404, {"status": "NOT_FOUND"})
+
+
+class OpenWeatherMapStub(StubServer):
+    name = "openweathermap"
+
+    def handle(self, request, method, path, query, body):
+        if path == "/data/2.5/weather":
+            return request.send_json(200, {
+                "name": query.get("q", [""])[0],
+                "main": {"temp": 29.5, "feels_like": 33.1, "humidity": 74},
+                "weather": [{"description": "scattered clouds"}],
+            })
+        request.send_json(404, {"cod": "404", "message": "city not found"})
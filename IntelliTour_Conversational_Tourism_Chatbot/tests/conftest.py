@@ -0,0 +1,11 @@
+import os
+
+# Importing app loads every service, and they build their API clients at import time.
+# The tests never call the APIs, so placeholder credentials are enough.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("AMADEUS_API_KEY", "test")
+os.environ.setdefault("AMADEUS_API_SECRET", "test")
+os.environ.setdefault("GOOGLEMAPS_API_KEY", "AIza" + "0" * 35)
+# Keep caches and stores in memory instead of writing SQLite files into the working directory
+os.environ.setdefault("TOOL_CACHE_BACKEND", "memory")
+os.environ.setdefault("THREAD_STORE_BACKEND", "memory")
@@ -0,0 +1,55 @@
+import math
+
+import pytest
+
+from app.utils import geo
+
+POINTS = [(-4.0435, 39.6682), (-1.2921, 36.8219), (57.64911, 10.40744), (-33.8688, 151.2093), (0.0, 0.0), (64.1466, -21.9426)]
+
+
+def test_geohash_encode_known_value():
+    assert geo.geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+@pytest.mark.parametrize("lat, lng", POINTS)
+@pytest.mark.parametrize("precision", [1, 4, 6, 8, 11])
+def test_geohash_bounds_round_trip(lat, lng, precision):
+    cell = geo.geohash_encode(lat, lng, precision)
+    lat_min, lat_max, lng_min, lng_max = geo.geohash_bounds(cell)
+
+    assert lat_min <= lat <= lat_max
+    assert lng_min <= lng <= lng_max
+    assert geo.geohash_encode(*geo.cell_center(cell), precision) == cell
+
+
+def test_cell_size_matches_bounds():
+    cell = geo.geohash_encode(-4.0435, 39.6682, 6)
+    lat_min, lat_max, lng_min, lng_max = geo.geohash_bounds(cell)
+    height, width = geo.cell_size_m(6, -4.0435)
+
+    assert geo.haversine_m(lat_min, lng_min, lat_max, lng_min) == pytest.approx(height, rel=1e-3)
+    assert geo.haversine_m(-4.0435, lng_min, -4.0435, lng_max) == pytest.approx(width, rel=1e-3)
+
+
+@pytest.mark.parametrize("lat, lng", POINTS)
+@pytest.mark.parametrize("radius", [300, 1500, 5000])
+def test_covering_cells_cover_the_circle(lat, lng, radius):
+    cells = geo.covering_cells(lat, lng, radius)
+    assert len(cells) == len(set(cells))
+    precision = len(cells[0])
+
+    # Points on rings inside the circle all fall in one of the cells
+    for fraction in (0, 0.5, 0.99):
+        for bearing in range(0, 360, 15):
+            d_lat = fraction * radius * math.cos(math.radians(bearing)) / 111195
+            d_lng = fraction * radius * math.sin(math.radians(bearing)) / (111195 * math.cos(math.radians(lat)))
+            assert geo.geohash_encode(lat + d_lat, lng + d_lng, precision) in cells
+
+
+def test_cell_within():
+    lat, lng = -4.0435, 39.6682
+    cell = geo.geohash_encode(lat, lng, 7)
+
+    assert geo.cell_within(lat, lng, 2 * geo.cell_radius_m(cell), cell)
+    assert not geo.cell_within(lat, lng, 10, cell)
+    assert not geo.cell_within(lat + 0.1, lng, 1000, cell)
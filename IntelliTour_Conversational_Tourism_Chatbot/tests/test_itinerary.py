@@ -0,0 +1,85 @@
+import datetime as dt
+import math
+
+import pytest
+
+from app.services.itinerary_service import _improve, format_clock, opening_windows, parse_clock, plan_day_itinerary
+
+FRIDAY = dt.date(2026, 10, 16)
+SATURDAY = dt.date(2026, 10, 17)
+SUNDAY = dt.date(2026, 10, 18)
+
+
+def period(open_day, open_time, close_day=None, close_time=None):
+    # Google numbers days from 0 (Sunday) to 6 (Saturday)
+    result = {"open": {"day": open_day, "time": open_time}}
+    if close_day is not None:
+        result["close"] = {"day": close_day, "time": close_time}
+    return result
+
+
+def test_parse_clock():
+    assert parse_clock("09:30") == 570
+    assert parse_clock(" 23:59 ") == 23 * 60 + 59
+
+
+@pytest.mark.parametrize("value", ["24:00", "12:60", "9am", "", "12:30:00"])
+def test_parse_clock_rejects_invalid_times(value):
+    with pytest.raises(ValueError):
+        parse_clock(value)
+
+
+def test_format_clock_marks_the_next_day():
+    assert format_clock(9 * 60 + 5) == "09:05"
+    assert format_clock(25 * 60) == "01:00 (+1 day)"
+
+
+def test_opening_windows_same_day():
+    periods = [period(5, "0900", 5, "1700")]
+    assert opening_windows(periods, FRIDAY) == [(9 * 60, 17 * 60)]
+    assert opening_windows(periods, SATURDAY) == []
+
+
+def test_opening_windows_overnight_period():
+    # Friday 22:00 to Saturday 02:00
+    periods = [period(5, "2200", 6, "0200")]
+    assert opening_windows(periods, FRIDAY) == [(22 * 60, 26 * 60)]
+    # On Saturday the period started two hours before midnight
+    assert opening_windows(periods, SATURDAY) == [(-2 * 60, 2 * 60)]
+
+
+def test_opening_windows_overnight_across_the_week_boundary():
+    # Saturday 20:00 to Sunday 03:00
+    periods = [period(6, "2000", 0, "0300")]
+    assert opening_windows(periods, SATURDAY) == [(20 * 60, 27 * 60)]
+    assert opening_windows(periods, SUNDAY) == [(-4 * 60, 3 * 60)]
+
+
+def test_opening_windows_unknown_and_always_open():
+    assert opening_windows(None, FRIDAY) is None
+    assert opening_windows([period(0, "0000")], FRIDAY) == [(0, 2 * 24 * 60)]
+
+
+def test_improve_uncrosses_a_route():
+    corners = [(0, 0), (1, 1), (1, 0), (0, 1)]
+
+    def length(order):
+        return sum(math.dist(corners[a], corners[b]) for a, b in zip(order, order[1:]))
+
+    order, best = _improve([0, 1, 2, 3], length, fixed_first=True)
+    assert order[0] == 0
+    assert best == pytest.approx(3)
+
+
+def test_plan_orders_stops_along_the_route():
+    # Stops on a line east of the start, given out of order
+    stops = [{"name": f"Stop {i}", "lat": -4.05, "lng": 39.60 + 0.01 * i} for i in (3, 1, 4, 2)]
+    plan = plan_day_itinerary(stops, date="2026-10-16", start_lat=-4.05, start_lng=39.60)
+
+    assert [stop["name"] for stop in plan["stops"]] == ["Stop 1", "Stop 2", "Stop 3", "Stop 4"]
+    assert plan["start_time"] == "09:00"
+
+
+def test_plan_rejects_a_malformed_start_time():
+    plan = plan_day_itinerary([{"lat": -4.05, "lng": 39.60}], start_time="9.30")
+    assert "error" in plan
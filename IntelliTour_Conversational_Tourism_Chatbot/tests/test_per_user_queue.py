@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.per_user_queue import PerUserQueue
+
+
+class Recorder:
+    """Handler that records its batches and can hold the first one until released."""
+
+    def __init__(self, hold_first=False):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold_first:
+            self.release.set()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        assert self.release.wait(5)
+
+
+def start(queue, key, item, handler, **kwargs):
+    thread = threading.Thread(target=queue.process, args=(key, item, handler), kwargs=kwargs)
+    thread.start()
+    return thread
+
+
+def test_messages_behind_a_running_batch_are_coalesced_in_order():
+    queue = PerUserQueue()
+    handler = Recorder(hold_first=True)
+    drainer = start(queue, "user", 1, handler)
+    assert handler.started.wait(5)
+
+    # The drainer is busy, so these only queue up behind it
+    for item in (2, 3, 4):
+        queue.process("user", item, handler, wait=False)
+    assert queue.stats() == {"active_users": 1, "queued_messages": 3}
+
+    handler.release.set()
+    drainer.join(5)
+    assert handler.batches == [[1], [2, 3, 4]]
+    assert queue.stats() == {"active_users": 0, "queued_messages": 0}
+
+
+def test_waiting_callers_return_once_their_message_is_handled():
+    queue = PerUserQueue()
+    handler = Recorder(hold_first=True)
+    drainer = start(queue, "user", 1, handler)
+    assert handler.started.wait(5)
+
+    follower = start(queue, "user", 2, handler)
+    time.sleep(0.05)
+    assert follower.is_alive()
+
+    handler.release.set()
+    follower.join(5)
+    drainer.join(5)
+    assert not follower.is_alive()
+    assert handler.batches == [[1], [2]]
+
+
+def test_debounce_merges_a_burst_into_one_batch():
+    queue = PerUserQueue()
+    handler = Recorder()
+    threads = [start(queue, "user", 1, handler, debounce=0.2, max_wait=1.0)]
+    time.sleep(0.05)
+    threads.append(start(queue, "user", 2, handler, debounce=0.2, max_wait=1.0))
+    for thread in threads:
+        thread.join(5)
+
+    assert handler.batches == [[1, 2]]
+
+
+def test_different_users_are_handled_in_parallel():
+    queue = PerUserQueue()
+    # Each handler only returns once both are running at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    handled = []
+
+    def handler(items):
+        barrier.wait()
+        handled.extend(items)
+
+    threads = [start(queue, "alice", "a", handler), start(queue, "bob", "b", handler)]
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(handled) == ["a", "b"]
+
+
+def test_handler_errors_reach_every_caller_in_the_batch():
+    queue = PerUserQueue()
+
+    def handler(items):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        queue.process("user", 1, handler)
+    # The key is released, so the next message gets a fresh drainer
+    handled = []
+    queue.process("user", 2, handled.extend)
+    assert handled == [2]
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from app.utils import tool_cache
+from app.utils.singleflight import SingleFlight
+from app.utils.tool_cache import ToolCache, cached_tool
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ToolCache(memory_size=64)
+    monkeypatch.setattr(tool_cache, "_cache", cache)
+    return cache
+
+
+def expire(cache):
+    """Move every entry past its ttl while keeping it within its stale window."""
+    now = time.time()
+    for key, (_, stale_until, value) in list(cache._memory.items()):
+        cache._memory[key] = (now - 1, stale_until, value)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_results_are_cached_by_normalized_arguments(cache):
+    calls = []
+
+    @cached_tool("test_weather", ttl=60, normalize=tool_cache.normalize_text_args)
+    def weather(city):
+        calls.append(city)
+        return {"city": city}
+
+    assert weather("Mombasa") == {"city": "Mombasa"}
+    assert weather("  mombasa ") == {"city": "Mombasa"}
+    assert calls == ["Mombasa"]
+
+
+def test_stale_result_is_served_while_one_refresh_runs(cache):
+    calls = []
+
+    @cached_tool("test_stale", ttl=60, max_stale=600)
+    def lookup(name):
+        calls.append(name)
+        return {"version": len(calls)}
+
+    assert lookup("x") == {"version": 1}
+    expire(cache)
+
+    # The stale value comes back at once and a background call replaces it
+    assert lookup("x") == {"version": 1}
+    wait_until(lambda: lookup("x") == {"version": 2})
+    assert len(calls) == 2
+
+
+def test_failed_refresh_keeps_the_stale_result(cache):
+    calls = []
+
+    @cached_tool("test_stale_error", ttl=60, max_stale=600)
+    def lookup(name):
+        calls.append(name)
+        return {"ok": True} if len(calls) == 1 else {"error": "upstream down"}
+
+    assert lookup("x") == {"ok": True}
+    expire(cache)
+    assert lookup("x") == {"ok": True}
+    wait_until(lambda: len(calls) == 2 and not cache._refreshing)
+    assert lookup("x") == {"ok": True}
+
+
+def test_errors_are_cached_until_the_negative_ttl(cache):
+    calls = []
+
+    @cached_tool("test_negative", ttl=60, negative_ttl=30)
+    def lookup(name):
+        calls.append(name)
+        return {"error": "not found"}
+
+    assert lookup("x") == {"error": "not found"}
+    assert lookup("x") == {"error": "not found"}
+    assert calls == ["x"]
+
+
+def test_cache_if_rejects_results(cache):
+    calls = []
+
+    @cached_tool("test_cache_if", ttl=60, cache_if=lambda result: result["final"])
+    def lookup(name):
+        calls.append(name)
+        return {"final": False}
+
+    lookup("x")
+    lookup("x")
+    assert calls == ["x", "x"]
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        assert release.wait(5)
+        return "value"
+
+    def caller():
+        results.append(flights.do("key", fetch))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flights.in_flight() == {"calls": 1, "waiters": 4})
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert sorted(results) == [("value", False)] + [("value", True)] * 4
+    assert flights.in_flight() == {"calls": 0, "waiters": 0}
+
+
+def test_single_flight_shares_errors_and_forgets_them():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: "value") == ("value", False)